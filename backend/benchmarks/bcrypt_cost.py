@@ -0,0 +1,52 @@
+"""
+bcrypt cost benchmark.
+Reports password verifications (logins) per second per core at each cost,
+to help pick BCRYPT_ROUNDS and PASSWORD_HASH_WORKERS.
+
+Usage:
+    python -m backend.benchmarks.bcrypt_cost
+    python -m backend.benchmarks.bcrypt_cost --rounds 10 11 12 13 --seconds 3
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+from backend.config import settings
+
+
+def verifications_per_second(rounds: int, seconds: float, workers: int = 1) -> float:
+    """Run verify() back to back on `workers` threads for ~`seconds`; return calls/sec."""
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+    hashed = context.hash("benchmark-password")
+
+    def run() -> int:
+        count = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            context.verify("benchmark-password", hashed)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(lambda _: run(), range(workers)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13, 14])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+
+    print(f"{'rounds':>6} {'ms/login':>9} {'logins/s/core':>14} {f'logins/s x{args.workers}':>15}")
+    for rounds in args.rounds:
+        per_core = verifications_per_second(rounds, args.seconds)
+        pooled = verifications_per_second(rounds, args.seconds, args.workers)
+        marker = "  <- BCRYPT_ROUNDS" if rounds == settings.BCRYPT_ROUNDS else ""
+        print(f"{rounds:>6} {1000 / per_core:>9.1f} {per_core:>14.1f} {pooled:>15.1f}{marker}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+JWT verification benchmark.
+Compares per-request auth overhead of a full jwt.decode against the
+verified-token cache in verify_access_token.
+
+Usage:
+    python -m backend.benchmarks.jwt_auth
+    python -m backend.benchmarks.jwt_auth --requests 50000
+"""
+import argparse
+import time
+from jose import jwt
+from backend.utils import jwt_handler
+from backend.utils.jwt_handler import create_access_token, verify_access_token
+
+
+def per_request_us(verify, token: str, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        verify(token)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token({"sub": "benchmark", "role": "user"})
+
+    def uncached(t):
+        return jwt.decode(t, jwt_handler.SECRET_KEY, algorithms=[jwt_handler.ALGORITHM])
+
+    jwt_handler._token_cache.clear()
+    uncached_us = per_request_us(uncached, token, args.requests)
+    cached_us = per_request_us(verify_access_token, token, args.requests)
+
+    print(f"{'mode':>9} {'us/request':>11}")
+    print(f"{'uncached':>9} {uncached_us:>11.2f}")
+    print(f"{'cached':>9} {cached_us:>11.2f}")
+    print(f"speedup: {uncached_us / cached_us:.1f}x  cache: {jwt_handler.token_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
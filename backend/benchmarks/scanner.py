@@ -0,0 +1,51 @@
+"""
+Market scanner benchmark.
+Times snapshot rebuilds and rule evaluation over a synthetic universe.
+
+Usage:
+    python -m backend.benchmarks.scanner
+    python -m backend.benchmarks.scanner --symbols 3000 --scans 1000
+"""
+import argparse
+import random
+import time
+from backend.services.scanner import SnapshotTable, scan
+
+
+def synthetic_quotes(symbols: int) -> dict:
+    quotes = {}
+    for i in range(symbols):
+        close = random.uniform(1, 500)
+        quotes[f"S{i:05d}"] = {
+            "symbol": f"S{i:05d}",
+            "last": close * random.uniform(0.9, 1.1),
+            "close": close,
+            "open": close * random.uniform(0.95, 1.05),
+            "volume": random.randint(0, 10_000_000),
+        }
+    return quotes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=3000)
+    parser.add_argument("--scans", type=int, default=1000)
+    args = parser.parse_args()
+
+    quotes = synthetic_quotes(args.symbols)
+    bounds = {"price": (5.0, None), "change_pct": (2.0, None), "volume": (500_000, None), "gap_pct": (None, None)}
+
+    start = time.perf_counter()
+    table = SnapshotTable.from_quotes(quotes)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(args.scans):
+        matches = scan(table, bounds)
+    scan_ms = (time.perf_counter() - start) * 1000 / args.scans
+
+    print(f"symbols={args.symbols} snapshot={build_ms:.2f}ms scan={scan_ms:.3f}ms matches={len(matches)}")
+
+
+if __name__ == "__main__":
+    main()
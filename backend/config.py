@@ -17,10 +17,24 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
 
+    # Database Connection Pools (API process / ARQ worker)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = True
+    WORKER_DB_POOL_SIZE: int = 5
+    WORKER_DB_MAX_OVERFLOW: int = 10
+
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    AUTH_CACHE_TTL_SECONDS: int = 60  # Max staleness of a cached user identity (changes outside the ORM, or Redis down)
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    JWT_CACHE_MAX_ENTRIES: int = 10000  # Verified tokens kept until their exp
+    BCRYPT_ROUNDS: int = 12  # Raising it rehashes existing passwords on their next login
+    PASSWORD_HASH_WORKERS: int = 4  # Threads for bcrypt hash/verify (~1 per core)
 
     # IBKR Connection Defaults
     IBKR_DEFAULT_HOST: str = "127.0.0.1"
@@ -28,9 +42,51 @@ class Settings(BaseSettings):
     IBKR_PAPER_PORT: int = 7497
     IBKR_LIVE_PORT: int = 7496
 
+    # Market Data
+    QUOTE_TIMEOUT_SECONDS: float = 3.0
+    QUOTE_BATCH_MAX_SYMBOLS: int = 100
+    MARKET_DATA_GRACE_SECONDS: float = 60.0  # Keep idle subscriptions this long
+    MARKET_DATA_MAX_LINES: int = 100  # IBKR market data line allowance
+    CONTRACT_CACHE_MAX_ENTRIES: int = 10000
+    CONTRACT_CACHE_TTL_SECONDS: int = 7 * 24 * 3600  # Re-qualify contracts weekly
+    CONTRACT_CACHE_NEGATIVE_TTL_SECONDS: int = 900  # Don't re-qualify contracts IBKR doesn't know for this long
+
+    # Market Scanner
+    SCANNER_UNIVERSE: str = ""  # Comma-separated symbols to keep streaming (at most MARKET_DATA_MAX_LINES); empty = scan every cached quote
+    SCANNER_REFRESH_SECONDS: float = 1.0  # Max age of the scanner's snapshot table
+
+    # Streaming Sync (IB events -> DB; the periodic full sync then only reconciles)
+    IBKR_STREAMING_ENABLED: bool = False
+    IBKR_STREAM_FLUSH_MS: int = 1000  # Coalesce events into one write per interval
+    IBKR_STREAM_PNL_SINGLE: bool = True  # Per-position reqPnLSingle (~1s marks) on top of account updates (~3 min)
+    IBKR_STREAM_MARK_VERSION_SECONDS: float = 60.0  # Max rate at which valuation-only flushes bump data_version
+    IBKR_STREAM_LEASE_SECONDS: int = 30  # Redis lease making one process the streamer of an account
+
+    # Trade Journal
+    LOT_MATCHING_METHOD: str = "fifo"  # fifo / lifo / specific (specific falls back to fifo without a selection)
+
+    # Analytics
+    ANALYTICS_CACHE_MAX_ENTRIES: int = 1000  # Users with cached analytics results
+    CONSOLIDATED_CACHE_MAX_ENTRIES: int = 1000  # Cached consolidated portfolio views (per user and breakdown flag)
+
+    # Live Portfolio Stream
+    PORTFOLIO_STREAM_FLUSH_MS: int = 250  # Coalesce changes into one frame per interval
+
     # Redis (for ARQ task queue)
     REDIS_URL: str = "redis://localhost:6379/0"
 
+    # Periodic Sync Scheduler (ARQ cron)
+    SYNC_INTERVAL_OPEN_SECONDS: int = 300  # US regular session
+    SYNC_INTERVAL_EXTENDED_SECONDS: int = 900  # Pre-market / after-hours
+    SYNC_INTERVAL_CLOSED_SECONDS: int = 4 * 3600  # Overnight and weekends
+    SYNC_GATEWAY_MAX_CONCURRENCY: int = 2  # Concurrent syncs per TWS/IB Gateway (host:port)
+    SYNC_GATEWAY_RETRY_SECONDS: float = 15.0  # Max backoff when a gateway is busy
+    SYNC_GATEWAY_MAX_DEFERRALS: int = 240  # Busy-gateway re-enqueues before a sync is dropped (~30 min)
+    SYNC_MAX_TRIES: int = 20
+    SYNC_PRIORITY_QUEUE: str = "arq:queue:priority"  # Lane for user-triggered syncs
+    SYNC_USE_PRIORITY_QUEUE: bool = True  # Route POST /sync through the ARQ priority lane (BackgroundTasks if Redis is down)
+    SYNC_COALESCE_TTL_SECONDS: int = 300  # Max lifetime of queued/running sync markers in Redis
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,2 @@
+# IB reports "no value" as DBL_MAX (opening fills have no realized PnL, unset marks)
+UNSET_PNL = 1e300
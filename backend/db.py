@@ -1,12 +1,35 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-import os
-import sys
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from functools import lru_cache
+from backend.config import settings
+from backend.utils.pool_metrics import PoolMetrics, timed_pool_class, register_engine
 import dotenv
 
 dotenv.load_dotenv()
-engine = create_engine(os.getenv("DATABASE_URL"))
+
+
+def pool_options(name: str, base_pool: type, pool_size: int, max_overflow: int) -> dict:
+    """create_engine kwargs for a sized, instrumented pool (SQLite keeps its default pool)."""
+    if settings.DATABASE_URL.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": timed_pool_class(base_pool, PoolMetrics(name)),
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    **pool_options("api", QueuePool, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+)
+register_engine("api", engine)
 Base = declarative_base()
 Session = sessionmaker(bind=engine,autocommit=False, autoflush=False)
 
@@ -17,3 +40,54 @@ def get_db():
     finally:
         db.close()
 
+
+# ============================================
+# Async engine (FastAPI routers)
+# Sync engine above stays for scripts, background sync and tests.
+# ============================================
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Swap a sync driver URL for its async equivalent (e.g. psycopg2 -> asyncpg)."""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+@lru_cache()
+def get_async_engine():
+    """Async engine, created on first use so scripts never need the async driver."""
+    async_engine = create_async_engine(
+        to_async_url(settings.DATABASE_URL),
+        **pool_options("api_async", AsyncAdaptedQueuePool, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+    )
+    register_engine("api_async", async_engine)
+    return async_engine
+
+
+@lru_cache()
+def get_async_sessionmaker() -> async_sessionmaker:
+    return async_sessionmaker(bind=get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+# ============================================
+# Worker engine (ARQ)
+# Separate pool so sync storms in the worker can't starve API traffic.
+# ============================================
+@lru_cache()
+def get_worker_sessionmaker() -> sessionmaker:
+    worker_engine = create_engine(
+        settings.DATABASE_URL,
+        **pool_options("worker", QueuePool, settings.WORKER_DB_POOL_SIZE, settings.WORKER_DB_MAX_OVERFLOW)
+    )
+    register_engine("worker", worker_engine)
+    return sessionmaker(bind=worker_engine, autocommit=False, autoflush=False)
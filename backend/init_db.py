@@ -7,7 +7,10 @@ from backend.models.portfolio import Portfolio
 from backend.models.positions_history import PositionHistory
 from backend.models.account_summary import AccountSummary
 from backend.models.trade import Trade
-# אם יש Journal וכו'—ייבא גם אותם
+from backend.models.contract import QualifiedContract
+from backend.models.daily_pnl import DailyPnL
+from backend.models.journal import Journal
+from backend.models.open_lot import OpenLot
 
 def init_db():
     Base.metadata.create_all(bind=engine)
@@ -1,10 +1,11 @@
 # main.py - FastAPI Setup with CORS
 
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.routers import auth, portfolio, scanner, journal, analytics  # Your auth router
-from backend.routers import broker
+from backend.routers import broker, internal
 
 
 
@@ -16,13 +17,21 @@ async def lifespan(app: FastAPI):
     """
     # Startup logic
     print("🚀 Application starting up...")
-    # TODO: Initialize connection managers, load cache, etc.
+    from backend.services.scanner import market_scanner
+    scanner_error = market_scanner.universe_error()
+    if scanner_error:
+        print(f"⚠️ {scanner_error}; /api/scanner answers 503 until SCANNER_UNIVERSE is reduced")
+    from backend.utils.auth_dependency import listen_for_invalidations
+    invalidations = asyncio.create_task(listen_for_invalidations())
 
     yield  # Application runs here
 
     # Shutdown logic
     print("🛑 Application shutting down...")
+    invalidations.cancel()
     from backend.services.ibkr_connection_manager import connection_manager
+    from backend.services.market_data_hub import market_data_hub
+    market_data_hub.close()
     await connection_manager.disconnect_all()
 
 
@@ -48,6 +57,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers (including Authorization)
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count-Estimate"],  # Conditional GET, trades pagination
 )
 
 # ============================================
@@ -56,9 +66,10 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(broker.router)
 app.include_router(portfolio.router)
-# app.include_router(journal.router, prefix="/api")
-# app.include_router(scanner.router, prefix="/api")
-# app.include_router(analytics.router, prefix="/api")
+app.include_router(internal.router)
+app.include_router(analytics.router)
+app.include_router(scanner.router)
+app.include_router(journal.router)
 
 # Health check endpoint
 @app.get("/health")
@@ -5,6 +5,9 @@ from .positions_history import PositionHistory
 from .trade import Trade
 from .account_summary import AccountSummary
 from .journal import Journal
+from .contract import QualifiedContract
+from .daily_pnl import DailyPnL
+from .open_lot import OpenLot
 
 __all__ = [
     "User",
@@ -13,5 +16,8 @@ __all__ = [
     "PositionHistory",
     "Trade",
     "AccountSummary",
-    "Journal"
+    "Journal",
+    "QualifiedContract",
+    "DailyPnL",
+    "OpenLot"
 ]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, UniqueConstraint, func
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Enum, ForeignKey, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from backend.db import Base
 import enum
@@ -25,6 +25,11 @@ class BrokerAccount(Base):
     status = Column(String, default="active")  # active/paused (אופציונלי)
     label = Column(String, nullable=True)      # תיאור ידידותי (אופציונלי)
 
+    # Bumped whenever synced data (positions, summary, trades) is written; ETag source
+    data_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # Bumped only when trades or their commission reports change; analytics cache key
+    trades_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+
     connected_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
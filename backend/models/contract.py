@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, func, UniqueConstraint
+from backend.db import Base
+
+class QualifiedContract(Base):
+    __tablename__ = "qualified_contracts"
+
+    id = Column(Integer, primary_key=True)
+
+    # מפתח החיפוש (כפי שהבקשה נשלחת ל־qualifyContracts)
+    symbol = Column(String, nullable=False)
+    sec_type = Column(String, nullable=False)
+    exchange = Column(String, nullable=False)
+    currency = Column(String, nullable=False)
+
+    # פרטי החוזה המלא שחזר מ־IBKR
+    con_id = Column(Integer, nullable=False)
+    primary_exchange = Column(String, nullable=True)
+    local_symbol = Column(String, nullable=True)
+    trading_class = Column(String, nullable=True)
+
+    qualified_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("symbol", "sec_type", "exchange", "currency", name="uq_contract_key"),
+    )
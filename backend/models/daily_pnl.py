@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, Date, DateTime, func, UniqueConstraint, Index
+from backend.db import Base
+
+class DailyPnL(Base):
+    """Per-account daily rollup of trades (trading day in New York time)."""
+    __tablename__ = "daily_pnl"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    broker_account_id = Column(Integer, ForeignKey("broker_accounts.id", ondelete="CASCADE"), nullable=False)
+
+    date = Column(Date, nullable=False)
+    realized_pnl = Column(Float, nullable=False, default=0.0)
+    trade_count = Column(Integer, nullable=False, default=0)
+    volume = Column(Float, nullable=False, default=0.0)  # Σ qty × price
+    fees = Column(Float, nullable=False, default=0.0)    # Σ commission
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "broker_account_id", "date", name="uq_daily_pnl_user_ba_date"),
+        Index("ix_daily_pnl_user_date", "user_id", "date"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, func, Index
 from sqlalchemy.orm import relationship
 from backend.db import Base
 
@@ -9,10 +9,21 @@ class Journal(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     symbol = Column(String, nullable=False)
     side = Column(String, nullable=False)  # BUY / SELL
-    qty = Column(Integer, nullable=False)
+    qty = Column(Float, nullable=False)
     entry = Column(Float, nullable=False)
     exit = Column(Float, nullable=True)
     profit = Column(Float, nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Round trips matched from ingested trades (lot_matching); NULL for manual entries
+    broker_account_id = Column(Integer, ForeignKey("broker_accounts.id", ondelete="CASCADE"), nullable=True)
+    entry_trade_id = Column(Integer, ForeignKey("trades.id", ondelete="SET NULL"), nullable=True)
+    exit_trade_id = Column(Integer, ForeignKey("trades.id", ondelete="SET NULL"), nullable=True)
+    entry_time = Column(DateTime(timezone=True), nullable=True)
+    exit_time = Column(DateTime(timezone=True), nullable=True)
+
     user = relationship("User", back_populates="journal")
+
+    __table_args__ = (
+        Index("ix_journal_user_exit_time", "user_id", "exit_time"),
+    )
@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
+from backend.db import Base
+
+class OpenLot(Base):
+    """Unmatched remainder of an opening fill (lot_matching state)."""
+    __tablename__ = "open_lots"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    broker_account_id = Column(Integer, ForeignKey("broker_accounts.id", ondelete="CASCADE"), nullable=False)
+    trade_id = Column(Integer, ForeignKey("trades.id", ondelete="CASCADE"), nullable=False)
+
+    symbol = Column(String, nullable=False)
+    con_id = Column(Integer, nullable=True)  # Lots are per contract; NULL for trades stored before con_id
+    side = Column(String, nullable=False)  # BUY = long lot, SELL = short lot
+    qty = Column(Float, nullable=False)    # Remaining (unmatched) quantity
+    price = Column(Float, nullable=False)
+    opened_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_open_lots_ba_symbol", "broker_account_id", "symbol", "opened_at"),
+    )
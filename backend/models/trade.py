@@ -14,10 +14,13 @@ class Trade(Base):
     order_id = Column(String, nullable=True)
 
     symbol = Column(String, nullable=False, index=True)
+    con_id = Column(Integer, nullable=True)     # IB contract id (options / futures / stock on one symbol differ)
+    multiplier = Column(Float, nullable=True)   # Contract multiplier (e.g. 100 for equity options); NULL = 1
     side = Column(String, nullable=False)       # BUY / SELL
     qty = Column(Float, nullable=False)
     price = Column(Float, nullable=False)
     realized_pnl = Column(Float, nullable=True)
+    commission = Column(Float, nullable=True)
     trade_time = Column(DateTime(timezone=True), nullable=False)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -29,4 +32,6 @@ class Trade(Base):
         # להבטיח אי-כפילות לפי מזהה ברוקר (תתאים לצורך שלך)
         UniqueConstraint("broker_account_id", "exec_id", name="uq_trade_ba_execid"),
         Index("ix_trade_user_ba_time", "user_id", "broker_account_id", "trade_time"),
+        # Keyset pagination across all of a user's accounts (trade_time, id)
+        Index("ix_trade_user_time_id", "user_id", "trade_time", "id"),
     )
@@ -0,0 +1,42 @@
+from datetime import date
+from typing import List, Optional
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.db import get_async_db
+from backend.schemas.analytics import AnalyticsResponse, DailyPnLRow
+from backend.utils.auth_dependency import get_current_identity, CurrentUser
+from backend.services.analytics import analytics_service
+from backend.services.daily_pnl import daily_pnl_query
+
+router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
+
+
+@router.get("/", response_model=AnalyticsResponse)
+async def get_analytics(
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Trading statistics over the user's closed trades (fills with realized PnL):
+    win rate, profit factor, expectancy, daily equity curve, max drawdown and
+    a per-symbol breakdown. Cached per user until new trades are ingested.
+    """
+    return await analytics_service.get(db, user.id)
+
+
+@router.get("/daily", response_model=List[DailyPnLRow])
+async def get_daily_pnl(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    broker_account_id: Optional[int] = None,
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Daily realized PnL, trade count, volume and fees with the cumulative
+    equity curve (calendar view). Trading days are New York dates.
+    Reads the daily_pnl rollup, which trade ingestion keeps current, so
+    the cost follows the number of days, not trades.
+    """
+    result = await db.execute(daily_pnl_query(user.id, start, end, broker_account_id))
+    return result.mappings().all()
@@ -1,31 +1,31 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from backend.db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.db import get_async_db
 from backend.models.user import User
 from backend.schemas.user import UserCreate, UserLogin, TokenResponse
-from backend.utils.security import hash_password, verify_password
+from backend.utils.security import hash_password_async, verify_and_update_password_async
 from backend.utils.jwt_handler import create_access_token
 
 router = APIRouter(prefix="/api/auth", tags=["Auth"])
 
 # --- Register ---
 @router.post("/register", response_model=TokenResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # לבדוק אם המשתמש כבר קיים
-    existing = db.query(User).filter(User.username == user.username).first()
-    if existing:
+    result = await db.execute(select(User.id).where(User.username == user.username))
+    if result.first():
         raise HTTPException(status_code=400, detail="Username already exists")
 
-    hashed = hash_password(user.password)
-    # print(hashed)
+    # bcrypt רץ על ה־pool הייעודי, לא על ה־event loop
+    hashed = await hash_password_async(user.password)
     new_user = User(
         username=user.username,
         password_hash=hashed,
         role=user.role
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
 
     token = create_access_token({"sub": new_user.username, "role": new_user.role})
     return TokenResponse(access_token=token)
@@ -33,13 +33,22 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
 
 # --- Login ---
 @router.post("/login", response_model=TokenResponse)
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(User).where(User.username == user.username))
+    db_user = result.scalars().first()
+    valid, new_hash = (False, None)
+    if db_user:
+        valid, new_hash = await verify_and_update_password_async(user.password, db_user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid username or password"
         )
 
+    # ה־hash נוצר בעלות ישנה (BCRYPT_ROUNDS השתנה) – שומרים hash חדש
+    if new_hash:
+        db_user.password_hash = new_hash
+        await db.commit()
+
     token = create_access_token({"sub": db_user.username, "role": db_user.role})
     return TokenResponse(access_token=token)
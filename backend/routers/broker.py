@@ -1,34 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from backend.db import get_db
-from backend.models.user import User
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.db import get_async_db
 from backend.models.broker_account import BrokerAccount
 from backend.schemas.broker_account import BrokerAccountCreate, BrokerAccountResponse
-from backend.utils.auth_dependency import get_current_user
+from backend.schemas.quote import BatchQuoteResponse
+from backend.utils.auth_dependency import get_current_identity, CurrentUser
 from backend.services.ibkr_connection_manager import connection_manager
-from backend.services.ibkr_sync import sync_broker_data
+from backend.services.ibkr_sync import sync_broker_data_coalesced
+from backend.services.sync_coalescer import sync_coalescer
+from backend.services.market_data_hub import market_data_hub, MarketDataCapacityError
+from backend.tasks.worker import enqueue_user_sync
+from backend.config import settings
 from datetime import datetime
 import asyncio
 
 router = APIRouter(prefix="/api/broker", tags=["Broker"])
 
 
+async def _get_user_broker_account(db: AsyncSession, user: CurrentUser, broker_account_id: int) -> BrokerAccount:
+    """Get broker account owned by user, or raise 404."""
+    result = await db.execute(select(BrokerAccount).filter_by(
+        id=broker_account_id,
+        user_id=user.id
+    ))
+    broker_account = result.scalars().first()
+
+    if not broker_account:
+        raise HTTPException(status_code=404, detail="Broker account not found")
+    return broker_account
+
+
 @router.post("/connect", response_model=BrokerAccountResponse)
 async def connect_broker(
         account: BrokerAccountCreate,
-        user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        user: CurrentUser = Depends(get_current_identity),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Connect to broker and save account.
     Tests connection before saving to DB.
     """
     # Check if already exists
-    existing = db.query(BrokerAccount).filter_by(
+    result = await db.execute(select(BrokerAccount).filter_by(
         user_id=user.id,
         broker=account.broker,
         account_code=account.account_code
-    ).first()
+    ))
+    existing = result.scalars().first()
 
     if existing:
         raise HTTPException(status_code=400, detail="Broker account already connected")
@@ -44,8 +64,8 @@ async def connect_broker(
         status="pending"
     )
     db.add(broker_account)
-    db.commit()
-    db.refresh(broker_account)
+    await db.commit()
+    await db.refresh(broker_account)
 
     # Test connection
     try:
@@ -54,17 +74,18 @@ async def connect_broker(
         # Update status
         broker_account.status = "active"
         broker_account.connected_at = datetime.utcnow()
-        db.commit()
-        db.refresh(broker_account)
+        await db.commit()
+        await db.refresh(broker_account)
 
         # 🔥 Trigger initial data sync in background
         print(f"🔄 Triggering initial sync for broker account {broker_account.id}")
-        asyncio.create_task(sync_broker_data(broker_account.id, user.id))
+        if await sync_coalescer.request(broker_account.id) == "scheduled":
+            asyncio.create_task(sync_broker_data_coalesced(broker_account.id, user.id))
 
         return broker_account
     except Exception as e:
         broker_account.status = "error"
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=500, detail=f"Connection failed: {str(e)}")
 
 
@@ -72,61 +93,69 @@ async def connect_broker(
 async def sync_broker_account(
         broker_account_id: int,
         background_tasks: BackgroundTasks,
-        user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        user: CurrentUser = Depends(get_current_identity),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Trigger sync for a broker account.
-    Runs in background task.
+    Runs on the ARQ priority lane (gateway-capped) when SYNC_USE_PRIORITY_QUEUE
+    is enabled, the default, and in a background task otherwise or when Redis
+    is unreachable. Requests are coalesced per account:
+    one made while a sync is queued merges into it, one made while a sync
+    is running makes it run once more when it finishes.
     """
-    broker_account = db.query(BrokerAccount).filter_by(
-        id=broker_account_id,
-        user_id=user.id
-    ).first()
-
-    if not broker_account:
-        raise HTTPException(status_code=404, detail="Broker account not found")
-
-    # Add background task
-    background_tasks.add_task(sync_broker_data, broker_account.id, user.id)
+    broker_account = await _get_user_broker_account(db, user, broker_account_id)
+
+    # A sync already queued for this account covers this request
+    if await sync_coalescer.request(broker_account.id) == "merged":
+        return {"status": "sync_already_queued", "broker_account_id": broker_account_id}
+
+    if settings.SYNC_USE_PRIORITY_QUEUE:
+        # Priority lane of the ARQ worker (ahead of periodic syncs, gateway-capped)
+        try:
+            job = await enqueue_user_sync(broker_account.id, user.id)
+            if job is None:
+                # ARQ already has this job: nothing new is queued under our marker
+                await sync_coalescer.cancel(broker_account.id)
+                return {"status": "sync_already_queued", "broker_account_id": broker_account_id}
+            return {"status": "sync_started", "broker_account_id": broker_account_id}
+        except (RedisConnectionError, OSError) as e:
+            print(f"⚠️ Sync queue unavailable ({e}); syncing in the API process")
+
+    # Add background task (reruns once after the current sync if one is in progress)
+    background_tasks.add_task(sync_broker_data_coalesced, broker_account.id, user.id)
 
     return {"status": "sync_started", "broker_account_id": broker_account_id}
 
 
 @router.get("/accounts", response_model=list[BrokerAccountResponse])
-def get_broker_accounts(
-        user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+async def get_broker_accounts(
+        user: CurrentUser = Depends(get_current_identity),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """Get all broker accounts for current user."""
-    accounts = db.query(BrokerAccount).filter_by(user_id=user.id).all()
-    return accounts
+    result = await db.execute(select(BrokerAccount).filter_by(user_id=user.id))
+    return result.scalars().all()
 
 
 @router.delete("/disconnect/{broker_account_id}")
 async def disconnect_broker(
         broker_account_id: int,
-        user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        user: CurrentUser = Depends(get_current_identity),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Disconnect and delete a broker account.
     Closes IBKR connection and deletes from database (cascades to related records).
     """
-    broker_account = db.query(BrokerAccount).filter_by(
-        id=broker_account_id,
-        user_id=user.id
-    ).first()
-
-    if not broker_account:
-        raise HTTPException(status_code=404, detail="Broker account not found")
+    broker_account = await _get_user_broker_account(db, user, broker_account_id)
 
     # Disconnect from IBKR
     await connection_manager.disconnect(broker_account_id)
 
-    # Delete from database (cascade deletes related records)
-    db.delete(broker_account)
-    db.commit()
+    # Delete from database (FK ON DELETE CASCADE removes related records)
+    await db.execute(delete(BrokerAccount).where(BrokerAccount.id == broker_account.id))
+    await db.commit()
 
     print(f"🗑️ Broker account {broker_account_id} deleted")
     return {
@@ -139,20 +168,14 @@ async def disconnect_broker(
 @router.get("/status/{broker_account_id}")
 async def get_connection_status(
         broker_account_id: int,
-        user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        user: CurrentUser = Depends(get_current_identity),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get connection status for a broker account.
     Returns both database status and live connection status.
     """
-    broker_account = db.query(BrokerAccount).filter_by(
-        id=broker_account_id,
-        user_id=user.id
-    ).first()
-
-    if not broker_account:
-        raise HTTPException(status_code=404, detail="Broker account not found")
+    broker_account = await _get_user_broker_account(db, user, broker_account_id)
 
     # Get connection status from manager
     status = connection_manager.get_connection_status(broker_account_id)
@@ -162,15 +185,88 @@ async def get_connection_status(
         "db_status": broker_account.status,
         "connection_exists": status["exists"],
         "connection_active": status["connected"],
+        "streaming": status["streaming"],
         "connected_at": broker_account.connected_at
     }
 
 
+async def _get_active_broker_account(db: AsyncSession, user: CurrentUser) -> BrokerAccount:
+    """Get user's first active broker account or raise 404."""
+    result = await db.execute(select(BrokerAccount).filter_by(
+        user_id=user.id,
+        status="active"
+    ))
+    broker_account = result.scalars().first()
+
+    if not broker_account:
+        raise HTTPException(
+            status_code=404,
+            detail="No active broker account found. Please connect to a broker first."
+        )
+    return broker_account
+
+
+def _parse_symbols(symbols: str) -> list[str]:
+    """Split a comma-separated symbol list, dropping blanks and duplicates."""
+    parsed = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not parsed:
+        raise HTTPException(status_code=400, detail="No symbols provided")
+    if len(parsed) > settings.QUOTE_BATCH_MAX_SYMBOLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many symbols (max {settings.QUOTE_BATCH_MAX_SYMBOLS})"
+        )
+    return parsed
+
+
+@router.get("/quotes", response_model=BatchQuoteResponse)
+async def get_quotes(
+        symbols: str = Query(..., description="Comma-separated symbols, e.g. AAPL,MSFT,NVDA"),
+        user: CurrentUser = Depends(get_current_identity),
+        db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get live market quotes for many symbols in one call.
+
+    Quotes are served from the shared market data hub: symbols already
+    streaming are a cache lookup, new ones are qualified and subscribed
+    together. The response is returned as soon as every quote is filled,
+    or at the batch deadline (QUOTE_TIMEOUT_SECONDS) with the unfilled
+    symbols listed in "missing".
+
+    Example:
+        GET /api/broker/quotes?symbols=AAPL,MSFT
+        Response: {
+            "quotes": {"AAPL": {"symbol": "AAPL", "last": 175.50, ...}},
+            "missing": ["MSFT"]
+        }
+    """
+    symbol_list = _parse_symbols(symbols)
+    broker_account = await _get_active_broker_account(db, user)
+
+    try:
+        ib = await connection_manager.get_or_create_connection(broker_account)
+        quotes = await market_data_hub.fetch_quotes(ib, symbol_list, settings.QUOTE_TIMEOUT_SECONDS)
+    except MarketDataCapacityError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error getting quotes for {symbol_list}: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get quotes: {str(e)}"
+        )
+
+    return {
+        "quotes": {symbol: quote for symbol, quote in quotes.items() if quote},
+        "missing": [symbol for symbol, quote in quotes.items() if not quote]
+    }
+
+
 @router.get("/quote/{symbol}")
 async def get_quote(
         symbol: str,
-        user: User = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        user: CurrentUser = Depends(get_current_identity),
+        db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get live market quote for a symbol from IBKR.
@@ -196,75 +292,41 @@ async def get_quote(
             "close": 175.00
         }
     """
-    # Get user's first active broker account
-    broker_account = db.query(BrokerAccount).filter_by(
-        user_id=user.id,
-        status="active"
-    ).first()
-
-    if not broker_account:
-        raise HTTPException(
-            status_code=404,
-            detail="No active broker account found. Please connect to a broker first."
-        )
+    # Same key as /quotes, so /quote/aapl and /quotes?symbols=AAPL share one hub line
+    symbol = symbol.strip().upper()
+    if not symbol:
+        raise HTTPException(status_code=400, detail="No symbols provided")
+    broker_account = await _get_active_broker_account(db, user)
 
     try:
         # Get IBKR connection
         ib = await connection_manager.get_or_create_connection(broker_account)
 
-        # Create contract for the symbol
-        from ib_async import Stock
-        contract = Stock(symbol, 'SMART', 'USD')
+        # Read through the shared subscription (cache hit if already streaming)
+        async with market_data_hub.subscribed(ib, [symbol]) as acquired:
+            if not acquired:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Symbol '{symbol}' not found or invalid"
+                )
+            await market_data_hub.wait_for(acquired, settings.QUOTE_TIMEOUT_SECONDS)
+            quote = market_data_hub.get_quote(symbol)
 
-        # Qualify the contract (get full contract details)
-        contracts = await ib.qualifyContractsAsync(contract)
-        if not contracts:
+        if not quote:
             raise HTTPException(
-                status_code=404,
-                detail=f"Symbol '{symbol}' not found or invalid"
+                status_code=503,
+                detail=f"No market data available for '{symbol}'. Market may be closed or symbol requires subscription."
             )
 
-        qualified_contract = contracts[0]
-
-        # Request market data
-        ticker = ib.reqMktData(qualified_contract, '', False, False)
-
-        # Wait for data to arrive (max 3 seconds)
-        await asyncio.sleep(3)
-
-        # Check if we got valid data
-        if ticker.last is None or ticker.last == 0:
-            # Try to get data from close price if last is not available
-            if ticker.close and ticker.close > 0:
-                last_price = ticker.close
-            else:
-                raise HTTPException(
-                    status_code=503,
-                    detail=f"No market data available for '{symbol}'. Market may be closed or symbol requires subscription."
-                )
-        else:
-            last_price = ticker.last
-
-        # Cancel market data subscription to avoid data fees
-        ib.cancelMktData(qualified_contract)
-
-        return {
-            "symbol": symbol,
-            "last": float(last_price) if last_price else None,
-            "bid": float(ticker.bid) if ticker.bid and ticker.bid > 0 else None,
-            "ask": float(ticker.ask) if ticker.ask and ticker.ask > 0 else None,
-            "volume": int(ticker.volume) if ticker.volume else None,
-            "high": float(ticker.high) if ticker.high and ticker.high > 0 else None,
-            "low": float(ticker.low) if ticker.low and ticker.low > 0 else None,
-            "close": float(ticker.close) if ticker.close and ticker.close > 0 else None,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        return quote
 
     except HTTPException:
         raise
+    except MarketDataCapacityError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"❌ Error getting quote for {symbol}: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to get quote for '{symbol}': {str(e)}"
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from backend.utils.auth_dependency import get_current_identity, identity_cache_stats, CurrentUser
+from backend.utils.jwt_handler import token_cache_stats
+from backend.utils.pool_metrics import pool_status
+
+router = APIRouter(prefix="/api/internal", tags=["Internal"])
+
+
+def require_admin(user: CurrentUser = Depends(get_current_identity)) -> CurrentUser:
+    """Allow only users with the admin role."""
+    if user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return user
+
+
+@router.get("/db-pools")
+async def get_db_pools(user: CurrentUser = Depends(require_admin)):
+    """
+    Connection pool metrics per engine (api, api_async, worker).
+
+    Example:
+        GET /api/internal/db-pools
+        Response: {
+            "api": {"pool_class": "TimedQueuePool", "size": 10, "checkedout": 3,
+                    "overflow": -7, "checkouts": 1520, "timeouts": 0,
+                    "wait_avg_ms": 0.041, "wait_max_ms": 12.5}
+        }
+    """
+    return pool_status()
+
+
+@router.get("/auth-cache")
+async def get_auth_cache(user: CurrentUser = Depends(require_admin)):
+    """
+    Hit/miss counters of the auth caches (verified tokens, user identities).
+
+    Example:
+        GET /api/internal/auth-cache
+        Response: {
+            "tokens": {"size": 42, "maxsize": 10000, "hits": 9120, "misses": 57, "hit_rate": 0.994},
+            "identities": {"size": 40, "maxsize": 10000, "hits": 9050, "misses": 70, "hit_rate": 0.992}
+        }
+    """
+    return {"tokens": token_cache_stats(), "identities": identity_cache_stats()}
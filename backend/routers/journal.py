@@ -0,0 +1,46 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.db import get_async_db
+from backend.models.journal import Journal
+from backend.schemas.journal import JournalCreate, JournalResponse
+from backend.utils.auth_dependency import get_current_identity, CurrentUser
+
+router = APIRouter(prefix="/api/journal", tags=["Journal"])
+
+
+@router.get("/", response_model=List[JournalResponse])
+async def list_journal(
+    symbol: Optional[str] = None,
+    broker_account_id: Optional[int] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Journal entries, newest first. Round trips are created automatically
+    when synced trades close open lots (see LOT_MATCHING_METHOD).
+    """
+    query = select(Journal).where(Journal.user_id == user.id)
+    if symbol:
+        query = query.where(Journal.symbol == symbol)
+    if broker_account_id is not None:
+        query = query.where(Journal.broker_account_id == broker_account_id)
+    query = query.order_by(Journal.exit_time.desc().nulls_last(), Journal.id.desc()).limit(limit)
+    result = await db.execute(query)
+    return result.scalars().all()
+
+
+@router.post("/", response_model=JournalResponse)
+async def create_journal_entry(
+    entry: JournalCreate,
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Add a manual journal entry."""
+    journal = Journal(user_id=user.id, **entry.model_dump())
+    db.add(journal)
+    await db.commit()
+    await db.refresh(journal)
+    return journal
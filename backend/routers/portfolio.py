@@ -1,115 +1,363 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from backend.db import get_db
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.db import get_async_db, get_async_sessionmaker
 from backend.models.user import User
 from backend.models.portfolio import Portfolio
-from backend.models.trade import Trade
 from backend.models.account_summary import AccountSummary
-from backend.schemas.portfolio import PortfolioResponse
+from backend.models.broker_account import BrokerAccount
+from backend.schemas.portfolio import (
+    PortfolioResponse, ConsolidatedPositionResponse, PositionSnapshotResponse, PositionHistoryResponse
+)
 from backend.schemas.trade import TradeResponse
 from backend.schemas.account_summary import AccountSummaryResponse
-from backend.utils.auth_dependency import get_current_user
-from typing import List
+from backend.utils.auth_dependency import get_current_identity, CurrentUser
+from backend.utils.jwt_handler import verify_access_token
+from backend.services.portfolio_stream import portfolio_stream, position_row, summary_row
+from backend.services.position_history import positions_at_query, history_buckets_query, HISTORY_FIELDS
+from backend.services.data_version import data_versions, make_etag, etag_matches
+from backend.services.consolidated import consolidated_portfolio
+from backend.services.trades import trades_filter, trades_page_query, estimate_count
+from backend.utils.cursor import encode_cursor, decode_cursor
+from datetime import datetime
+from typing import List, Optional
 
 router = APIRouter(prefix="/api/portfolio", tags=["Portfolio"])
 
 
-@router.get("/", response_model=List[PortfolioResponse])
-def get_portfolio(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def _verify_broker_account(db: AsyncSession, user: CurrentUser, broker_account_id: int) -> BrokerAccount:
+    """Verify broker account belongs to user, or raise 404."""
+    result = await db.execute(select(BrokerAccount).filter_by(
+        id=broker_account_id,
+        user_id=user.id
+    ))
+    broker_account = result.scalars().first()
+
+    if not broker_account:
+        raise HTTPException(status_code=404, detail="Broker account not found")
+    return broker_account
+
+
+async def _conditional_get(
+    request: Request,
+    response: Response,
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Conditional GET for portfolio reads.
+
+    The ETag is derived from the data versions of the accounts in scope
+    (bumped by every sync write) plus the request's path and query. A
+    matching If-None-Match is answered with 304 after that one lookup,
+    before the endpoint loads any rows.
+    """
+    scope = request.path_params.get("broker_account_id") or request.query_params.get("broker_account_id")
+    try:
+        broker_account_id = int(scope) if scope is not None else None
+    except ValueError:
+        broker_account_id = None  # The endpoint rejects it with 422
+
+    versions = await data_versions(db, user.id, broker_account_id)
+    request.state.data_versions = versions
+    etag = make_etag(f"{user.id}:{request.url.path}?{request.url.query}", versions)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+
+
+conditional_get = [Depends(_conditional_get)]
+
+
+@router.get("/", response_model=List[PortfolioResponse], dependencies=conditional_get)
+async def get_portfolio(
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get all portfolio positions for the authenticated user.
     Returns positions from all connected broker accounts.
     """
-    positions = db.query(Portfolio).filter_by(user_id=user.id).all()
-    return positions
+    result = await db.execute(select(Portfolio).filter_by(user_id=user.id))
+    return result.scalars().all()
+
+
+@router.get("/consolidated", response_model=List[ConsolidatedPositionResponse], dependencies=conditional_get)
+async def get_consolidated_portfolio(
+    request: Request,
+    breakdown: bool = False,
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the authenticated user's positions consolidated across all broker accounts.
 
+    One row per symbol, grouped in the database: total quantity, weighted
+    average cost, summed market value and PnL. With breakdown=true each row
+    also lists the per-account positions. Cached per user until the next
+    sync of any of their accounts.
+    """
+    return await consolidated_portfolio.get(db, user.id, breakdown, versions=request.state.data_versions)
 
-@router.get("/broker/{broker_account_id}", response_model=List[PortfolioResponse])
-def get_portfolio_by_broker(
+
+@router.get(
+    "/broker/{broker_account_id}",
+    response_model=List[PortfolioResponse], dependencies=conditional_get
+)
+async def get_portfolio_by_broker(
     broker_account_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get portfolio positions for a specific broker account.
     """
-    # Verify broker account belongs to user
-    from backend.models.broker_account import BrokerAccount
-    broker_account = db.query(BrokerAccount).filter_by(
-        id=broker_account_id,
-        user_id=user.id
-    ).first()
-
-    if not broker_account:
-        raise HTTPException(status_code=404, detail="Broker account not found")
+    await _verify_broker_account(db, user, broker_account_id)
 
-    positions = db.query(Portfolio).filter_by(
+    result = await db.execute(select(Portfolio).filter_by(
         user_id=user.id,
         broker_account_id=broker_account_id
-    ).all()
+    ))
+    return result.scalars().all()
 
-    return positions
 
-
-@router.get("/trades", response_model=List[TradeResponse])
-def get_trades(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 100
+@router.get("/trades", response_model=List[TradeResponse], dependencies=conditional_get)
+async def get_trades(
+    response: Response,
+    broker_account_id: Optional[int] = None,
+    symbol: Optional[str] = None,
+    side: Optional[str] = Query(None, pattern="^(BUY|SELL)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    include_total: bool = False,
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get recent trades for the authenticated user.
+    Get the authenticated user's trades, newest first (order=asc for oldest first).
+
+    Cursor-paginated on (trade_time, id): pass the X-Next-Cursor header of
+    a page as `cursor` to get the next one (absent on the last page). Every
+    page is an index range scan from the cursor, so deep pages cost the
+    same as the first. With include_total=true, X-Total-Count-Estimate
+    carries an approximate number of matching trades.
+
+    Example:
+        GET /api/portfolio/trades?symbol=AAPL&side=SELL&start=2024-01-01T00:00:00Z&limit=50
     """
-    trades = (
-        db.query(Trade)
-        .filter_by(user_id=user.id)
-        .order_by(Trade.trade_time.desc())
-        .limit(limit)
-        .all()
-    )
+    if broker_account_id is not None:
+        await _verify_broker_account(db, user, broker_account_id)
+
+    after = None
+    if cursor:
+        try:
+            trade_time, trade_id = decode_cursor(cursor, 2)
+            after = (datetime.fromisoformat(trade_time), int(trade_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    filters = trades_filter(user.id, broker_account_id, symbol.upper() if symbol else None, side, start, end)
+    result = await db.execute(trades_page_query(filters, after, descending=order == "desc", limit=limit))
+    trades = result.scalars().all()
+
+    if len(trades) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(trades[-1].trade_time, trades[-1].id)
+    if include_total:
+        response.headers["X-Total-Count-Estimate"] = str(await estimate_count(db, filters))
     return trades
 
 
-@router.get("/account-summary", response_model=List[AccountSummaryResponse])
-def get_account_summary(
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.get("/account-summary", response_model=List[AccountSummaryResponse], dependencies=conditional_get)
+async def get_account_summary(
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get account summary for all broker accounts.
     """
-    summaries = db.query(AccountSummary).filter_by(user_id=user.id).all()
-    return summaries
+    result = await db.execute(select(AccountSummary).filter_by(user_id=user.id))
+    return result.scalars().all()
 
 
-@router.get("/account-summary/{broker_account_id}", response_model=AccountSummaryResponse)
-def get_account_summary_by_broker(
+@router.get(
+    "/account-summary/{broker_account_id}",
+    response_model=AccountSummaryResponse, dependencies=conditional_get
+)
+async def get_account_summary_by_broker(
     broker_account_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get account summary for a specific broker account.
     """
-    # Verify broker account belongs to user
-    from backend.models.broker_account import BrokerAccount
-    broker_account = db.query(BrokerAccount).filter_by(
-        id=broker_account_id,
-        user_id=user.id
-    ).first()
+    await _verify_broker_account(db, user, broker_account_id)
 
-    if not broker_account:
-        raise HTTPException(status_code=404, detail="Broker account not found")
-
-    summary = db.query(AccountSummary).filter_by(
+    result = await db.execute(select(AccountSummary).filter_by(
         user_id=user.id,
         broker_account_id=broker_account_id
-    ).first()
+    ))
+    summary = result.scalars().first()
 
     if not summary:
         raise HTTPException(status_code=404, detail="Account summary not found")
 
     return summary
+
+
+@router.get("/positions-at", response_model=List[PositionSnapshotResponse], dependencies=conditional_get)
+async def get_positions_at(
+    at: datetime = Query(..., description="Point in time (ISO 8601), e.g. 2024-03-13T20:00:00Z"),
+    broker_account_id: Optional[int] = None,
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Rebuild the portfolio as it was at a point in time from position history.
+    """
+    if broker_account_id is not None:
+        await _verify_broker_account(db, user, broker_account_id)
+
+    result = await db.execute(positions_at_query(user.id, at, broker_account_id))
+    return result.mappings().all()
+
+
+@router.get("/history", response_model=PositionHistoryResponse, dependencies=conditional_get)
+async def get_position_history(
+    bucket: str = Query("1h", pattern="^(1m|1h|1d)$"),
+    symbol: Optional[str] = None,
+    broker_account_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Position history aggregated per time bucket (last value in each bucket).
+
+    The aggregation runs in SQL and the result is returned as columnar
+    arrays, so long ranges never materialize ORM objects. Only buckets in
+    which a position changed are present.
+
+    Example:
+        GET /api/portfolio/history?symbol=AAPL&bucket=1d&start=2024-01-01T00:00:00Z
+        Response: {
+            "bucket": "1d",
+            "columns": {"ts": [...], "broker_account_id": [...], "symbol": [...],
+                        "quantity": [...], "market_price": [...],
+                        "unrealized_pnl": [...], "realized_pnl": [...]},
+            "next_cursor": "WyIyMDI0LTAzLTEz..."
+        }
+    """
+    if broker_account_id is not None:
+        await _verify_broker_account(db, user, broker_account_id)
+
+    after = None
+    if cursor:
+        try:
+            ts, cursor_ba_id, cursor_symbol = decode_cursor(cursor, 3)
+            after = (datetime.fromisoformat(ts), int(cursor_ba_id), str(cursor_symbol))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    result = await db.execute(history_buckets_query(
+        user.id, bucket, start=start, end=end, symbol=symbol.upper() if symbol else None,
+        broker_account_id=broker_account_id, after=after, limit=limit
+    ))
+    rows = result.all()
+
+    columns = {f: list(values) for f, values in zip(HISTORY_FIELDS, zip(*rows))} if rows \
+        else {f: [] for f in HISTORY_FIELDS}
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.ts, last.broker_account_id, last.symbol)
+
+    return PositionHistoryResponse(bucket=bucket, columns=columns, next_cursor=next_cursor)
+
+
+async def _resolve_stream_user(username: str) -> Optional[int]:
+    """User id of a stream subscriber, or None if the user doesn't exist."""
+    async with get_async_sessionmaker()() as db:
+        result = await db.execute(select(User.id).where(User.username == username))
+        return result.scalar()
+
+
+async def _load_stream_snapshot(user_id: int) -> dict:
+    """Load the full portfolio snapshot for a stream subscriber."""
+    async with get_async_sessionmaker()() as db:
+        positions = (await db.execute(select(Portfolio).filter_by(user_id=user_id))).scalars().all()
+        summaries = (await db.execute(select(AccountSummary).filter_by(user_id=user_id))).scalars().all()
+        return {
+            "positions": [position_row(p) for p in positions],
+            "summaries": [summary_row(s) for s in summaries]
+        }
+
+
+async def _send_frames(websocket: WebSocket, user_id: int, queue: asyncio.Queue):
+    """Forward the subscriber's frames; a resync request is answered with a fresh snapshot."""
+    while True:
+        frame = await queue.get()
+        if frame["type"] == "resync":
+            snapshot = await _load_stream_snapshot(user_id)
+            portfolio_stream.set_snapshot(user_id, snapshot["positions"], snapshot["summaries"], replace=True)
+            frame = {"type": "snapshot", **snapshot}
+        await websocket.send_json(frame)
+
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    """Read (and ignore) client messages until the client goes away."""
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@router.websocket("/stream")
+async def stream_portfolio(websocket: WebSocket, token: str = Query(...)):
+    """
+    Live portfolio stream for the authenticated user.
+
+    Browsers can't set headers on WebSocket requests, so the JWT is passed
+    as ?token=. Sends one snapshot frame on connect, then diff frames with
+    only changed positions / summaries as syncs and ticks happen:
+
+        {"type": "snapshot", "positions": [...], "summaries": [...]}
+        {"type": "diff", "positions": [...], "removed_positions": [...], "summaries": [...]}
+
+    A slow client that falls behind gets a fresh snapshot instead of its backlog.
+    The socket is read alongside, so a client leaving a quiet account is
+    unsubscribed right away, not at the next frame.
+    """
+    payload = verify_access_token(token)
+    user_id = await _resolve_stream_user(payload["sub"]) if payload and payload.get("sub") else None
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    # Subscribe first, so changes published while the snapshot loads aren't lost
+    queue = await portfolio_stream.subscribe(user_id)
+    tasks = []
+    try:
+        snapshot = await _load_stream_snapshot(user_id)
+        portfolio_stream.set_snapshot(user_id, snapshot["positions"], snapshot["summaries"])
+        await websocket.send_json({"type": "snapshot", **snapshot})
+        tasks = [asyncio.create_task(_send_frames(websocket, user_id, queue)),
+                 asyncio.create_task(_wait_for_disconnect(websocket))]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                print(f"❌ Portfolio stream for user {user_id} failed: {error}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await portfolio_stream.unsubscribe(user_id, queue)
@@ -0,0 +1,71 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.db import get_async_db
+from backend.models.broker_account import BrokerAccount
+from backend.schemas.scanner import ScannerResponse
+from backend.utils.auth_dependency import get_current_identity, CurrentUser
+from backend.services.ibkr_connection_manager import connection_manager
+from backend.services.market_data_hub import MarketDataCapacityError
+from backend.services.scanner import market_scanner
+
+router = APIRouter(prefix="/api/scanner", tags=["Scanner"])
+
+
+async def _subscribe_universe(db: AsyncSession, user: CurrentUser):
+    """Start streaming universe symbols that aren't yet, on the user's active connection."""
+    if not market_scanner.missing():
+        return
+    result = await db.execute(select(BrokerAccount).filter_by(user_id=user.id, status="active"))
+    broker_account = result.scalars().first()
+    if not broker_account:
+        return  # Scan whatever is already streaming
+
+    try:
+        ib = await connection_manager.get_or_create_connection(broker_account)
+        await market_scanner.ensure_subscribed(ib)
+    except MarketDataCapacityError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/", response_model=List[ScannerResponse])
+async def run_scan(
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_change_pct: Optional[float] = None,
+    max_change_pct: Optional[float] = None,
+    min_volume: Optional[float] = None,
+    min_gap_pct: Optional[float] = None,
+    max_gap_pct: Optional[float] = None,
+    sort: str = Query("change_pct", pattern="^(price|change_pct|volume|gap_pct)$"),
+    ascending: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    user: CurrentUser = Depends(get_current_identity),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Scan the market universe with filter rules (all bounds inclusive).
+
+    Rules are evaluated over an in-memory snapshot of the shared market
+    data (refreshed every SCANNER_REFRESH_SECONDS), so a scan never calls
+    the gateway per symbol. Symbols without a quote, or without a value
+    for a filtered field, don't match.
+
+    Example:
+        GET /api/scanner/?min_price=5&min_change_pct=3&min_volume=1000000&sort=change_pct
+        Response: [{"symbol": "NVDA", "price": 912.4, "change_pct": 4.1, "volume": 51234567, "gap_pct": 1.2}]
+    """
+    if market_scanner.universe:
+        error = market_scanner.universe_error()
+        if error:
+            raise HTTPException(status_code=503, detail=error)
+        await _subscribe_universe(db, user)
+
+    bounds = {
+        "price": (min_price, max_price),
+        "change_pct": (min_change_pct, max_change_pct),
+        "volume": (min_volume, None),
+        "gap_pct": (min_gap_pct, max_gap_pct),
+    }
+    return market_scanner.scan(bounds, sort_by=sort, descending=not ascending, limit=limit)
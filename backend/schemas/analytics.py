@@ -1,13 +1,36 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import date
 
 class EquityPoint(BaseModel):
     date: date
     equity: float
 
+class SymbolStats(BaseModel):
+    symbol: str
+    trades: int
+    win_rate: float
+    total_pnl: float
+    profit_factor: Optional[float] = None  # None when the symbol has no losing trades
+
 class AnalyticsResponse(BaseModel):
     total_trades: int
     win_rate: float
     avg_profit: float
+    avg_win: float = 0.0
+    avg_loss: float = 0.0
+    gross_profit: float = 0.0
+    gross_loss: float = 0.0
+    profit_factor: Optional[float] = None  # None when there are no losing trades
+    expectancy: float = 0.0
+    max_drawdown: float = 0.0
     equity_curve: List[EquityPoint]
+    per_symbol: List[SymbolStats] = []
+
+class DailyPnLRow(BaseModel):
+    date: date
+    realized_pnl: float
+    trade_count: int
+    volume: float
+    fees: float
+    equity: float  # cumulative realized PnL up to and including the day
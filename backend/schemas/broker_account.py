@@ -23,6 +23,7 @@ class BrokerAccountResponse(BrokerAccountBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    data_version: int = 0
 
     class Config:
         orm_mode = True
@@ -4,7 +4,7 @@ from datetime import datetime
 class JournalBase(BaseModel):
     symbol: str
     side: str
-    qty: int
+    qty: float
     entry: float
     exit: float | None = None
     profit: float | None = None
@@ -15,6 +15,11 @@ class JournalCreate(JournalBase):
 class JournalResponse(JournalBase):
     id: int
     timestamp: datetime
+    broker_account_id: int | None = None  # Set on entries matched from trades
+    entry_trade_id: int | None = None
+    exit_trade_id: int | None = None
+    entry_time: datetime | None = None
+    exit_time: datetime | None = None
 
     class Config:
         orm_mode = True
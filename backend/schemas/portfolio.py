@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class PortfolioBase(BaseModel):
@@ -20,3 +20,51 @@ class PortfolioResponse(PortfolioBase):
 
     class Config:
         orm_mode = True
+
+
+class AccountPositionResponse(BaseModel):
+    """One broker account's share of a consolidated position."""
+    broker_account_id: int
+    quantity: float
+    avg_cost: float
+    current_price: Optional[float] = None
+    market_value: Optional[float] = None
+    unrealized_pnl: Optional[float] = None
+    realized_pnl: Optional[float] = None
+
+
+class ConsolidatedPositionResponse(BaseModel):
+    """A symbol's position summed across the user's broker accounts (avg_cost weighted by quantity)."""
+    symbol: str
+    quantity: float
+    avg_cost: Optional[float] = None  # None when the accounts net to flat
+    current_price: Optional[float] = None
+    market_value: Optional[float] = None
+    unrealized_pnl: Optional[float] = None
+    realized_pnl: Optional[float] = None
+    accounts: int
+    breakdown: Optional[List[AccountPositionResponse]] = None  # with ?breakdown=true
+
+
+class PositionSnapshotResponse(BaseModel):
+    """A position as of a point in time, rebuilt from position history."""
+    broker_account_id: int
+    symbol: str
+    quantity: float
+    market_price: Optional[float] = None
+    unrealized_pnl: Optional[float] = None
+    realized_pnl: Optional[float] = None
+    ts: datetime  # when this state was recorded
+
+    class Config:
+        orm_mode = True
+
+
+class PositionHistoryResponse(BaseModel):
+    """
+    Bucketed position history in columnar form: columns[field][i] is row i.
+    Fields: ts, broker_account_id, symbol, quantity, market_price, unrealized_pnl, realized_pnl.
+    """
+    bucket: str
+    columns: Dict[str, List[Any]]
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page
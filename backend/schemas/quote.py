@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+class QuoteResponse(BaseModel):
+    symbol: str
+    last: Optional[float] = None
+    bid: Optional[float] = None
+    ask: Optional[float] = None
+    volume: Optional[int] = None
+    high: Optional[float] = None
+    low: Optional[float] = None
+    close: Optional[float] = None
+    open: Optional[float] = None
+    timestamp: str
+
+class BatchQuoteResponse(BaseModel):
+    quotes: Dict[str, QuoteResponse]
+    missing: List[str]
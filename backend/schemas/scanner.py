@@ -1,7 +1,9 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class ScannerResponse(BaseModel):
     symbol: str
     price: float
-    change_pct: float
-    volume: int
+    change_pct: Optional[float] = None  # None without a previous close
+    volume: Optional[int] = None
+    gap_pct: Optional[float] = None  # Open vs previous close
@@ -8,6 +8,7 @@ class TradeBase(BaseModel):
     qty: float
     price: float
     realized_pnl: Optional[float]
+    commission: Optional[float] = None
     trade_time: datetime
 
 class TradeCreate(TradeBase):
@@ -0,0 +1,142 @@
+from typing import Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.config import settings
+from backend.constants import UNSET_PNL
+from backend.models.trade import Trade
+from backend.services.daily_pnl import daily_pnl_query
+from backend.services.data_version import trades_versions
+from backend.utils.cache import TTLCache
+
+
+def closed_trades_query(user_id: int):
+    """Symbol and realized PnL of the user's closing fills, oldest first."""
+    return (
+        select(Trade.symbol, Trade.realized_pnl)
+        .where(
+            Trade.user_id == user_id,
+            Trade.realized_pnl.is_not(None),
+            Trade.realized_pnl != 0,
+            func.abs(Trade.realized_pnl) < UNSET_PNL
+        )
+        .order_by(Trade.trade_time, Trade.id)
+    )
+
+
+def compute_analytics(symbols: np.ndarray, pnl: np.ndarray, daily: Sequence[Tuple] = ()) -> dict:
+    """
+    Trading statistics over closed trades, in vectorized NumPy passes.
+
+    Args:
+        symbols: symbol per trade, oldest first
+        pnl: realized PnL per trade
+        daily: (date, equity) rows of the daily_pnl rollup, ascending
+
+    Returns:
+        dict matching AnalyticsResponse
+    """
+    # The daily curve comes from the rollup (New York trading days, as the calendar view)
+    equity_curve = [{"date": d, "equity": float(e)} for d, e in daily]
+    n = len(pnl)
+    if n == 0:
+        return {
+            "total_trades": 0, "win_rate": 0.0, "avg_profit": 0.0, "avg_win": 0.0, "avg_loss": 0.0,
+            "gross_profit": 0.0, "gross_loss": 0.0, "profit_factor": None, "expectancy": 0.0,
+            "max_drawdown": 0.0, "equity_curve": equity_curve, "per_symbol": []
+        }
+
+    wins = pnl > 0
+    win_count = int(wins.sum())
+    gross_profit = float(pnl[wins].sum())
+    gross_loss = float(pnl[~wins].sum())
+    win_rate = win_count / n
+    avg_win = gross_profit / win_count if win_count else 0.0
+    avg_loss = gross_loss / (n - win_count) if n - win_count else 0.0
+
+    # Max drawdown from the running peak (starting from flat equity), trade by trade
+    equity = np.cumsum(pnl)
+    peaks = np.maximum.accumulate(np.maximum(equity, 0.0))
+    max_drawdown = float((peaks - equity).max())
+
+    # Per-symbol breakdown via one grouping pass
+    names, group = np.unique(symbols, return_inverse=True)
+    counts = np.bincount(group)
+    symbol_pnl = np.bincount(group, weights=pnl)
+    symbol_wins = np.bincount(group, weights=wins)
+    symbol_profit = np.bincount(group, weights=np.where(wins, pnl, 0.0))
+    symbol_loss = np.bincount(group, weights=np.where(wins, 0.0, pnl))
+
+    return {
+        "total_trades": n,
+        "win_rate": win_rate,
+        "avg_profit": float(pnl.mean()),
+        "avg_win": avg_win,
+        "avg_loss": avg_loss,
+        "gross_profit": gross_profit,
+        "gross_loss": gross_loss,
+        "profit_factor": gross_profit / -gross_loss if gross_loss else None,
+        "expectancy": win_rate * avg_win + (1 - win_rate) * avg_loss,
+        "max_drawdown": max_drawdown,
+        "equity_curve": equity_curve,
+        "per_symbol": [
+            {
+                "symbol": str(names[i]),
+                "trades": int(counts[i]),
+                "win_rate": float(symbol_wins[i] / counts[i]),
+                "total_pnl": float(symbol_pnl[i]),
+                "profit_factor": float(symbol_profit[i] / -symbol_loss[i]) if symbol_loss[i] else None,
+            }
+            for i in np.argsort(-symbol_pnl)
+        ]
+    }
+
+
+def to_arrays(rows: Sequence[Tuple]) -> Tuple[np.ndarray, np.ndarray]:
+    """Column-wise NumPy arrays from (symbol, realized_pnl) rows."""
+    if not rows:
+        return np.array([], dtype=object), np.array([], dtype=float)
+    symbols, pnl = zip(*rows)
+    return (
+        np.array(symbols, dtype=object),
+        np.fromiter(pnl, dtype=float, count=len(pnl))
+    )
+
+
+class AnalyticsService:
+    """
+    Per-user trading analytics with a result cache.
+
+    Entries are keyed on the user's account trades versions, which only
+    writes that insert trades or change their commission reports (full
+    sync or stream flush, from any process) bump; position and mark
+    updates leave them alone. Checking a cached result costs one lookup on
+    broker_accounts instead of a scan of the user's trades. invalidate()
+    also drops an entry immediately in the writing process.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self._cache = TTLCache(maxsize=maxsize)
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    async def get(self, db: AsyncSession, user_id: int) -> dict:
+        fingerprint = tuple(await trades_versions(db, user_id))
+
+        cached: Optional[tuple] = self._cache.get(user_id)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        rows = (await db.execute(closed_trades_query(user_id))).all()
+        daily = (await db.execute(daily_pnl_query(user_id))).mappings().all()
+        result = compute_analytics(*to_arrays(rows), [(d["date"], d["equity"]) for d in daily])
+        self._cache.set(user_id, (fingerprint, result))
+        return result
+
+
+# Global singleton
+analytics_service = AnalyticsService(maxsize=settings.ANALYTICS_CACHE_MAX_ENTRIES)
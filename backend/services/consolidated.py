@@ -0,0 +1,94 @@
+from collections import defaultdict
+from typing import List, Optional
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.config import settings
+from backend.models.portfolio import Portfolio
+from backend.services.data_version import data_versions
+from backend.utils.cache import TTLCache
+
+BREAKDOWN_FIELDS = ("broker_account_id", "quantity", "avg_cost", "current_price",
+                    "market_value", "unrealized_pnl", "realized_pnl")
+
+
+def consolidated_query(user_id: int):
+    """
+    SELECT the user's positions grouped by symbol across broker accounts.
+
+    Quantities and PnL are summed; avg_cost is weighted by quantity (NULL
+    when the accounts net to flat). SUM skips NULLs, so a mark missing on
+    one account doesn't blank the total.
+    """
+    quantity = func.sum(Portfolio.quantity)
+    return (
+        select(
+            Portfolio.symbol,
+            quantity.label("quantity"),
+            (func.sum(Portfolio.quantity * Portfolio.avg_cost) / func.nullif(quantity, 0)).label("avg_cost"),
+            func.max(Portfolio.current_price).label("current_price"),
+            func.sum(Portfolio.market_value).label("market_value"),
+            func.sum(Portfolio.unrealized_pnl).label("unrealized_pnl"),
+            func.sum(Portfolio.realized_pnl).label("realized_pnl"),
+            func.count(Portfolio.broker_account_id).label("accounts")
+        )
+        .where(Portfolio.user_id == user_id)
+        .group_by(Portfolio.symbol)
+        .order_by(Portfolio.symbol)
+    )
+
+
+def breakdown_query(user_id: int):
+    """Per-account rows behind consolidated_query, as plain column tuples."""
+    return (
+        select(Portfolio.symbol, *[getattr(Portfolio, f) for f in BREAKDOWN_FIELDS])
+        .where(Portfolio.user_id == user_id)
+        .order_by(Portfolio.symbol, Portfolio.broker_account_id)
+    )
+
+
+class ConsolidatedPortfolioService:
+    """
+    Per-user consolidated (cross-account) positions with a result cache.
+
+    Entries are keyed on the user's account data versions, which every
+    full sync and stream flush bumps, so a cached result is served until
+    the next sync of any of the user's accounts, from any process. Checking
+    it costs one lookup on broker_accounts.
+    """
+
+    def __init__(self, maxsize: int = 1000):
+        self._cache = TTLCache(maxsize=maxsize)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    async def get(self, db: AsyncSession, user_id: int, breakdown: bool = False,
+                  versions: Optional[list] = None) -> List[dict]:
+        """
+        Args:
+            breakdown: include each symbol's per-account rows
+            versions: data_versions() of the user, if the caller already has them
+        """
+        if versions is None:
+            versions = await data_versions(db, user_id)
+        fingerprint = tuple(versions)
+
+        key = (user_id, breakdown)
+        cached: Optional[tuple] = self._cache.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        rows = [dict(r) for r in (await db.execute(consolidated_query(user_id))).mappings().all()]
+        if breakdown:
+            per_symbol = defaultdict(list)
+            for row in (await db.execute(breakdown_query(user_id))).mappings().all():
+                per_symbol[row["symbol"]].append({f: row[f] for f in BREAKDOWN_FIELDS})
+            for row in rows:
+                row["breakdown"] = per_symbol[row["symbol"]]
+
+        self._cache.set(key, (fingerprint, rows))
+        return rows
+
+
+# Global singleton
+consolidated_portfolio = ConsolidatedPortfolioService(maxsize=settings.CONSOLIDATED_CACHE_MAX_ENTRIES)
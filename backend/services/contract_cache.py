@@ -0,0 +1,213 @@
+import asyncio
+import copy
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from ib_async import IB, Contract
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from backend.config import settings
+from backend.db import Session as SessionLocal
+from backend.models.contract import QualifiedContract
+from backend.utils.cache import TTLCache
+
+# (symbol, secType, exchange, currency)
+ContractKey = Tuple[str, str, str, str]
+
+
+def contract_key(symbol: str, sec_type: str = "STK", exchange: str = "SMART", currency: str = "USD") -> ContractKey:
+    return (symbol.upper(), sec_type, exchange, currency)
+
+
+def _key_from_contract(contract: Contract) -> ContractKey:
+    """Cache key for an already-qualified contract (stocks are keyed on SMART routing)."""
+    exchange = "SMART" if contract.secType == "STK" else (contract.exchange or contract.primaryExchange)
+    return contract_key(contract.symbol, contract.secType, exchange, contract.currency)
+
+
+def _contract_from_row(row: QualifiedContract) -> Contract:
+    return Contract(
+        secType=row.sec_type,
+        conId=row.con_id,
+        symbol=row.symbol,
+        exchange=row.exchange,
+        primaryExchange=row.primary_exchange or "",
+        currency=row.currency,
+        localSymbol=row.local_symbol or "",
+        tradingClass=row.trading_class or ""
+    )
+
+
+def _row_values(key: ContractKey, contract: Contract) -> dict:
+    symbol, sec_type, exchange, currency = key
+    return {
+        "symbol": symbol,
+        "sec_type": sec_type,
+        "exchange": exchange,
+        "currency": currency,
+        "con_id": contract.conId,
+        "primary_exchange": contract.primaryExchange or None,
+        "local_symbol": contract.localSymbol or None,
+        "trading_class": contract.tradingClass or None,
+        "qualified_at": datetime.now(timezone.utc)
+    }
+
+
+class ContractCache:
+    """
+    Two-tier cache for qualified IBKR contracts.
+
+    Lookups go to an in-memory LRU first, then to the qualified_contracts
+    table (so restarts are warm), and only the remaining misses are sent
+    to the gateway in one qualifyContractsAsync batch. Entries older than
+    the TTL are re-qualified. Keys IBKR can't qualify are remembered in
+    memory for negative_ttl, so unknown symbols (e.g. a typo in the scanner
+    universe) don't cost a gateway round trip on every lookup.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400, negative_ttl: float = 900,
+                 session_factory=SessionLocal):
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._unknown = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._session_factory = session_factory
+
+    def get(self, key: ContractKey) -> Optional[Contract]:
+        """In-memory lookup only."""
+        return self._memory.get(key)
+
+    def is_unknown(self, key: ContractKey) -> bool:
+        """Whether IBKR failed to qualify the key within the negative TTL."""
+        return key in self._unknown
+
+    async def resolve(self, ib: IB, keys: List[ContractKey]) -> Dict[ContractKey, Optional[Contract]]:
+        """
+        Resolve keys to qualified contracts.
+
+        Returns:
+            dict: key -> Contract, or None if IBKR does not know the contract
+        """
+        result: Dict[ContractKey, Optional[Contract]] = {}
+        misses = []
+        for key in dict.fromkeys(keys):
+            contract = self._memory.get(key)
+            if contract is not None:
+                result[key] = contract
+            elif key in self._unknown:
+                result[key] = None
+            else:
+                misses.append(key)
+
+        if misses:
+            stored = await asyncio.to_thread(self._load, misses)
+            for key, (contract, expires_at) in stored.items():
+                self._memory.set(key, contract, expires_at=expires_at)
+                result[key] = contract
+            misses = [key for key in misses if key not in stored]
+
+        if misses:
+            requested = [
+                Contract(symbol=symbol, secType=sec_type, exchange=exchange, currency=currency)
+                for symbol, sec_type, exchange, currency in misses
+            ]
+            qualified = await ib.qualifyContractsAsync(*requested)
+            fresh = {}
+            for key, contract in zip(misses, qualified):
+                if isinstance(contract, Contract) and contract.conId:
+                    fresh[key] = contract
+                    self._memory.set(key, contract)
+                else:
+                    self._unknown.set(key, True)
+                result[key] = fresh.get(key)
+            if fresh:
+                await asyncio.to_thread(self._store, fresh)
+
+        return result
+
+    def prime(self, db: Session, contracts: Iterable[Contract]):
+        """
+        Fill the cache from contracts IBKR already returned qualified
+        (e.g. position contracts). Writes go through the caller's session
+        and are committed with it.
+        """
+        fresh = {}
+        for contract in contracts:
+            if contract.conId:
+                key = _key_from_contract(contract)
+                if contract.exchange != key[2]:
+                    # Position contracts often come with no exchange; reqMktData needs
+                    # the routing of the key (SMART for stocks), primaryExchange is kept
+                    contract = copy.copy(contract)
+                    contract.exchange = key[2]
+                fresh[key] = contract
+                self._memory.set(key, contract)
+                self._unknown.pop(key)
+        if fresh:
+            self._upsert(db, fresh)
+
+    def stats(self) -> dict:
+        return {**self._memory.stats(), "unknown": len(self._unknown)}
+
+    # ------------------------------------------------------------------
+    # Postgres tier
+    # ------------------------------------------------------------------
+    def _load(self, keys: List[ContractKey]) -> Dict[ContractKey, Tuple[Contract, float]]:
+        """Fresh rows for keys, with the epoch time each one goes stale."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        db = self._session_factory()
+        try:
+            rows = db.query(QualifiedContract).filter(
+                tuple_(
+                    QualifiedContract.symbol,
+                    QualifiedContract.sec_type,
+                    QualifiedContract.exchange,
+                    QualifiedContract.currency
+                ).in_(keys),
+                QualifiedContract.qualified_at > cutoff
+            ).all()
+            return {
+                (r.symbol, r.sec_type, r.exchange, r.currency):
+                    (_contract_from_row(r), r.qualified_at.timestamp() + self.ttl)
+                for r in rows
+            }
+        except Exception as e:
+            print(f"⚠️ Failed to load qualified contracts: {e}")
+            return {}
+        finally:
+            db.close()
+
+    def _store(self, contracts: Dict[ContractKey, Contract]):
+        db = self._session_factory()
+        try:
+            self._upsert(db, contracts)
+            db.commit()
+        except Exception as e:
+            print(f"⚠️ Failed to persist qualified contracts: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _upsert(db: Session, contracts: Dict[ContractKey, Contract]):
+        stmt = pg_insert(QualifiedContract).values(
+            [_row_values(key, contract) for key, contract in contracts.items()]
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_contract_key",
+            set_={
+                "con_id": stmt.excluded.con_id,
+                "primary_exchange": stmt.excluded.primary_exchange,
+                "local_symbol": stmt.excluded.local_symbol,
+                "trading_class": stmt.excluded.trading_class,
+                "qualified_at": stmt.excluded.qualified_at
+            }
+        )
+        db.execute(stmt)
+
+
+# Global singleton
+contract_cache = ContractCache(
+    maxsize=settings.CONTRACT_CACHE_MAX_ENTRIES,
+    ttl=settings.CONTRACT_CACHE_TTL_SECONDS,
+    negative_ttl=settings.CONTRACT_CACHE_NEGATIVE_TTL_SECONDS
+)
@@ -0,0 +1,145 @@
+from datetime import date, datetime, timezone
+from typing import Iterable, Optional, Set
+from zoneinfo import ZoneInfo
+from sqlalchemy import select, func, case, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from backend.models.daily_pnl import DailyPnL
+from backend.models.trade import Trade
+from backend.constants import UNSET_PNL
+
+# Trading days follow the US market calendar
+ROLLUP_TZ = "America/New_York"
+_rollup_zone = ZoneInfo(ROLLUP_TZ)
+
+ROLLUP_COLUMNS = ("realized_pnl", "trade_count", "volume", "fees")
+
+
+def trading_day(ts: datetime) -> date:
+    """Rollup date of a trade time (naive times are UTC, as stored by timestamptz)."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(_rollup_zone).date()
+
+
+def trade_dates(trades: Iterable[dict]) -> Set[date]:
+    """Rollup dates touched by a batch of Trade rows."""
+    return {trading_day(t["trade_time"]) for t in trades}
+
+
+def _day_expr():
+    return func.date(func.timezone(ROLLUP_TZ, Trade.trade_time))
+
+
+def daily_rollup_query(filters: list):
+    """SELECT (user, account, date, realized PnL, trade count, volume, fees) grouped from trades."""
+    day = _day_expr()
+    # Opening fills carry no realized PnL (NULL or IB's DBL_MAX sentinel)
+    pnl = case(
+        (and_(Trade.realized_pnl.is_not(None), func.abs(Trade.realized_pnl) < UNSET_PNL), Trade.realized_pnl),
+        else_=0.0
+    )
+    return (
+        select(
+            Trade.user_id,
+            Trade.broker_account_id,
+            day.label("date"),
+            func.sum(pnl).label("realized_pnl"),
+            func.count(Trade.id).label("trade_count"),
+            func.sum(func.abs(Trade.qty) * Trade.price).label("volume"),
+            func.sum(func.coalesce(Trade.commission, 0.0)).label("fees"),
+        )
+        .where(*filters)
+        .group_by(Trade.user_id, Trade.broker_account_id, day)
+    )
+
+
+def _upsert_rollup(db: Session, rollup) -> int:
+    stmt = pg_insert(DailyPnL).from_select(
+        ["user_id", "broker_account_id", "date", *ROLLUP_COLUMNS], rollup
+    )
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_daily_pnl_user_ba_date",
+        set_={**{c: stmt.excluded[c] for c in ROLLUP_COLUMNS}, "updated_at": func.now()}
+    )
+    return db.execute(stmt).rowcount
+
+
+def refresh_daily_pnl(db: Session, user_id: int, broker_account_id: int, dates: Iterable[date]) -> int:
+    """
+    Recompute the rollup rows of one account for the given dates.
+
+    Only the touched days are re-aggregated (one INSERT ... SELECT ...
+    ON CONFLICT DO UPDATE over a (user_id, broker_account_id, trade_time)
+    range of ix_trade_user_ba_time), so the cost follows the ingested
+    batch, not the account's history. Trades are
+    never deleted, so every touched day has a row to upsert. Caller commits.
+
+    Returns:
+        int: number of rollup rows written
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return 0
+    day = _day_expr()
+    return _upsert_rollup(db, daily_rollup_query([
+        Trade.user_id == user_id,
+        Trade.broker_account_id == broker_account_id,
+        # Coarse range first (index-friendly), then the exact days
+        Trade.trade_time >= datetime.combine(dates[0], datetime.min.time(), _rollup_zone),
+        day.in_(dates),
+    ]))
+
+
+def refresh_daily_pnl_for_execs(db: Session, user_id: int, broker_account_id: int, exec_ids: Iterable[str]) -> int:
+    """Refresh the days of already stored trades (late commission reports). Caller commits."""
+    exec_ids = list(exec_ids)
+    if not exec_ids:
+        return 0
+    times = db.execute(
+        select(Trade.trade_time).where(Trade.broker_account_id == broker_account_id, Trade.exec_id.in_(exec_ids))
+    ).scalars().all()
+    return refresh_daily_pnl(db, user_id, broker_account_id, {trading_day(t) for t in times})
+
+
+def backfill_daily_pnl(db: Session, broker_account_id: Optional[int] = None) -> int:
+    """Rebuild the rollup from all trades (one account, or every account). Caller commits."""
+    filters = [] if broker_account_id is None else [Trade.broker_account_id == broker_account_id]
+    return _upsert_rollup(db, daily_rollup_query(filters))
+
+
+def daily_pnl_query(user_id: int, start: Optional[date] = None, end: Optional[date] = None,
+                    broker_account_id: Optional[int] = None):
+    """
+    SELECT the user's daily rows (summed across accounts unless one is given)
+    with the cumulative equity (running realized PnL) per day. Works with
+    both sync and async sessions.
+    """
+    filters = [DailyPnL.user_id == user_id]
+    if broker_account_id is not None:
+        filters.append(DailyPnL.broker_account_id == broker_account_id)
+
+    per_day = (
+        select(
+            DailyPnL.date,
+            func.sum(DailyPnL.realized_pnl).label("realized_pnl"),
+            func.sum(DailyPnL.trade_count).label("trade_count"),
+            func.sum(DailyPnL.volume).label("volume"),
+            func.sum(DailyPnL.fees).label("fees"),
+        )
+        .where(*filters)
+        .group_by(DailyPnL.date)
+        .subquery()
+    )
+    # Equity accumulates from the first day, so it's computed before the range filter
+    with_equity = select(
+        per_day,
+        func.sum(per_day.c.realized_pnl).over(order_by=per_day.c.date).label("equity")
+    ).subquery()
+
+    query = select(with_equity)
+    if start is not None:
+        query = query.where(with_equity.c.date >= start)
+    if end is not None:
+        query = query.where(with_equity.c.date <= end)
+    return query.order_by(with_equity.c.date)
@@ -0,0 +1,41 @@
+import hashlib
+from typing import List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.models.broker_account import BrokerAccount
+
+
+async def data_versions(db: AsyncSession, user_id: int,
+                        broker_account_id: Optional[int] = None) -> List[Tuple[int, int]]:
+    """(broker_account_id, data_version) of the user's accounts: one indexed lookup, no data rows."""
+    query = select(BrokerAccount.id, BrokerAccount.data_version).where(BrokerAccount.user_id == user_id)
+    if broker_account_id is not None:
+        query = query.where(BrokerAccount.id == broker_account_id)
+    result = await db.execute(query.order_by(BrokerAccount.id))
+    return [tuple(row) for row in result.all()]
+
+
+async def trades_versions(db: AsyncSession, user_id: int) -> List[Tuple[int, int]]:
+    """(broker_account_id, trades_version) of the user's accounts: unlike data_version, marks and positions don't move it."""
+    query = select(BrokerAccount.id, BrokerAccount.trades_version).where(BrokerAccount.user_id == user_id)
+    result = await db.execute(query.order_by(BrokerAccount.id))
+    return [tuple(row) for row in result.all()]
+
+
+def make_etag(representation: str, versions: List[Tuple[int, int]]) -> str:
+    """
+    Strong ETag for a response built from the given account versions.
+
+    `representation` identifies what was asked for (path and query), so
+    different filters over the same data get different tags.
+    """
+    raw = representation + "|" + ",".join(f"{ba_id}:{version}" for ba_id, version in versions)
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers the ETag (weak comparison, per RFC 9110)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
@@ -1,13 +1,31 @@
 import asyncio
-from typing import Dict, Optional
+import uuid
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
 from ib_async import IB
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError, LockError
+from backend.config import settings
 from backend.models.broker_account import BrokerAccount
 
+if TYPE_CHECKING:
+    from backend.services.ibkr_stream import AccountStream
+
+# Redis lock held by the one process streaming an account
+STREAM_LEASE_KEY = "stream:owner:{}"
+
 
 class IBKRConnectionManager:
     def __init__(self):
         self._connections: Dict[int, IB] = {}  # broker_account_id -> IB instance
         self._locks: Dict[int, asyncio.Lock] = {}
+        self._streams: Dict[int, "AccountStream"] = {}  # broker_account_id -> streaming sync
+        self._leases: Dict[int, Tuple[object, asyncio.Task]] = {}  # broker_account_id -> (stream lock, renewal task)
+        self._redis: Optional[aioredis.Redis] = None
+
+    def _client(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.Redis.from_url(settings.REDIS_URL)
+        return self._redis
 
     async def get_or_create_connection(self, broker_account: BrokerAccount) -> IB:
         """Get existing connection or create new one."""
@@ -28,6 +46,8 @@ class IBKRConnectionManager:
                         broker_account.conn_port or 7497,
                         broker_account.client_id or ba_id
                     )
+                    if ba_id in self._streams:
+                        await self._streams[ba_id].subscribe()
                     return ib
 
             # Create new connection
@@ -40,8 +60,101 @@ class IBKRConnectionManager:
             self._connections[ba_id] = ib
             return ib
 
+    async def start_streaming(self, broker_account: BrokerAccount, session_factory=None):
+        """
+        Keep the account's Portfolio / Trade / AccountSummary rows updated from
+        IB streaming events (see AccountStream). No-op if already streaming.
+
+        Syncs run in the API and in ARQ workers, so an account's stream is
+        owned through a Redis lease: only the process holding it streams, and
+        it renews the lease while streaming. If Redis is unreachable, the
+        stream starts without one.
+        """
+        # Imported here: ibkr_stream -> ibkr_sync -> this module
+        from backend.services.ibkr_stream import AccountStream
+
+        ba_id = broker_account.id
+        if ba_id in self._streams:
+            return
+        lock = await self._acquire_stream_lease(ba_id)
+        if lock is False:
+            return  # Another process streams this account
+        if lock is not None:
+            self._leases[ba_id] = (lock, asyncio.create_task(self._renew_stream_lease(ba_id, lock)))
+
+        try:
+            ib = await self.get_or_create_connection(broker_account)
+        except Exception:
+            await self._release_stream_lease(ba_id)
+            raise
+        stream = AccountStream(
+            ib, ba_id, broker_account.user_id, broker_account.account_code,
+            flush_interval=settings.IBKR_STREAM_FLUSH_MS / 1000,
+            session_factory=session_factory,
+            pnl_single=settings.IBKR_STREAM_PNL_SINGLE,
+            mark_version_interval=settings.IBKR_STREAM_MARK_VERSION_SECONDS
+        )
+        self._streams[ba_id] = stream
+        try:
+            await stream.start()
+        except Exception:
+            del self._streams[ba_id]
+            await stream.stop()
+            await self._release_stream_lease(ba_id)
+            raise
+        print(f"📡 Streaming sync started for broker account {ba_id}")
+
+    async def stop_streaming(self, broker_account_id: int):
+        """Stop streaming sync for an account, writing anything still buffered."""
+        stream = self._streams.pop(broker_account_id, None)
+        if stream:
+            await stream.stop()
+        await self._release_stream_lease(broker_account_id)
+
+    async def _acquire_stream_lease(self, broker_account_id: int):
+        """The account's stream lock, False if another process holds it, None if Redis is unreachable."""
+        lock = self._client().lock(
+            STREAM_LEASE_KEY.format(broker_account_id), timeout=settings.IBKR_STREAM_LEASE_SECONDS, blocking=False
+        )
+        try:
+            if not await lock.acquire(token=uuid.uuid4().hex):
+                return False
+        except RedisConnectionError as e:
+            print(f"⚠️ Stream lease unavailable ({e}); streaming broker account {broker_account_id} without one")
+            return None
+        return lock
+
+    async def _renew_stream_lease(self, broker_account_id: int, lock):
+        while True:
+            await asyncio.sleep(settings.IBKR_STREAM_LEASE_SECONDS / 3)
+            try:
+                await lock.reacquire()
+            except LockError:
+                # Expired and taken over (e.g. after a long stall): the other process streams now
+                print(f"⚠️ Lost streaming lease for broker account {broker_account_id}; stopping stream")
+                self._leases.pop(broker_account_id, None)
+                await self.stop_streaming(broker_account_id)
+                return
+            except RedisConnectionError:
+                continue  # Retry on the next tick, before the lease runs out
+
+    async def _release_stream_lease(self, broker_account_id: int):
+        lease = self._leases.pop(broker_account_id, None)
+        if not lease:
+            return
+        lock, renewal = lease
+        renewal.cancel()
+        try:
+            await lock.release()
+        except (LockError, RedisConnectionError):
+            pass  # Expires on its own
+
+    def is_streaming(self, broker_account_id: int) -> bool:
+        return broker_account_id in self._streams
+
     async def disconnect(self, broker_account_id: int):
         """Disconnect specific broker account."""
+        await self.stop_streaming(broker_account_id)
         if broker_account_id in self._connections:
             ib = self._connections[broker_account_id]
             if ib.isConnected():
@@ -50,6 +163,8 @@ class IBKRConnectionManager:
 
     async def disconnect_all(self):
         """Disconnect all connections (on shutdown)."""
+        for broker_account_id in list(self._streams):
+            await self.stop_streaming(broker_account_id)
         for ib in self._connections.values():
             if ib.isConnected():
                 ib.disconnect()
@@ -63,13 +178,13 @@ class IBKRConnectionManager:
             broker_account_id: ID of the broker account
 
         Returns:
-            dict: Status information {"connected": bool, "exists": bool}
+            dict: Status information {"connected": bool, "exists": bool, "streaming": bool}
         """
         if broker_account_id not in self._connections:
-            return {"exists": False, "connected": False}
+            return {"exists": False, "connected": False, "streaming": False}
 
         ib = self._connections[broker_account_id]
-        return {"exists": True, "connected": ib.isConnected()}
+        return {"exists": True, "connected": ib.isConnected(), "streaming": self.is_streaming(broker_account_id)}
 
 
 # Global singleton
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+from ib_async import Ticker
+
+
+def clean_price(value) -> Optional[float]:
+    """Return value as float, or None if it is missing, NaN or non-positive."""
+    if value is None or value != value or value <= 0:
+        return None
+    return float(value)
+
+
+def clean_volume(value) -> Optional[int]:
+    """Return volume as int, or None if it is missing, NaN or negative."""
+    if value is None or value != value or value < 0:
+        return None
+    return int(value)
+
+
+def is_quote_ready(ticker: Ticker) -> bool:
+    """A ticker is ready once it carries a usable price (last, or close when no trades)."""
+    return clean_price(ticker.last) is not None or clean_price(ticker.close) is not None
+
+
+def ticker_to_quote(symbol: str, ticker: Ticker) -> Optional[dict]:
+    """
+    Convert an ib_async Ticker into the quote dict returned by the API.
+
+    Returns:
+        dict: Quote data, or None if the ticker has no usable price yet.
+    """
+    last_price = clean_price(ticker.last) or clean_price(ticker.close)
+    if last_price is None:
+        return None
+
+    return {
+        "symbol": symbol,
+        "last": last_price,
+        "bid": clean_price(ticker.bid),
+        "ask": clean_price(ticker.ask),
+        "volume": clean_volume(ticker.volume),
+        "high": clean_price(ticker.high),
+        "low": clean_price(ticker.low),
+        "close": clean_price(ticker.close),
+        "open": clean_price(ticker.open),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+async def wait_for_tickers(
+        tickers: Iterable[Ticker],
+        timeout: float,
+        ready: Callable[[Ticker], bool] = is_quote_ready
+) -> None:
+    """
+    Wait until every ticker is ready or the deadline passes.
+
+    Listens on each ticker's updateEvent instead of sleeping a fixed time,
+    so the call returns as soon as the last ticker gets its data.
+    """
+    tickers = list(tickers)
+    pending = {id(t) for t in tickers if not ready(t)}
+    if not pending:
+        return
+
+    done = asyncio.Event()
+
+    def on_update(ticker: Ticker, *args):
+        if ready(ticker):
+            pending.discard(id(ticker))
+            if not pending:
+                done.set()
+
+    for ticker in tickers:
+        ticker.updateEvent += on_update
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for ticker in tickers:
+            ticker.updateEvent -= on_update
+
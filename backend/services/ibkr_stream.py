@@ -0,0 +1,294 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+from ib_async import IB
+from backend.db import Session as SessionLocal
+from backend.models.broker_account import BrokerAccount
+from backend.services.contract_cache import contract_cache
+from backend.services.portfolio_stream import portfolio_stream
+from backend.services.analytics import analytics_service
+from backend.services.daily_pnl import refresh_daily_pnl, trade_dates
+from backend.services.ibkr_sync import (
+    SUMMARY_TAGS,
+    MARK_COLUMNS,
+    clean_ib_value,
+    portfolio_item_marks,
+    positions_to_rows,
+    executions_to_rows,
+    apply_position_changes,
+    update_position_marks,
+    update_account_summary,
+    upsert_trades,
+    update_trade_commission_reports
+)
+
+# accountValueEvent reports these per currency as well; only the BASE total is the account figure
+BASE_CURRENCY_TAGS = {"TotalCashValue"}
+
+
+class AccountStream:
+    """
+    Incremental sync of one broker account from ib_async streaming events.
+
+    Subscribes to positionEvent, execDetailsEvent / commissionReportEvent
+    and accountValueEvent on the account's IB connection and buffers the
+    changes. Buffered changes are coalesced per symbol / exec_id / field
+    and written as one small transaction per flush interval, so a burst
+    of fills costs one write, and quiet accounts cost nothing.
+
+    Position valuations (price, market value, PnL) are kept in an
+    in-memory table per symbol, fed by updatePortfolioEvent (account
+    updates) and, with pnl_single, by one reqPnLSingle stream per position.
+    Neither uses market data lines. Changed marks are written with the
+    same flush as a valuation-only UPDATE.
+
+    Writes are idempotent upserts, so the periodic full sync can keep
+    running as a reconciliation safety net.
+
+    Flushes with position, trade or summary changes bump the account's
+    data_version (ETags, consolidated view); valuation-only flushes bump it
+    at most once per mark_version_interval, so second-by-second PnL marks
+    don't invalidate every cached read.
+    """
+
+    def __init__(self, ib: IB, broker_account_id: int, user_id: int, account_code: str,
+                 flush_interval: float = 1.0, session_factory=None, pnl_single: bool = True,
+                 mark_version_interval: float = 60.0):
+        self.ib = ib
+        self.broker_account_id = broker_account_id
+        self.user_id = user_id
+        self.account_code = account_code
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory or SessionLocal
+        self.pnl_single = pnl_single
+        self.mark_version_interval = mark_version_interval
+
+        self._positions: Dict[str, object] = {}  # symbol -> latest Position
+        self._fills: Dict[str, object] = {}  # exec_id -> Fill
+        self._late_reports: Dict[str, dict] = {}  # exec_id -> realized PnL / commission of an already written fill
+        self._summary: Dict[str, float] = {}  # summary field -> value (pending)
+        self._summary_state: Dict[str, float] = {}  # every summary field seen, for publishing
+        self._held: Dict[str, object] = {}  # symbol -> open Position, for valuing mark-only updates
+        self._marks: Dict[str, dict] = {}  # symbol -> latest MARK_COLUMNS values
+        self._marked: Set[str] = set()  # symbols whose marks changed since the last flush
+        self._pnl_con_ids: Dict[int, Tuple[str, float]] = {}  # conId -> (symbol, multiplier) of reqPnLSingle subscriptions
+        self._marks_versioned_at = 0.0  # monotonic time of the last version bump covering marks
+        self._unversioned_marks = False  # marks written since then without a version bump
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    async def start(self):
+        self.ib.positionEvent += self._on_position
+        self.ib.execDetailsEvent += self._on_exec_details
+        self.ib.commissionReportEvent += self._on_commission_report
+        self.ib.accountValueEvent += self._on_account_value
+        self.ib.updatePortfolioEvent += self._on_portfolio_item
+        self.ib.pnlSingleEvent += self._on_pnl_single
+        await self.subscribe()
+
+    async def subscribe(self):
+        """(Re)request account updates and PnL streams; needed again after a reconnect."""
+        await self.ib.reqAccountUpdatesAsync(self.account_code)
+        for item in self.ib.portfolio(self.account_code):
+            if item.position:
+                self._marks[item.contract.symbol] = portfolio_item_marks(item)
+        self._pnl_con_ids.clear()
+        for position in self.ib.positions(self.account_code):
+            if position.position:
+                self._held[position.contract.symbol] = position
+                self._subscribe_pnl(position.contract)
+
+    async def stop(self):
+        """Detach from the connection and write whatever is still buffered."""
+        self.ib.positionEvent -= self._on_position
+        self.ib.execDetailsEvent -= self._on_exec_details
+        self.ib.commissionReportEvent -= self._on_commission_report
+        self.ib.accountValueEvent -= self._on_account_value
+        self.ib.updatePortfolioEvent -= self._on_portfolio_item
+        self.ib.pnlSingleEvent -= self._on_pnl_single
+        if self.ib.isConnected():
+            for con_id in self._pnl_con_ids:
+                self.ib.cancelPnLSingle(self.account_code, "", con_id)
+        self._pnl_con_ids.clear()
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self.flush()
+
+    # ------------------------------------------------------------------
+    # Event handlers (event loop, must stay cheap)
+    # ------------------------------------------------------------------
+    def _on_position(self, position):
+        if position.account != self.account_code:
+            return
+        symbol = position.contract.symbol
+        self._positions[symbol] = position
+        if position.position:
+            if symbol not in self._held:
+                self._subscribe_pnl(position.contract)
+            self._held[symbol] = position
+        else:
+            self._held.pop(symbol, None)
+            self._marks.pop(symbol, None)
+            self._unsubscribe_pnl(position.contract)
+        self._schedule_flush()
+
+    def _on_portfolio_item(self, item):
+        if item.account != self.account_code or not item.position:
+            return
+        self._set_marks(item.contract.symbol, portfolio_item_marks(item))
+
+    def _on_pnl_single(self, entry):
+        subscription = self._pnl_con_ids.get(entry.conId)
+        if subscription is None:
+            return  # Another account's stream on the same connection
+        symbol, multiplier = subscription
+        value = clean_ib_value(entry.value)
+        quantity = clean_ib_value(entry.position)
+        marks = {"unrealized_pnl": clean_ib_value(entry.unrealizedPnL)}
+        if value is not None:
+            marks["market_value"] = value
+            if quantity:
+                # value is quantity * price * multiplier (e.g. 100 per equity option)
+                marks["current_price"] = value / (quantity * multiplier)
+        self._set_marks(symbol, {k: v for k, v in marks.items() if v is not None})
+
+    def _set_marks(self, symbol: str, marks: dict):
+        current = self._marks.setdefault(symbol, {c: None for c in MARK_COLUMNS})
+        if all(current.get(c) == v for c, v in marks.items()):
+            return
+        current.update(marks)
+        self._marked.add(symbol)
+        self._schedule_flush()
+
+    def _on_exec_details(self, trade, fill):
+        if fill.execution.acctNumber != self.account_code:
+            return
+        self._fills[fill.execution.execId] = fill
+        self._schedule_flush()
+
+    def _on_commission_report(self, trade, fill, report):
+        if fill.execution.acctNumber != self.account_code:
+            return
+        exec_id = fill.execution.execId
+        # Pending fills read their commission report at flush time
+        if exec_id in self._fills:
+            return
+        # The fill may have been written by a full sync or another process: the UPDATE by exec_id is idempotent
+        self._late_reports[exec_id] = {
+            "realized_pnl": clean_ib_value(report.realizedPNL),
+            "commission": clean_ib_value(report.commission)
+        }
+        self._schedule_flush()
+
+    def _on_account_value(self, value):
+        if value.account != self.account_code or value.tag not in SUMMARY_TAGS:
+            return
+        if value.tag in BASE_CURRENCY_TAGS and value.currency != "BASE":
+            return
+        try:
+            self._summary[SUMMARY_TAGS[value.tag]] = float(value.value)
+        except ValueError:
+            return
+        self._schedule_flush()
+
+    def _subscribe_pnl(self, contract):
+        if self.pnl_single and contract.conId and contract.conId not in self._pnl_con_ids:
+            self._pnl_con_ids[contract.conId] = (contract.symbol, float(contract.multiplier or 1))
+            self.ib.reqPnLSingle(self.account_code, "", contract.conId)
+
+    def _unsubscribe_pnl(self, contract):
+        if self._pnl_con_ids.pop(contract.conId, None) is not None:
+            self.ib.cancelPnLSingle(self.account_code, "", contract.conId)
+
+    def _schedule_flush(self, delay: Optional[float] = None):
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.flush_interval if delay is None else delay, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    # ------------------------------------------------------------------
+    # Flush
+    # ------------------------------------------------------------------
+    async def flush(self):
+        """Write buffered changes in one transaction and publish them to live dashboards."""
+        self._flush_handle = None
+        async with self._flush_lock:
+            positions, self._positions = self._positions, {}
+            fills, self._fills = self._fills, {}
+            late_reports, self._late_reports = self._late_reports, {}
+            summary, self._summary = self._summary, {}
+            marked, self._marked = self._marked, set()
+            now = time.monotonic()
+            marks_due = (bool(marked) or self._unversioned_marks) \
+                and now - self._marks_versioned_at >= self.mark_version_interval
+            bump_version = bool(positions or fills or late_reports or summary) or marks_due
+            if not (bump_version or marked):
+                return
+
+            open_positions = [p for p in positions.values() if p.position != 0]
+            closed = [symbol for symbol, p in positions.items() if p.position == 0]
+            position_rows = positions_to_rows(open_positions, self._marks)
+            # Position changes already carry their marks; the rest only need a valuation update
+            mark_rows = positions_to_rows(
+                [self._held[s] for s in marked if s in self._held and s not in positions], self._marks
+            )
+            trade_rows = executions_to_rows(fills.values())
+
+            try:
+                await asyncio.to_thread(
+                    self._write, open_positions, position_rows, closed, trade_rows, late_reports, summary, mark_rows,
+                    bump_version=bump_version
+                )
+            except Exception as e:
+                # The next full sync reconciles whatever this batch missed
+                print(f"❌ Stream write failed for broker account {self.broker_account_id}: {e}")
+                return
+
+            if bump_version:
+                self._marks_versioned_at = now
+                self._unversioned_marks = False
+            elif marked:
+                # Bump once the interval is up, even if the marks stop changing
+                self._unversioned_marks = True
+                self._schedule_flush(self.mark_version_interval - (now - self._marks_versioned_at))
+            if position_rows or mark_rows:
+                await portfolio_stream.publish_positions(
+                    self.user_id, self.broker_account_id, position_rows + mark_rows, complete=False
+                )
+            await portfolio_stream.publish_removed_positions(self.user_id, self.broker_account_id, closed)
+            if summary:
+                self._summary_state.update(summary)
+                await portfolio_stream.publish_summary(self.user_id, self.broker_account_id, self._summary_state)
+
+    def _write(self, open_positions, position_rows, closed, trade_rows, late_reports, summary, mark_rows=(),
+               bump_version=True):
+        """One transaction for the whole batch (runs in a worker thread)."""
+        with self.session_factory() as db:
+            apply_position_changes(db, self.user_id, self.broker_account_id, position_rows, closed)
+            update_position_marks(db, self.user_id, self.broker_account_id, list(mark_rows))
+            contract_cache.prime(db, [p.contract for p in open_positions])
+            trades_changed = False
+            if trade_rows:
+                counts = upsert_trades(db, self.user_id, self.broker_account_id, trade_rows)
+                if counts["inserted"] or counts["reported"]:
+                    refresh_daily_pnl(db, self.user_id, self.broker_account_id, trade_dates(trade_rows))
+                    trades_changed = True
+            if update_trade_commission_reports(db, self.user_id, self.broker_account_id, late_reports):
+                trades_changed = True
+            if summary:
+                update_account_summary(db, self.user_id, self.broker_account_id, summary)
+            values = {"updated_at": datetime.utcnow()}
+            if bump_version:
+                values["data_version"] = BrokerAccount.data_version + 1
+            if trades_changed:
+                values["trades_version"] = BrokerAccount.trades_version + 1
+            db.query(BrokerAccount).filter_by(id=self.broker_account_id).update(values, synchronize_session=False)
+            db.commit()
+        if trades_changed:
+            analytics_service.invalidate(self.user_id)
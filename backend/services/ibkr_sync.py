@@ -1,119 +1,489 @@
+from sqlalchemy import func, select, update, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from backend.db import Session as SessionLocal
+from backend.config import settings
 from backend.models.broker_account import BrokerAccount
 from backend.models.portfolio import Portfolio
 from backend.models.trade import Trade
 from backend.models.account_summary import AccountSummary
 from backend.services.ibkr_connection_manager import connection_manager
+from backend.services.contract_cache import contract_cache
+from backend.services.portfolio_stream import portfolio_stream
+from backend.services.sync_coalescer import sync_coalescer
+from backend.services.position_history import record_position_changes
+from backend.constants import UNSET_PNL
+from backend.services.analytics import analytics_service
+from backend.services.lot_matching import match_trades
+from backend.services.daily_pnl import refresh_daily_pnl, refresh_daily_pnl_for_execs, trade_dates
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Dict, Optional
 import asyncio
+import time
 
 
-def upsert_portfolio(db: Session, user_id: int, broker_account_id: int, positions: list[dict]):
-    """Delete existing positions and insert new ones."""
-    db.query(Portfolio).filter_by(user_id=user_id, broker_account_id=broker_account_id).delete()
-    for p in positions:
-        db.add(Portfolio(user_id=user_id, broker_account_id=broker_account_id, **p))
-    db.commit()
+POSITION_COLUMNS = ("quantity", "avg_cost", "current_price", "market_value", "unrealized_pnl", "realized_pnl")
+# Valuation columns, fed by IB's account updates / PnL streams instead of quotes
+MARK_COLUMNS = ("current_price", "market_value", "unrealized_pnl", "realized_pnl")
+
+
+def upsert_portfolio(db: Session, user_id: int, broker_account_id: int, positions: list[dict]) -> dict:
+    """
+    Sync positions by diffing against stored rows.
+
+    New and changed symbols are written with one INSERT ... ON CONFLICT DO UPDATE
+    on uq_portfolio_user_ba_symbol, symbols that disappeared are removed with
+    one DELETE, and unchanged rows are not touched. Quantity / price / PnL
+    changes are appended to PositionHistory. Caller commits.
+
+    Returns:
+        dict: {"added": int, "changed": int, "removed": int, "unchanged": int}
+    """
+    existing = {
+        row.symbol: row
+        for row in db.query(Portfolio.symbol, *[getattr(Portfolio, c) for c in POSITION_COLUMNS])
+        .filter_by(user_id=user_id, broker_account_id=broker_account_id)
+        .all()
+    }
+    incoming = {p["symbol"]: {c: p.get(c) for c in POSITION_COLUMNS} for p in positions}
+
+    added, changed = [], []
+    for symbol, values in incoming.items():
+        row = existing.get(symbol)
+        if row is None:
+            added.append(symbol)
+        elif any(getattr(row, c) != values[c] for c in POSITION_COLUMNS):
+            changed.append(symbol)
+    removed = [symbol for symbol in existing if symbol not in incoming]
+
+    upserts = added + changed
+    upsert_positions(db, user_id, broker_account_id, [{"symbol": symbol, **incoming[symbol]} for symbol in upserts])
+    delete_positions(db, user_id, broker_account_id, removed)
+    record_position_changes(db, user_id, broker_account_id, existing, incoming, removed, complete=True)
+
+    return {
+        "added": len(added),
+        "changed": len(changed),
+        "removed": len(removed),
+        "unchanged": len(incoming) - len(upserts)
+    }
+
+
+def upsert_positions(db: Session, user_id: int, broker_account_id: int, positions: list[dict]):
+    """INSERT ... ON CONFLICT DO UPDATE the given position rows only. Caller commits."""
+    if not positions:
+        return
+    stmt = pg_insert(Portfolio).values([
+        {"user_id": user_id, "broker_account_id": broker_account_id, "symbol": p["symbol"],
+         **{c: p.get(c) for c in POSITION_COLUMNS}}
+        for p in positions
+    ])
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_portfolio_user_ba_symbol",
+        set_={**{c: stmt.excluded[c] for c in POSITION_COLUMNS}, "updated_at": func.now()}
+    )
+    db.execute(stmt)
+
+
+def delete_positions(db: Session, user_id: int, broker_account_id: int, symbols: list[str]):
+    """Delete the given symbols' position rows. Caller commits."""
+    if not symbols:
+        return
+    db.query(Portfolio).filter(
+        Portfolio.user_id == user_id,
+        Portfolio.broker_account_id == broker_account_id,
+        Portfolio.symbol.in_(symbols)
+    ).delete(synchronize_session=False)
+
+
+def apply_position_changes(db: Session, user_id: int, broker_account_id: int,
+                           positions: list[dict], closed: list[str]) -> int:
+    """
+    Apply a partial set of position changes (streaming updates): upsert
+    `positions`, delete `closed` symbols, and append history for the ones
+    that actually changed. Caller commits.
+
+    Returns:
+        int: number of history rows written
+    """
+    symbols = [p["symbol"] for p in positions] + list(closed)
+    if not symbols:
+        return 0
+    existing = {
+        row.symbol: row
+        for row in db.query(Portfolio.symbol, *[getattr(Portfolio, c) for c in POSITION_COLUMNS])
+        .filter(
+            Portfolio.user_id == user_id,
+            Portfolio.broker_account_id == broker_account_id,
+            Portfolio.symbol.in_(symbols)
+        )
+        .all()
+    }
+    upsert_positions(db, user_id, broker_account_id, positions)
+    delete_positions(db, user_id, broker_account_id, closed)
+    removed = [symbol for symbol in closed if symbol in existing]
+    return record_position_changes(
+        db, user_id, broker_account_id, existing, {p["symbol"]: p for p in positions}, removed
+    )
+
+
+def update_position_marks(db: Session, user_id: int, broker_account_id: int, rows: list[dict]):
+    """
+    Update only the valuation columns of existing position rows (one
+    executemany UPDATE). Never inserts, so a late mark can't resurrect a
+    closed position. Not recorded in PositionHistory. Caller commits.
+    """
+    if not rows:
+        return
+    table = Portfolio.__table__
+    stmt = (
+        update(table)
+        .where(
+            table.c.user_id == user_id,
+            table.c.broker_account_id == broker_account_id,
+            table.c.symbol == bindparam("b_symbol")
+        )
+        .values({**{c: bindparam(f"b_{c}") for c in MARK_COLUMNS}, "updated_at": func.now()})
+    )
+    db.execute(stmt, [{"b_symbol": r["symbol"], **{f"b_{c}": r.get(c) for c in MARK_COLUMNS}} for r in rows])
 
 
 def upsert_account_summary(db: Session, user_id: int, broker_account_id: int, summary: dict):
-    """Delete existing summary and insert new one."""
+    """Delete existing summary and insert new one. Caller commits."""
     db.query(AccountSummary).filter_by(user_id=user_id, broker_account_id=broker_account_id).delete()
     db.add(AccountSummary(user_id=user_id, broker_account_id=broker_account_id, **summary))
-    db.commit()
 
 
-def upsert_trades(db: Session, user_id: int, broker_account_id: int, trades: list[dict]):
-    """Insert only new trades (skip existing exec_ids)."""
-    existing_exec_ids = {t.exec_id for t in db.query(Trade.exec_id)
-                         .filter_by(broker_account_id=broker_account_id)}
-    for t in trades:
-        if t["exec_id"] not in existing_exec_ids:
-            db.add(Trade(user_id=user_id, broker_account_id=broker_account_id, **t))
+def update_account_summary(db: Session, user_id: int, broker_account_id: int, fields: dict):
+    """Update only the given summary fields, creating the row if missing. Caller commits."""
+    updated = db.query(AccountSummary).filter_by(
+        user_id=user_id, broker_account_id=broker_account_id
+    ).update(fields, synchronize_session=False)
+    if not updated:
+        db.add(AccountSummary(user_id=user_id, broker_account_id=broker_account_id, **fields))
+
+
+TRADE_INSERT_CHUNK_SIZE = 1000  # Rows per INSERT statement (keeps bind params well under Postgres' limit)
+
+
+def upsert_trades(db: Session, user_id: int, broker_account_id: int, trades: list[dict],
+                  chunk_size: int = TRADE_INSERT_CHUNK_SIZE) -> dict:
+    """
+    Insert only new trades (skip existing exec_ids) and match them into
+    journal round trips.
+
+    Uses INSERT ... ON CONFLICT (broker_account_id, exec_id) DO NOTHING on
+    uq_trade_ba_execid, so cost depends on the batch size, not on how many
+    executions the account already has. Only the inserted rows go through
+    lot matching. Existing trades stored before their commission report
+    arrived get its realized PnL / commission. Caller commits.
+
+    Returns:
+        dict: {"inserted": int, "skipped": int, "journaled": int, "reported": int}
+    """
+    # A fill can be listed twice in one batch (e.g. executions + live fills)
+    trades = list({t["exec_id"]: t for t in trades}.values())
+    inserted = []
+    for start in range(0, len(trades), chunk_size):
+        chunk = trades[start:start + chunk_size]
+        stmt = (
+            pg_insert(Trade)
+            .values([{"user_id": user_id, "broker_account_id": broker_account_id, **t} for t in chunk])
+            .on_conflict_do_nothing(constraint="uq_trade_ba_execid")
+            .returning(Trade.id, Trade.exec_id)
+        )
+        ids = {exec_id: trade_id for trade_id, exec_id in db.execute(stmt).all()}
+        inserted += [{**t, "id": ids[t["exec_id"]]} for t in chunk if t["exec_id"] in ids]
+    journaled = match_trades(db, user_id, broker_account_id, inserted)
+
+    new_ids = {t["exec_id"] for t in inserted}
+    reported = complete_commission_reports(
+        db, broker_account_id, [t for t in trades if t["exec_id"] not in new_ids and t.get("commission") is not None]
+    )
+    return {"inserted": len(inserted), "skipped": len(trades) - len(inserted), "journaled": journaled,
+            "reported": reported}
+
+
+def complete_commission_reports(db: Session, broker_account_id: int, trades: list[dict]) -> int:
+    """
+    Fill in realized_pnl / commission of stored trades that are still
+    waiting for their commission report (commission IS NULL). One indexed
+    lookup on uq_trade_ba_execid, then one executemany UPDATE for the
+    trades that need it. Caller commits.
+
+    Returns:
+        int: number of trades updated
+    """
+    if not trades:
+        return 0
+    waiting = set(db.execute(
+        select(Trade.exec_id).where(
+            Trade.broker_account_id == broker_account_id,
+            Trade.exec_id.in_([t["exec_id"] for t in trades]),
+            Trade.commission.is_(None)
+        )
+    ).scalars().all())
+    if not waiting:
+        return 0
+
+    table = Trade.__table__
+    stmt = (
+        update(table)
+        .where(table.c.broker_account_id == broker_account_id, table.c.exec_id == bindparam("b_exec_id"))
+        .values(realized_pnl=bindparam("b_realized_pnl"), commission=bindparam("b_commission"))
+    )
+    db.execute(stmt, [
+        {"b_exec_id": t["exec_id"], "b_realized_pnl": t.get("realized_pnl"), "b_commission": t["commission"]}
+        for t in trades if t["exec_id"] in waiting
+    ])
+    return len(waiting)
+
+
+def update_trade_commission_reports(db: Session, user_id: int, broker_account_id: int, reports: Dict[str, dict]):
+    """
+    Set realized_pnl / commission on already stored trades by exec_id
+    (late commission reports) and refresh their daily rollup. Caller commits.
+
+    Returns:
+        int: number of trades updated
+    """
+    updated = 0
+    for exec_id, values in reports.items():
+        updated += db.query(Trade).filter_by(broker_account_id=broker_account_id, exec_id=exec_id).update(
+            values, synchronize_session=False
+        )
+    if updated:
+        refresh_daily_pnl_for_execs(db, user_id, broker_account_id, reports)
+    return updated
+
+
+SUMMARY_TAGS = {
+    "TotalCashValue": "total_cash",
+    "NetLiquidation": "net_liquidation",
+    "EquityWithLoanValue": "equity_with_loan",
+    "BuyingPower": "buying_power",
+}
+
+
+@dataclass
+class SyncResult:
+    """Outcome of one broker sync, with per-stage timings in seconds."""
+    broker_account_id: int
+    status: str = "pending"  # ok / not_found / error
+    positions: dict = field(default_factory=dict)
+    trades: dict = field(default_factory=dict)
+    summary_synced: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def clean_ib_value(value) -> Optional[float]:
+    """Float value, or None for NaN and IB's unset (DBL_MAX) marker."""
+    if value is None or value != value or abs(value) >= UNSET_PNL:
+        return None
+    return float(value)
+
+
+def portfolio_item_marks(item) -> dict:
+    """Valuation columns from an ib_async PortfolioItem (account updates)."""
+    return {
+        "current_price": clean_ib_value(item.marketPrice),
+        "market_value": clean_ib_value(item.marketValue),
+        "unrealized_pnl": clean_ib_value(item.unrealizedPNL),
+        "realized_pnl": clean_ib_value(item.realizedPNL),
+    }
+
+
+async def ensure_account_updates(ib, account_code: str):
+    """
+    Subscribe the connection to account updates unless it already gets them
+    (stream running, or an earlier sync on this connection). ib.portfolio()
+    is only filled by this subscription; without it every mark would be NULL.
+    """
+    if not ib.accountValues(account_code):
+        await ib.reqAccountUpdatesAsync(account_code)
+
+
+def portfolio_marks(ib, account_code: str) -> Dict[str, dict]:
+    """Symbol -> valuation from the connection's account-updates cache (no gateway request)."""
+    return {item.contract.symbol: portfolio_item_marks(item) for item in ib.portfolio(account_code)}
+
+
+def positions_to_rows(positions, marks: Optional[Dict[str, dict]] = None) -> list[dict]:
+    """
+    Convert ib_async Position objects to Portfolio rows.
+
+    Valuation columns come from `marks` (symbol -> MARK_COLUMNS values, see
+    portfolio_marks); positions without one get None rather than a guess.
+    """
+    marks = marks or {}
+    return [
+        {
+            "symbol": p.contract.symbol,
+            "quantity": float(p.position),
+            "avg_cost": float(p.avgCost),
+            **{c: None for c in MARK_COLUMNS},
+            **marks.get(p.contract.symbol, {})
+        }
+        for p in positions
+    ]
+
+
+def summary_to_dict(summary_items) -> dict:
+    """Pick the AccountSummary fields out of ib_async AccountValue items."""
+    return {
+        SUMMARY_TAGS[item.tag]: float(item.value)
+        for item in summary_items
+        if item.tag in SUMMARY_TAGS
+    }
+
+
+def executions_to_rows(executions) -> list[dict]:
+    """
+    Convert ib_async Fill objects to Trade rows.
+
+    Fills carry an empty CommissionReport until IB sends the real one; until
+    then realized_pnl / commission are NULL (filled in later by upsert_trades
+    or the stream), not 0. IB's unset realized PnL (opening fills) is NULL too.
+    """
+    rows = []
+    for e in executions:
+        report = e.commissionReport if getattr(e.commissionReport, "execId", "") else None
+        rows.append({
+            "exec_id": e.execution.execId,
+            "order_id": str(e.execution.orderId),
+            "symbol": e.contract.symbol,
+            "con_id": e.contract.conId or None,
+            "multiplier": float(e.contract.multiplier) if e.contract.multiplier else None,
+            "side": e.execution.side,
+            "qty": float(e.execution.shares),
+            "price": float(e.execution.price),
+            "realized_pnl": clean_ib_value(report.realizedPNL) if report else None,
+            "commission": clean_ib_value(report.commission) if report else None,
+            "trade_time": e.execution.time if isinstance(e.execution.time, datetime)
+            else datetime.strptime(e.execution.time, "%Y%m%d  %H:%M:%S")
+        })
+    return rows
+
+
+async def _timed(timings: Dict[str, float], stage: str, awaitable):
+    """Await a stage and record how long it took."""
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 4)
+
+
+def _persist(db: Session, broker_account: BrokerAccount, user_id: int, positions,
+             positions_data: list[dict], summary_dict: dict, trades_data: list[dict]) -> tuple[dict, dict]:
+    """Write every dataset in one transaction (runs in a worker thread)."""
+    broker_account_id = broker_account.id
+    position_counts = upsert_portfolio(db, user_id, broker_account_id, positions_data)
+    contract_cache.prime(db, [p.contract for p in positions])
+    if summary_dict:
+        upsert_account_summary(db, user_id, broker_account_id, summary_dict)
+    trade_counts = upsert_trades(db, user_id, broker_account_id, trades_data)
+    trades_changed = trade_counts["inserted"] or trade_counts["reported"]
+    if trades_changed:
+        refresh_daily_pnl(db, user_id, broker_account_id, trade_dates(trades_data))
+
+    # Update broker account timestamp and data version (invalidates ETags)
+    broker_account.updated_at = datetime.utcnow()
+    broker_account.data_version = BrokerAccount.data_version + 1
+    if trades_changed:
+        broker_account.trades_version = BrokerAccount.trades_version + 1
     db.commit()
+    if trades_changed:
+        analytics_service.invalidate(user_id)
+    return position_counts, trade_counts
 
 
-async def sync_broker_data(broker_account_id: int, user_id: int):
+async def sync_broker_data(broker_account_id: int, user_id: int, session_factory=None) -> SyncResult:
     """
     Background task to sync data from IBKR.
-    Fetches positions, account summary, and trade executions.
+
+    Positions, account summary and executions are fetched concurrently, so
+    wall time is the slowest gateway round trip rather than their sum. The
+    results are written off the event loop in a single transaction.
+
+    Args:
+        session_factory: Session factory to use (defaults to the API pool;
+                         the ARQ worker passes its own pool)
+
+    Returns:
+        SyncResult: counts and per-stage timings
     """
-    db: Session = SessionLocal()
+    started = time.perf_counter()
+    result = SyncResult(broker_account_id=broker_account_id)
+    timings = result.timings
+    db: Session = (session_factory or SessionLocal)()
     try:
         print(f"🔄 Starting sync for broker account {broker_account_id}")
 
-        broker_account = db.query(BrokerAccount).filter_by(id=broker_account_id).first()
+        broker_account = await _timed(timings, "load_account", asyncio.to_thread(
+            lambda: db.query(BrokerAccount).filter_by(id=broker_account_id).first()
+        ))
         if not broker_account:
             print(f"❌ Broker account {broker_account_id} not found")
-            return
+            result.status = "not_found"
+            return result
 
         # Get connection
-        ib = await connection_manager.get_or_create_connection(broker_account)
-
-        # Fetch positions
-        print(f"  📊 Fetching positions...")
-        positions = await ib.reqPositionsAsync()
-        positions_data = [
-            {
-                "symbol": p.contract.symbol,
-                "quantity": float(p.position),
-                "avg_cost": float(p.avgCost),
-                "current_price": None,  # Need market data subscription
-                "market_value": float(p.position * p.avgCost),
-                "unrealized_pnl": 0.0,
-                "realized_pnl": 0.0
-            }
-            for p in positions
-        ]
-        upsert_portfolio(db, user_id, broker_account_id, positions_data)
-        print(f"  ✅ Synced {len(positions_data)} positions")
-
-        # Fetch account summary
-        print(f"  💰 Fetching account summary...")
-        summary_items = await ib.reqAccountSummaryAsync()
-        summary_dict = {}
-        for item in summary_items:
-            if item.tag == "TotalCashValue":
-                summary_dict["total_cash"] = float(item.value)
-            elif item.tag == "NetLiquidation":
-                summary_dict["net_liquidation"] = float(item.value)
-            elif item.tag == "EquityWithLoanValue":
-                summary_dict["equity_with_loan"] = float(item.value)
-            elif item.tag == "BuyingPower":
-                summary_dict["buying_power"] = float(item.value)
+        ib = await _timed(timings, "connect", connection_manager.get_or_create_connection(broker_account))
+        if settings.IBKR_STREAMING_ENABLED:
+            await connection_manager.start_streaming(broker_account, session_factory=session_factory)
+
+        # Fetch positions, account summary, executions and portfolio marks concurrently
+        positions, summary_items, executions, _ = await _timed(timings, "fetch", asyncio.gather(
+            _timed(timings, "fetch_positions", ib.reqPositionsAsync()),
+            _timed(timings, "fetch_account_summary", ib.reqAccountSummaryAsync()),
+            _timed(timings, "fetch_executions", ib.reqExecutionsAsync()),
+            _timed(timings, "fetch_portfolio", ensure_account_updates(ib, broker_account.account_code))
+        ))
+        positions_data = positions_to_rows(positions, portfolio_marks(ib, broker_account.account_code))
+        summary_dict = summary_to_dict(summary_items)
+        trades_data = executions_to_rows(executions)
 
+        # Persist everything in one transaction, off the event loop
+        result.positions, result.trades = await _timed(timings, "persist", asyncio.to_thread(
+            _persist, db, broker_account, user_id, positions, positions_data, summary_dict, trades_data
+        ))
+        result.summary_synced = bool(summary_dict)
+
+        await portfolio_stream.publish_positions(user_id, broker_account_id, positions_data)
         if summary_dict:
-            upsert_account_summary(db, user_id, broker_account_id, summary_dict)
-            print(f"  ✅ Synced account summary")
-
-        # Fetch executions (trades)
-        print(f"  📈 Fetching trade executions...")
-        executions = await ib.reqExecutionsAsync()
-        trades_data = [
-            {
-                "exec_id": e.execution.execId,
-                "order_id": str(e.execution.orderId),
-                "symbol": e.contract.symbol,
-                "side": e.execution.side,
-                "qty": float(e.execution.shares),
-                "price": float(e.execution.price),
-                "realized_pnl": float(e.commissionReport.realizedPNL) if e.commissionReport else None,
-                "trade_time": datetime.strptime(e.execution.time, "%Y%m%d  %H:%M:%S")
-            }
-            for e in executions
-        ]
-        upsert_trades(db, user_id, broker_account_id, trades_data)
-        print(f"  ✅ Synced {len(trades_data)} trades")
-
-        # Update broker account timestamp
-        broker_account.updated_at = datetime.utcnow()
-        db.commit()
-
-        print(f"✅ Sync completed for broker account {broker_account_id}")
+            await portfolio_stream.publish_summary(user_id, broker_account_id, summary_dict)
+
+        result.status = "ok"
+        print(f"  ✅ Synced {len(positions_data)} positions "
+              f"(+{result.positions['added']} ~{result.positions['changed']} -{result.positions['removed']}), "
+              f"{len(trades_data)} trades ({result.trades['inserted']} new)")
+        print(f"✅ Sync completed for broker account {broker_account_id} in "
+              f"{time.perf_counter() - started:.2f}s")
 
     except Exception as e:
         print(f"❌ Sync error for broker_account {broker_account_id}: {e}")
         db.rollback()
+        result.status = "error"
+        result.error = str(e)
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+        timings["total"] = round(time.perf_counter() - started, 4)
+
+    return result
+
+
+async def sync_broker_data_coalesced(broker_account_id: int, user_id: int, session_factory=None) -> Optional[SyncResult]:
+    """
+    sync_broker_data under the per-account single-flight (see SyncCoalescer).
+    Use together with sync_coalescer.request() so overlapping requests merge.
+
+    Returns:
+        SyncResult of the last run, or None if the run in progress took it over
+    """
+    return await sync_coalescer.run(
+        broker_account_id,
+        lambda: sync_broker_data(broker_account_id, user_id, session_factory=session_factory)
+    )
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import select, insert, delete
+from sqlalchemy.orm import Session
+from backend.config import settings
+from backend.models.journal import Journal
+from backend.models.open_lot import OpenLot
+from backend.models.trade import Trade
+
+METHODS = ("fifo", "lifo", "specific")
+
+# IB reports executions as BOT / SLD
+BUY_SIDES = {"BUY", "BOT"}
+
+# Quantities below this are treated as fully matched (float share counts)
+QTY_EPSILON = 1e-9
+
+
+def normalize_side(side: str) -> str:
+    return "BUY" if side.upper() in BUY_SIDES else "SELL"
+
+
+def lot_key(symbol: str, con_id: Optional[int]) -> Tuple[str, Optional[int]]:
+    """
+    Contract whose lots a fill opens or closes. Options, futures and the
+    stock of one underlying share a symbol but not a conId; trades stored
+    without a conId keep matching among themselves by symbol.
+    """
+    return (symbol, con_id or None)
+
+
+def _lot_order(lots: List[OpenLot], method: str, selected: Sequence[int] = ()) -> List[OpenLot]:
+    """Open lots in the order a closing fill consumes them."""
+    if method == "lifo":
+        return lots[::-1]
+    if method == "specific" and selected:
+        # Chosen lots first (in the given order), then FIFO for any remainder
+        rank = {trade_id: i for i, trade_id in enumerate(selected)}
+        return sorted(lots, key=lambda lot: rank.get(lot.trade_id, len(rank)))
+    return lots
+
+
+def match_fills(lots: List[OpenLot], fills: Iterable[dict], method: str = "fifo",
+                selections: Optional[Dict[str, Sequence[int]]] = None) -> List[dict]:
+    """
+    Match fills of one account+contract against its open lots.
+
+    Open lots are always on one side (the net position). A fill on the
+    same side opens a new lot; a fill on the other side closes lots in
+    FIFO / LIFO / specific-ID order, one journal entry per (lot, fill)
+    pair, and any excess quantity opens a lot on the new side. Profit is
+    scaled by the contract multiplier (e.g. 100 per equity option).
+
+    `lots` is updated in place (remaining qty, exhausted lots removed,
+    new lots appended as transient OpenLot objects), so the caller only
+    has to persist the difference.
+
+    Args:
+        lots: open lots, oldest first
+        fills: Trade rows (with "id"), in execution order
+        selections: closing exec_id -> opening trade ids to consume first ("specific")
+
+    Returns:
+        list: Journal rows for the closed round trips
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown lot matching method: {method}")
+    selections = selections or {}
+    entries = []
+
+    for fill in fills:
+        side = normalize_side(fill["side"])
+        remaining = abs(float(fill["qty"]))
+        multiplier = fill.get("multiplier") or 1.0
+        if lots and lots[0].side != side:
+            direction = 1.0 if lots[0].side == "BUY" else -1.0
+            for lot in _lot_order(list(lots), method, selections.get(fill.get("exec_id"), ())):
+                if remaining <= QTY_EPSILON:
+                    break
+                qty = min(lot.qty, remaining)
+                entries.append({
+                    "symbol": fill["symbol"],
+                    "side": lot.side,
+                    "qty": qty,
+                    "entry": lot.price,
+                    "exit": fill["price"],
+                    "profit": (fill["price"] - lot.price) * qty * direction * multiplier,
+                    "entry_trade_id": lot.trade_id,
+                    "exit_trade_id": fill["id"],
+                    "entry_time": lot.opened_at,
+                    "exit_time": fill["trade_time"],
+                })
+                lot.qty -= qty
+                remaining -= qty
+                if lot.qty <= QTY_EPSILON:
+                    lots.remove(lot)
+
+        if remaining > QTY_EPSILON:
+            lots.append(OpenLot(
+                trade_id=fill["id"], symbol=fill["symbol"], con_id=fill.get("con_id") or None, side=side,
+                qty=remaining, price=fill["price"], opened_at=fill["trade_time"]
+            ))
+    return entries
+
+
+def match_trades(db: Session, user_id: int, broker_account_id: int, trades: List[dict],
+                 method: Optional[str] = None,
+                 selections: Optional[Dict[str, Sequence[int]]] = None) -> int:
+    """
+    Match newly inserted trades into journal round trips. Caller commits.
+
+    Only the open lots of the symbols in the batch are loaded, so the cost
+    follows the batch and the open position, never the trade history.
+    Lots are kept per contract (see lot_key). Fills are matched in
+    execution order within the batch; batches are matched in ingestion
+    order.
+
+    Returns:
+        int: number of journal entries written
+    """
+    if not trades:
+        return 0
+    method = method or settings.LOT_MATCHING_METHOD
+
+    by_contract: Dict[tuple, List[dict]] = defaultdict(list)
+    for trade in sorted(trades, key=lambda t: (t["trade_time"], t["id"])):
+        by_contract[lot_key(trade["symbol"], trade.get("con_id"))].append(trade)
+
+    stored = db.execute(
+        select(OpenLot)
+        .where(OpenLot.broker_account_id == broker_account_id,
+               OpenLot.symbol.in_({symbol for symbol, _ in by_contract}))
+        .order_by(OpenLot.opened_at, OpenLot.id)
+    ).scalars().all()
+    lots_by_contract: Dict[tuple, List[OpenLot]] = defaultdict(list)
+    for lot in stored:
+        lots_by_contract[lot_key(lot.symbol, lot.con_id)].append(lot)
+
+    entries = []
+    for key, fills in by_contract.items():
+        lots = lots_by_contract[key]
+        entries += match_fills(lots, fills, method, selections)
+        for lot in lots:
+            if lot.id is None:
+                lot.user_id = user_id
+                lot.broker_account_id = broker_account_id
+                db.add(lot)
+
+    # Stored lots left out of the per-contract lists were fully matched
+    remaining = {id(lot) for lots in lots_by_contract.values() for lot in lots}
+    for lot in stored:
+        if id(lot) not in remaining:
+            db.delete(lot)
+    if entries:
+        db.execute(insert(Journal), [
+            {"user_id": user_id, "broker_account_id": broker_account_id, **entry} for entry in entries
+        ])
+    return len(entries)
+
+
+def rebuild_lots(db: Session, user_id: int, broker_account_id: int, method: Optional[str] = None,
+                 selections: Optional[Dict[str, Sequence[int]]] = None) -> int:
+    """
+    Replay an account's whole trade history into open lots and journal
+    entries (first run, or after changing the method). Replaces the
+    account's matched entries; manual entries are kept. Caller commits.
+    """
+    db.execute(delete(Journal).where(Journal.broker_account_id == broker_account_id))
+    db.execute(delete(OpenLot).where(OpenLot.broker_account_id == broker_account_id))
+
+    rows = db.execute(
+        select(Trade.id, Trade.exec_id, Trade.symbol, Trade.con_id, Trade.multiplier, Trade.side, Trade.qty,
+               Trade.price, Trade.trade_time)
+        .where(Trade.user_id == user_id, Trade.broker_account_id == broker_account_id)
+    ).mappings().all()
+    return match_trades(db, user_id, broker_account_id, [dict(r) for r in rows], method, selections)
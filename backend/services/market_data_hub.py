@@ -0,0 +1,261 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from ib_async import IB, Contract, Ticker
+from backend.config import settings
+from backend.services.contract_cache import contract_cache, contract_key
+from backend.services.ibkr_quotes import ticker_to_quote, wait_for_tickers
+
+
+class MarketDataCapacityError(Exception):
+    """Raised when all market-data lines are held by active subscriptions."""
+
+
+class _Subscription:
+    """One streaming reqMktData line shared by every reader of a symbol."""
+
+    __slots__ = ("symbol", "ib", "contract", "ticker", "refcount", "release_handle", "handler")
+
+    def __init__(self, symbol: str, ib: IB, contract: Contract, ticker: Ticker):
+        self.symbol = symbol
+        self.ib = ib
+        self.contract = contract
+        self.ticker = ticker
+        self.refcount = 0
+        self.release_handle: Optional[asyncio.TimerHandle] = None
+        self.handler = None
+
+
+class MarketDataHub:
+    """
+    Process-wide market data subscriptions with fan-out to all users.
+
+    Holds one reference-counted streaming subscription per symbol and a
+    latest-tick quote cache updated from ticker events. Readers acquire
+    symbols, read quotes from the cache, and release them; a symbol with
+    no readers is unsubscribed only after a grace period, so repeated
+    requests for popular symbols never touch the gateway.
+
+    A disconnect clears ib_async's ticker state (also when the manager
+    reconnects the same IB object), so the hub drops every subscription
+    and cached quote of a connection on its disconnectedEvent; the next
+    acquire subscribes them again.
+    """
+
+    def __init__(self, grace_period: float = 60.0, max_lines: int = 100):
+        self.grace_period = grace_period
+        self.max_lines = max_lines
+        self._subscriptions: Dict[str, _Subscription] = {}  # symbol -> subscription
+        self._quotes: Dict[str, dict] = {}  # symbol -> latest quote
+        self._pending: Dict[str, asyncio.Event] = {}  # symbol -> set once its subscribe attempt ends
+        self._watched: Dict[int, tuple] = {}  # id(IB) -> (IB, disconnectedEvent handler)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    def get_quote(self, symbol: str) -> Optional[dict]:
+        """Latest cached quote for a symbol (dictionary lookup, no gateway call)."""
+        return self._quotes.get(symbol)
+
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Optional[dict]]:
+        """Latest cached quotes for many symbols."""
+        return {symbol: self._quotes.get(symbol) for symbol in symbols}
+
+    def all_quotes(self) -> Dict[str, dict]:
+        """Every cached quote (symbols streaming for any reader)."""
+        return dict(self._quotes)
+
+    def is_subscribed(self, symbol: str) -> bool:
+        """Whether the symbol has a subscription on a live connection."""
+        return self._is_live(symbol)
+
+    def stats(self) -> dict:
+        """Subscription counters for monitoring."""
+        return {
+            "lines": len(self._subscriptions),
+            "max_lines": self.max_lines,
+            "active": sum(1 for s in self._subscriptions.values() if s.refcount > 0),
+            "idle": sum(1 for s in self._subscriptions.values() if s.refcount == 0),
+            "cached_quotes": len(self._quotes)
+        }
+
+    # ------------------------------------------------------------------
+    # Subscription lifecycle
+    # ------------------------------------------------------------------
+    async def acquire(self, ib: IB, symbols: List[str]) -> List[str]:
+        """
+        Take a reference on each symbol, subscribing the ones not yet streaming.
+
+        Missing contracts are qualified in one batch and subscribed on the
+        given connection. Symbols another reader is already subscribing are
+        waited on rather than requested twice; no lock is held while the
+        gateway qualifies contracts.
+
+        Returns:
+            list: Symbols that were acquired (unknown symbols are left out);
+                  pass the same list to release().
+        """
+        waiting = [self._pending[s] for s in symbols if s in self._pending]
+        missing = list(dict.fromkeys(s for s in symbols if s not in self._pending and not self._is_live(s)))
+        if missing:
+            done = asyncio.Event()
+            for symbol in missing:
+                self._pending[symbol] = done
+            try:
+                await self._subscribe(ib, missing)
+            finally:
+                for symbol in missing:
+                    self._pending.pop(symbol, None)
+                done.set()
+        for event in waiting:
+            await event.wait()
+
+        acquired = []
+        for symbol in symbols:
+            sub = self._subscriptions.get(symbol)
+            if not sub:
+                continue
+            sub.refcount += 1
+            if sub.release_handle:
+                sub.release_handle.cancel()
+                sub.release_handle = None
+            acquired.append(symbol)
+        return acquired
+
+    def release(self, symbols: List[str]):
+        """Drop a reference on each symbol; idle symbols expire after the grace period."""
+        loop = asyncio.get_running_loop()
+        for symbol in symbols:
+            sub = self._subscriptions.get(symbol)
+            if not sub or sub.refcount == 0:
+                continue
+            sub.refcount -= 1
+            if sub.refcount == 0:
+                sub.release_handle = loop.call_later(self.grace_period, self._expire, symbol)
+
+    @asynccontextmanager
+    async def subscribed(self, ib: IB, symbols: List[str]):
+        """Hold subscriptions on symbols for the duration of a block."""
+        acquired = await self.acquire(ib, symbols)
+        try:
+            yield acquired
+        finally:
+            self.release(acquired)
+
+    async def wait_for(self, symbols: List[str], timeout: float):
+        """Wait until the cached quotes for symbols are filled, or the deadline passes."""
+        tickers = [self._subscriptions[s].ticker for s in symbols if s in self._subscriptions]
+        await wait_for_tickers(tickers, timeout)
+
+    async def fetch_quotes(self, ib: IB, symbols: List[str], timeout: float) -> Dict[str, Optional[dict]]:
+        """
+        Get quotes for symbols through the shared subscriptions.
+
+        Cached symbols are returned immediately; new ones are subscribed
+        and waited on until filled or until the deadline.
+        """
+        async with self.subscribed(ib, symbols) as acquired:
+            await self.wait_for(acquired, timeout)
+            return self.get_quotes(symbols)
+
+    def close(self):
+        """Cancel every subscription (on shutdown)."""
+        for symbol in list(self._subscriptions):
+            self._unsubscribe(symbol)
+        self._quotes.clear()
+        for ib, handler in self._watched.values():
+            ib.disconnectedEvent -= handler
+        self._watched.clear()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _is_live(self, symbol: str) -> bool:
+        sub = self._subscriptions.get(symbol)
+        if sub and not sub.ib.isConnected():
+            self._unsubscribe(symbol)
+            return False
+        return sub is not None
+
+    async def _subscribe(self, ib: IB, symbols: List[str]):
+        keys = {symbol: contract_key(symbol) for symbol in symbols}
+        contracts = await contract_cache.resolve(ib, list(keys.values()))
+        found = [s for s in symbols if contracts.get(keys[s])]
+        self._make_room(len(found))
+        self._watch(ib)
+
+        created = []
+        try:
+            for symbol in found:
+                contract = contracts[keys[symbol]]
+                ticker = ib.reqMktData(contract, '', False, False)
+                sub = _Subscription(symbol, ib, contract, ticker)
+                sub.handler = self._make_handler(symbol)
+                ticker.updateEvent += sub.handler
+                self._subscriptions[symbol] = sub
+                created.append(symbol)
+
+                quote = ticker_to_quote(symbol, ticker)
+                if quote:
+                    self._quotes[symbol] = quote
+        except Exception:
+            # No reader holds these yet, so nothing would ever release them
+            for symbol in created:
+                self._unsubscribe(symbol)
+            raise
+
+    def _watch(self, ib: IB):
+        """Drop a connection's subscriptions when it disconnects (once per IB object)."""
+        if id(ib) in self._watched:
+            return
+
+        def on_disconnected():
+            for symbol in [s for s, sub in self._subscriptions.items() if sub.ib is ib]:
+                self._unsubscribe(symbol)
+
+        ib.disconnectedEvent += on_disconnected
+        self._watched[id(ib)] = (ib, on_disconnected)
+
+    def _make_handler(self, symbol: str):
+        def on_update(ticker: Ticker, *args):
+            quote = ticker_to_quote(symbol, ticker)
+            if quote:
+                self._quotes[symbol] = quote
+        return on_update
+
+    def _make_room(self, needed: int):
+        """Evict idle subscriptions until `needed` new lines fit."""
+        free = self.max_lines - len(self._subscriptions)
+        if free >= needed:
+            return
+        for symbol in [s for s, sub in self._subscriptions.items() if sub.refcount == 0]:
+            self._unsubscribe(symbol)
+            free += 1
+            if free >= needed:
+                return
+        raise MarketDataCapacityError(
+            f"Market data line limit reached ({self.max_lines} lines in use)"
+        )
+
+    def _expire(self, symbol: str):
+        sub = self._subscriptions.get(symbol)
+        if sub and sub.refcount == 0:
+            self._unsubscribe(symbol)
+
+    def _unsubscribe(self, symbol: str):
+        sub = self._subscriptions.pop(symbol, None)
+        if not sub:
+            return
+        if sub.release_handle:
+            sub.release_handle.cancel()
+        sub.ticker.updateEvent -= sub.handler
+        if sub.ib.isConnected():
+            sub.ib.cancelMktData(sub.contract)
+        self._quotes.pop(symbol, None)
+
+
+# Global singleton
+market_data_hub = MarketDataHub(
+    grace_period=settings.MARKET_DATA_GRACE_SECONDS,
+    max_lines=settings.MARKET_DATA_MAX_LINES
+)
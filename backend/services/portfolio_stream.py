@@ -0,0 +1,272 @@
+import asyncio
+import json
+from typing import Dict, List, Optional, Set, Tuple
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from backend.config import settings
+
+# Fields streamed for each position / account summary row
+POSITION_FIELDS = (
+    "broker_account_id", "symbol", "quantity", "avg_cost", "current_price",
+    "market_value", "unrealized_pnl", "realized_pnl"
+)
+SUMMARY_FIELDS = (
+    "broker_account_id", "total_cash", "net_liquidation", "equity_with_loan", "buying_power"
+)
+
+# ("position", broker_account_id, symbol) or ("summary", broker_account_id, None)
+RowKey = Tuple[str, int, Optional[str]]
+
+# Redis pub/sub channel carrying a user's published rows
+CHANNEL = "portfolio:{}"
+
+
+def position_row(obj) -> dict:
+    """Stream row for a Portfolio model or position dict."""
+    get = obj.get if isinstance(obj, dict) else lambda f: getattr(obj, f, None)
+    return {f: get(f) for f in POSITION_FIELDS}
+
+
+def summary_row(obj) -> dict:
+    """Stream row for an AccountSummary model or summary dict."""
+    get = obj.get if isinstance(obj, dict) else lambda f: getattr(obj, f, None)
+    return {f: get(f) for f in SUMMARY_FIELDS}
+
+
+class PortfolioStream:
+    """
+    Per-user fan-out of portfolio changes to live dashboards.
+
+    Publishers (sync, streaming updates) hand over the current rows for an
+    account. Rows go out on the user's Redis pub/sub channel, so syncs run
+    by an ARQ worker reach dashboards connected to any API process; each
+    API process subscribes to the channels of users it has dashboards for.
+    There the rows are diffed against what subscribers last saw, and only
+    changed or removed rows are queued. Changes are coalesced per row and
+    flushed to every subscriber of the user as one frame per interval, so
+    a burst of updates costs one message per changed row, not one per
+    update, and idle users cost nothing.
+
+    If Redis is unreachable, publishes reach this process's dashboards only.
+    """
+
+    def __init__(self, flush_interval: float = 0.25, queue_size: int = 100,
+                 redis: Optional[aioredis.Redis] = None):
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self._redis = redis
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}  # user_id -> queues
+        self._state: Dict[int, Dict[RowKey, dict]] = {}  # user_id -> last published rows
+        self._early: Dict[int, List[dict]] = {}  # user_id -> messages received before the baseline snapshot
+        self._pending: Dict[int, Dict[RowKey, Optional[dict]]] = {}  # user_id -> coalesced changes
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _client(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.Redis.from_url(settings.REDIS_URL)
+        return self._redis
+
+    # ------------------------------------------------------------------
+    # Subscribers
+    # ------------------------------------------------------------------
+    async def subscribe(self, user_id: int) -> asyncio.Queue:
+        """
+        Register a subscriber for user_id. Call before loading its snapshot,
+        then pass the snapshot to set_snapshot(): changes published while
+        it loads are kept and applied on top of it, not lost.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        first = user_id not in self._subscribers
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        if first:
+            self._early[user_id] = []
+            await self._listen_to(user_id)
+        return queue
+
+    def set_snapshot(self, user_id: int, positions: List[dict], summaries: List[dict], replace: bool = False):
+        """
+        Make the snapshot sent to the user's first subscriber the baseline
+        for diffs, then apply the changes received while it was loading.
+
+        With replace=True (a snapshot reloaded on resync) it also replaces
+        an existing baseline, which may have missed messages. A row changed
+        while the snapshot loaded may then be sent once more, but never lost.
+        """
+        if user_id not in self._subscribers or (user_id in self._state and not replace):
+            return
+        state = {("position", r["broker_account_id"], r["symbol"]): r for r in positions}
+        state.update({("summary", r["broker_account_id"], None): r for r in summaries})
+        self._state[user_id] = state
+        for message in self._early.pop(user_id, []):
+            self._apply(user_id, message)
+
+    async def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            # Nobody watching: drop diff state, the next subscriber sends a snapshot
+            del self._subscribers[user_id]
+            self._state.pop(user_id, None)
+            self._early.pop(user_id, None)
+            self._pending.pop(user_id, None)
+            if self._pubsub is not None:
+                try:
+                    await self._pubsub.unsubscribe(CHANNEL.format(user_id))
+                except RedisConnectionError:
+                    pass  # The listener drops the connection (and with it the channel)
+
+    def has_subscribers(self, user_id: int) -> bool:
+        return user_id in self._subscribers
+
+    # ------------------------------------------------------------------
+    # Publishers
+    # ------------------------------------------------------------------
+    async def publish_positions(self, user_id: int, broker_account_id: int, positions: List[dict],
+                                complete: bool = True):
+        """
+        Publish position rows for one broker account.
+
+        Args:
+            complete: positions is the full set for the account, so symbols
+                      missing from it are published as removed
+        """
+        rows = [position_row({**p, "broker_account_id": broker_account_id}) for p in positions]
+        await self._publish(user_id, {
+            "op": "positions", "broker_account_id": broker_account_id, "rows": rows, "complete": complete
+        })
+
+    async def publish_removed_positions(self, user_id: int, broker_account_id: int, symbols: List[str]):
+        """Publish that positions were closed (for incremental publishers)."""
+        if symbols:
+            await self._publish(user_id, {
+                "op": "removed", "broker_account_id": broker_account_id, "symbols": list(symbols)
+            })
+
+    async def publish_summary(self, user_id: int, broker_account_id: int, summary: dict):
+        """Publish the account summary row for one broker account."""
+        await self._publish(user_id, {
+            "op": "summary", "broker_account_id": broker_account_id,
+            "row": summary_row({**summary, "broker_account_id": broker_account_id})
+        })
+
+    async def _publish(self, user_id: int, message: dict):
+        try:
+            await self._client().publish(CHANNEL.format(user_id), json.dumps(message))
+        except RedisConnectionError:
+            # No fan-out: at least this process's dashboards get the change
+            self._apply(user_id, message)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    async def _listen_to(self, user_id: int):
+        try:
+            if self._pubsub is None:
+                self._pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(CHANNEL.format(user_id))
+        except RedisConnectionError as e:
+            print(f"⚠️ Portfolio fan-out unavailable ({e}); streaming this process's changes only")
+            return
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        """Apply messages from subscribed channels until no user is watched."""
+        while self._subscribers:
+            try:
+                if not self._pubsub.subscribed:
+                    await self._pubsub.subscribe(*[CHANNEL.format(u) for u in self._subscribers])
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        user_id = int(message["channel"].decode().rsplit(":", 1)[1])
+                        self._apply(user_id, json.loads(message["data"]))
+            except RedisConnectionError as e:
+                # Messages may have been lost: every dashboard reloads its snapshot
+                print(f"⚠️ Portfolio fan-out connection lost ({e}); resyncing dashboards")
+                for queues in self._subscribers.values():
+                    for queue in queues:
+                        self._send(queue, {"type": "resync"})
+                self._pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+                await asyncio.sleep(1.0)
+
+    def _apply(self, user_id: int, message: dict):
+        """Diff a published message against the user's baseline and queue the changes."""
+        if user_id not in self._subscribers:
+            return
+        if user_id not in self._state:
+            self._early[user_id].append(message)
+            return
+
+        state = self._state[user_id]
+        ba_id = message["broker_account_id"]
+        changes = {}
+        if message["op"] == "positions":
+            seen = set()
+            for row in message["rows"]:
+                key = ("position", ba_id, row["symbol"])
+                seen.add(key)
+                if state.get(key) != row:
+                    changes[key] = row
+            if message["complete"]:
+                for key in state:
+                    if key[0] == "position" and key[1] == ba_id and key not in seen:
+                        changes[key] = None
+        elif message["op"] == "removed":
+            keys = [("position", ba_id, symbol) for symbol in message["symbols"]]
+            changes = {key: None for key in keys if key in state}
+        elif message["op"] == "summary":
+            key = ("summary", ba_id, None)
+            if state.get(key) != message["row"]:
+                changes[key] = message["row"]
+        self._queue_changes(user_id, changes)
+
+    def _queue_changes(self, user_id: int, changes: Dict[RowKey, Optional[dict]]):
+        if not changes:
+            return
+
+        state = self._state[user_id]
+        for key, row in changes.items():
+            if row is None:
+                state.pop(key, None)
+            else:
+                state[key] = row
+        self._pending.setdefault(user_id, {}).update(changes)
+
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+
+        for user_id, changes in pending.items():
+            frame = {"type": "diff", "positions": [], "removed_positions": [], "summaries": []}
+            for (kind, ba_id, symbol), row in changes.items():
+                if kind == "summary":
+                    frame["summaries"].append(row)
+                elif row is None:
+                    frame["removed_positions"].append({"broker_account_id": ba_id, "symbol": symbol})
+                else:
+                    frame["positions"].append(row)
+
+            for queue in self._subscribers.get(user_id, ()):
+                self._send(queue, frame)
+
+    @staticmethod
+    def _send(queue: asyncio.Queue, frame: dict):
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Slow consumer: replace its backlog with a resync request
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "resync"})
+
+
+# Global singleton
+portfolio_stream = PortfolioStream(flush_interval=settings.PORTFOLIO_STREAM_FLUSH_MS / 1000)
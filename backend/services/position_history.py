@@ -0,0 +1,146 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import select, insert, exists, func, tuple_, literal_column
+from sqlalchemy.orm import Session
+from backend.models.positions_history import PositionHistory
+
+# PositionHistory column -> Portfolio column
+HISTORY_COLUMNS = {
+    "quantity": "quantity",
+    "market_price": "current_price",
+    "unrealized_pnl": "unrealized_pnl",
+    "realized_pnl": "realized_pnl",
+}
+
+
+def history_values(position) -> dict:
+    """History columns of a Portfolio row or position dict."""
+    get = position.get if isinstance(position, dict) else lambda c: getattr(position, c, None)
+    return {h: get(p) for h, p in HISTORY_COLUMNS.items()}
+
+
+def record_position_changes(db: Session, user_id: int, broker_account_id: int,
+                            before: Dict[str, object], after: Dict[str, object],
+                            removed: Iterable[str] = (), complete: bool = False) -> int:
+    """
+    Append history rows for positions whose quantity / price / PnL changed.
+
+    History is stored as deltas: a row per changed position, and a row with
+    quantity 0 when a position is closed, all in one bulk INSERT sharing the
+    transaction's timestamp. Unchanged positions write nothing, so the table
+    grows with trading activity, not with sync frequency. Caller commits.
+
+    Args:
+        before: symbol -> stored position (Portfolio row or dict) before the change
+        after: symbol -> new position values
+        removed: symbols whose positions were closed
+        complete: `after` is the account's full position set; if the account
+                  has no history yet, every position is written as a baseline
+
+    Returns:
+        int: number of history rows written
+    """
+    # user_id leads ix_poshist_user_ba_ts, so the probe is one index lookup
+    baseline = complete and not db.query(
+        exists().where(PositionHistory.user_id == user_id, PositionHistory.broker_account_id == broker_account_id)
+    ).scalar()
+
+    rows = []
+    for symbol, position in after.items():
+        values = history_values(position)
+        previous = before.get(symbol)
+        if baseline or previous is None or history_values(previous) != values:
+            rows.append({"symbol": symbol, **values})
+    for symbol in removed:
+        rows.append({"symbol": symbol, "quantity": 0.0, "market_price": None,
+                     "unrealized_pnl": None, "realized_pnl": None})
+
+    if rows:
+        db.execute(insert(PositionHistory), [
+            {"user_id": user_id, "broker_account_id": broker_account_id, **row} for row in rows
+        ])
+    return len(rows)
+
+
+def positions_at_query(user_id: int, at: datetime, broker_account_id: Optional[int] = None):
+    """
+    SELECT rebuilding the portfolio as of `at` from the history deltas:
+    the latest row per (account, symbol) at or before `at`, minus closed
+    positions. Works with both sync and async sessions.
+    """
+    filters = [PositionHistory.user_id == user_id, PositionHistory.ts <= at]
+    if broker_account_id is not None:
+        filters.append(PositionHistory.broker_account_id == broker_account_id)
+
+    ranked = select(
+        PositionHistory.broker_account_id,
+        PositionHistory.symbol,
+        PositionHistory.ts,
+        *[getattr(PositionHistory, c) for c in HISTORY_COLUMNS],
+        func.row_number().over(
+            partition_by=(PositionHistory.broker_account_id, PositionHistory.symbol),
+            order_by=(PositionHistory.ts.desc(), PositionHistory.id.desc())
+        ).label("rn")
+    ).where(*filters).subquery()
+
+    return (
+        select(*[c for c in ranked.c if c.name != "rn"])
+        .where(ranked.c.rn == 1, ranked.c.quantity != 0)
+        .order_by(ranked.c.broker_account_id, ranked.c.symbol)
+    )
+
+
+# API bucket -> Postgres date_trunc unit
+BUCKETS = {"1m": "minute", "1h": "hour", "1d": "day"}
+HISTORY_FIELDS = ("ts", "broker_account_id", "symbol", "quantity", "market_price", "unrealized_pnl", "realized_pnl")
+
+
+def history_buckets_query(user_id: int, bucket: str, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None, symbol: Optional[str] = None,
+                          broker_account_id: Optional[int] = None,
+                          after: Optional[Tuple[datetime, int, str]] = None, limit: int = 1000):
+    """
+    SELECT the last history row per (bucket, account, symbol), aggregated in SQL.
+
+    Uses DISTINCT ON over date_trunc(bucket, ts) so Postgres returns one
+    row per bucket straight off ix_poshist_user_ba_ts, and only plain
+    column tuples reach Python. History is change-only, so buckets without
+    a change are absent: a position keeps its last value until the next row.
+
+    Rows are ordered by (bucket, broker_account_id, symbol); `after` is the
+    last such key of the previous page (keyset pagination).
+    """
+    # Unit inlined (whitelisted) so DISTINCT ON / ORDER BY see identical expressions
+    bucket_ts = func.date_trunc(literal_column(f"'{BUCKETS[bucket]}'"), PositionHistory.ts).label("bucket")
+    filters = [PositionHistory.user_id == user_id]
+    if broker_account_id is not None:
+        filters.append(PositionHistory.broker_account_id == broker_account_id)
+    if symbol:
+        filters.append(PositionHistory.symbol == symbol)
+    if start is not None:
+        filters.append(PositionHistory.ts >= start)
+    if end is not None:
+        filters.append(PositionHistory.ts < end)
+    if after is not None:
+        # Buckets before the cursor's can be skipped before aggregating
+        filters.append(PositionHistory.ts >= after[0])
+
+    last_per_bucket = (
+        select(
+            bucket_ts,
+            PositionHistory.broker_account_id,
+            PositionHistory.symbol,
+            *[getattr(PositionHistory, c) for c in HISTORY_COLUMNS]
+        )
+        .where(*filters)
+        .distinct(bucket_ts, PositionHistory.broker_account_id, PositionHistory.symbol)
+        .order_by(bucket_ts, PositionHistory.broker_account_id, PositionHistory.symbol,
+                  PositionHistory.ts.desc(), PositionHistory.id.desc())
+        .subquery()
+    )
+
+    c = last_per_bucket.c
+    query = select(c.bucket.label("ts"), *[c[f] for f in HISTORY_FIELDS[1:]])
+    if after is not None:
+        query = query.where(tuple_(c.bucket, c.broker_account_id, c.symbol) > tuple_(*after))
+    return query.order_by(c.bucket, c.broker_account_id, c.symbol).limit(limit)
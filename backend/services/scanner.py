@@ -0,0 +1,158 @@
+import time
+from typing import Dict, List, Mapping, Optional, Tuple
+import numpy as np
+from ib_async import IB
+from backend.config import settings
+from backend.services.contract_cache import contract_cache, contract_key
+from backend.services.market_data_hub import market_data_hub, MarketDataCapacityError, MarketDataHub
+
+# Columns rules can filter and sort on
+SCAN_COLUMNS = ("price", "change_pct", "volume", "gap_pct")
+
+Bounds = Mapping[str, Tuple[Optional[float], Optional[float]]]
+
+
+def _column(quotes: List[dict], field: str) -> np.ndarray:
+    """One quote field as a float array; missing values are NaN."""
+    return np.fromiter(
+        (np.nan if q.get(field) is None else q[field] for q in quotes), dtype=float, count=len(quotes)
+    )
+
+
+class SnapshotTable:
+    """
+    Column-wise snapshot of the scanner universe.
+
+    change_pct and gap_pct are derived once per snapshot, so every scan is
+    only comparisons and a sort over contiguous arrays.
+    """
+
+    __slots__ = ("symbols", "columns", "built_at")
+
+    def __init__(self, symbols: np.ndarray, columns: Dict[str, np.ndarray], built_at: float = 0.0):
+        self.symbols = symbols
+        self.columns = columns
+        self.built_at = built_at
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    @classmethod
+    def from_quotes(cls, quotes: Mapping[str, Optional[dict]], built_at: float = 0.0) -> "SnapshotTable":
+        """Build from quote dicts (see ibkr_quotes.ticker_to_quote); symbols without a quote are left out."""
+        rows = [q for q in quotes.values() if q]
+        price = _column(rows, "last")
+        prev_close = _column(rows, "close")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change_pct = (price / prev_close - 1.0) * 100.0
+            gap_pct = (_column(rows, "open") / prev_close - 1.0) * 100.0
+        return cls(
+            np.array([q["symbol"] for q in rows], dtype=object),
+            {"price": price, "change_pct": change_pct, "volume": _column(rows, "volume"), "gap_pct": gap_pct},
+            built_at
+        )
+
+
+def scan(table: SnapshotTable, bounds: Bounds, sort_by: str = "change_pct",
+         descending: bool = True, limit: int = 50) -> List[dict]:
+    """
+    Evaluate filter rules over a snapshot in vectorized passes.
+
+    Args:
+        bounds: column -> (min, max); either side may be None. A row with no
+                value (NaN) for a filtered column never matches.
+        sort_by: column to rank by (rows without a value go last)
+
+    Returns:
+        list: matching rows (symbol, price, change_pct, volume, gap_pct)
+    """
+    mask = np.isfinite(table.columns["price"])
+    for column, (low, high) in bounds.items():
+        values = table.columns[column]
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+
+    matched = np.flatnonzero(mask)
+    key = table.columns[sort_by][matched]
+    ranked = matched[np.argsort(-key if descending else key, kind="stable")[:limit]]
+
+    rows = []
+    for i in ranked:
+        row = {"symbol": table.symbols[i]}
+        for column in SCAN_COLUMNS:
+            value = table.columns[column][i]
+            row[column] = None if np.isnan(value) else float(value)
+        rows.append(row)
+    return rows
+
+
+class MarketScanner:
+    """
+    Scans a symbol universe against user-defined rules without calling the
+    gateway per scan.
+
+    Quotes come from the shared market data hub: with an explicit universe
+    the scanner holds one hub reference per symbol (subscribed once and kept
+    streaming, within the account's market data lines); with an empty
+    universe it scans every symbol any reader is streaming. The quotes are
+    copied into a SnapshotTable at most once per refresh interval, and all
+    scans in between reuse it.
+
+    The universe holds its lines permanently, so it may not be larger than
+    the hub's market data line allowance; a larger one is refused when it
+    would be subscribed (see universe_error), not at import.
+    """
+
+    def __init__(self, universe: List[str], refresh_interval: float = 1.0,
+                 hub: Optional[MarketDataHub] = None):
+        self.hub = hub or market_data_hub
+        self.universe = universe
+        self.refresh_interval = refresh_interval
+        self._table: Optional[SnapshotTable] = None
+
+    def universe_error(self) -> Optional[str]:
+        """Why the universe can't be streamed, or None if it fits the market data lines."""
+        if len(self.universe) > self.hub.max_lines:
+            return (f"Scanner universe has {len(self.universe)} symbols but only {self.hub.max_lines} "
+                    f"market data lines are available (MARKET_DATA_MAX_LINES)")
+        return None
+
+    def missing(self) -> List[str]:
+        """
+        Universe symbols to subscribe: not streaming on a live connection
+        (first scan, or after a reconnect) and not known to be unqualifiable.
+        """
+        return [
+            s for s in self.universe
+            if not self.hub.is_subscribed(s) and not contract_cache.is_unknown(contract_key(s))
+        ]
+
+    async def ensure_subscribed(self, ib: IB):
+        """Subscribe the missing universe symbols."""
+        error = self.universe_error()
+        if error:
+            raise MarketDataCapacityError(error)
+        missing = self.missing()
+        if missing:
+            await self.hub.acquire(ib, missing)
+
+    def snapshot(self) -> SnapshotTable:
+        """The current snapshot, rebuilt from the hub's quote cache when older than the refresh interval."""
+        now = time.monotonic()
+        if self._table is None or now - self._table.built_at >= self.refresh_interval:
+            quotes = self.hub.get_quotes(self.universe) if self.universe else self.hub.all_quotes()
+            self._table = SnapshotTable.from_quotes(quotes, built_at=now)
+        return self._table
+
+    def scan(self, bounds: Bounds, sort_by: str = "change_pct", descending: bool = True,
+             limit: int = 50) -> List[dict]:
+        return scan(self.snapshot(), bounds, sort_by, descending, limit)
+
+
+# Global singleton
+market_scanner = MarketScanner(
+    universe=list(dict.fromkeys(s.strip().upper() for s in settings.SCANNER_UNIVERSE.split(",") if s.strip())),
+    refresh_interval=settings.SCANNER_REFRESH_SECONDS
+)
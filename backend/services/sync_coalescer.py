@@ -0,0 +1,118 @@
+import uuid
+from typing import Awaitable, Callable, Optional, TypeVar
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from backend.config import settings
+
+T = TypeVar("T")
+
+QUEUED_KEY = "sync:queued:{}"
+RUNNING_KEY = "sync:running:{}"
+RERUN_KEY = "sync:rerun:{}"
+
+
+class SyncCoalescer:
+    """
+    Per-broker-account single-flight for syncs, shared through Redis so it
+    holds across API processes, BackgroundTasks and ARQ workers.
+
+    - request(): a sync asked for while one is already queued merges into
+      it; only the first request should actually schedule a run.
+    - run(): executes the sync under a per-account lock. A run that finds
+      another one in progress sets a "rerun once" flag and exits; the
+      running one repeats itself once when it finishes, so any number of
+      overlapping requests cost at most one extra sync.
+
+    If Redis is unreachable, requests are scheduled and run directly (the
+    pre-coalescing behaviour) rather than failing.
+
+    Usage:
+        if await sync_coalescer.request(account_id) == "scheduled":
+            background_tasks.add_task(sync_coalescer.run, account_id, lambda: sync(...))
+    """
+
+    def __init__(self, ttl: int = 300, redis: Optional[aioredis.Redis] = None):
+        self.ttl = ttl
+        self._redis = redis
+
+    def _client(self) -> aioredis.Redis:
+        if self._redis is None:
+            self._redis = aioredis.Redis.from_url(settings.REDIS_URL)
+        return self._redis
+
+    async def request(self, broker_account_id: int) -> str:
+        """
+        Register a sync request.
+
+        Returns:
+            "scheduled" if the caller should schedule a run,
+            "merged" if a queued run will cover it
+        """
+        try:
+            created = await self._client().set(
+                QUEUED_KEY.format(broker_account_id), 1, nx=True, ex=self.ttl
+            )
+        except RedisConnectionError as e:
+            print(f"⚠️ Sync coalescing unavailable ({e}); scheduling directly")
+            return "scheduled"
+        return "scheduled" if created else "merged"
+
+    async def cancel(self, broker_account_id: int):
+        """Withdraw a scheduled request that won't run, so the next one schedules again."""
+        try:
+            await self._client().delete(QUEUED_KEY.format(broker_account_id))
+        except RedisConnectionError as e:
+            print(f"⚠️ Sync coalescing unavailable ({e}); queued marker expires in {self.ttl}s")
+
+    async def refresh(self, broker_account_id: int):
+        """Keep a scheduled request marked queued for another ttl (e.g. its job was deferred)."""
+        try:
+            await self._client().set(QUEUED_KEY.format(broker_account_id), 1, ex=self.ttl)
+        except RedisConnectionError as e:
+            print(f"⚠️ Sync coalescing unavailable ({e}); queued marker expires in {self.ttl}s")
+
+    async def run(self, broker_account_id: int, sync: Callable[[], Awaitable[T]]) -> Optional[T]:
+        """
+        Run `sync` unless another run for the account is in progress.
+
+        Returns:
+            The result of the last run, or None if the sync was handed to
+            the run already in progress.
+        """
+        redis = self._client()
+        rerun_key = RERUN_KEY.format(broker_account_id)
+        try:
+            lock = redis.lock(RUNNING_KEY.format(broker_account_id), timeout=self.ttl, blocking=False)
+            acquired = await lock.acquire(token=uuid.uuid4().hex)
+            # New requests from here on must schedule (and flag) a fresh run
+            await redis.delete(QUEUED_KEY.format(broker_account_id))
+        except RedisConnectionError as e:
+            print(f"⚠️ Sync coalescing unavailable ({e}); running directly")
+            return await sync()
+
+        if not acquired:
+            await redis.set(rerun_key, 1, ex=self.ttl)
+            # The other run may have finished before seeing the flag
+            if not await lock.acquire(token=uuid.uuid4().hex):
+                print(f"⏭️ Sync for broker account {broker_account_id} already running; rerun flagged")
+                return None
+            await redis.delete(rerun_key)
+
+        while True:
+            try:
+                result = await sync()
+            except Exception:
+                await lock.release()
+                raise
+            if await redis.getdel(rerun_key):
+                await lock.reacquire()
+                continue
+
+            await lock.release()
+            # A request may have flagged a rerun between the check and the
+            # release; take the lock back for it unless a new run already has
+            if not await redis.getdel(rerun_key) or not await lock.acquire(token=uuid.uuid4().hex):
+                return result
+
+
+sync_coalescer = SyncCoalescer(ttl=settings.SYNC_COALESCE_TTL_SECONDS)
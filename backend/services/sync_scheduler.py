@@ -0,0 +1,86 @@
+import math
+from datetime import datetime, time as dtime
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from sqlalchemy import select
+from backend.config import settings
+from backend.models.broker_account import BrokerAccount
+
+# US equities session times (exchange holidays are treated as regular days)
+MARKET_TZ = ZoneInfo("America/New_York")
+PRE_MARKET_OPEN = dtime(4, 0)
+REGULAR_OPEN = dtime(9, 30)
+REGULAR_CLOSE = dtime(16, 0)
+AFTER_HOURS_CLOSE = dtime(20, 0)
+
+# How often the scheduler cron runs (every minute)
+TICK_SECONDS = 60
+
+
+def market_session(now: datetime) -> str:
+    """'open', 'extended' (pre-market / after-hours) or 'closed' at an aware datetime."""
+    local = now.astimezone(MARKET_TZ)
+    if local.weekday() >= 5:
+        return "closed"
+    t = local.time()
+    if REGULAR_OPEN <= t < REGULAR_CLOSE:
+        return "open"
+    if PRE_MARKET_OPEN <= t < AFTER_HOURS_CLOSE:
+        return "extended"
+    return "closed"
+
+
+def sync_interval(now: datetime) -> int:
+    """Seconds between periodic syncs of one account at this time."""
+    return {
+        "open": settings.SYNC_INTERVAL_OPEN_SECONDS,
+        "extended": settings.SYNC_INTERVAL_EXTENDED_SECONDS,
+        "closed": settings.SYNC_INTERVAL_CLOSED_SECONDS,
+    }[market_session(now)]
+
+
+def account_phase(broker_account_id: int, interval: int) -> float:
+    """
+    Stable offset of an account within the interval.
+
+    Multiplicative hashing spreads consecutive ids evenly, so N accounts
+    fire at ~interval/N spacing instead of all on the same tick.
+    """
+    return ((broker_account_id * 2654435761) % 2 ** 32) / 2 ** 32 * interval
+
+
+def due_slot(broker_account_id: int, interval: int, tick_at: float, tick: int = TICK_SECONDS) -> Optional[int]:
+    """
+    Return the slot an account is due for in the tick ending at `tick_at`
+    (epoch seconds), or None if it isn't due. The slot (its start, in epoch
+    seconds) goes into the job id, so a re-run tick can't enqueue the same
+    sync twice.
+    """
+    phase = account_phase(broker_account_id, interval)
+    slot = math.floor((tick_at - phase) / interval)
+    previous = math.floor((tick_at - tick - phase) / interval)
+    return slot * interval if slot != previous else None
+
+
+def gateway_key(conn_host: Optional[str], conn_port: Optional[int]) -> str:
+    """Identify the TWS / IB Gateway an account connects through."""
+    return f"{conn_host or settings.IBKR_DEFAULT_HOST}:{conn_port or settings.IBKR_DEFAULT_PORT}"
+
+
+def due_accounts(db, now: datetime) -> List[Tuple[int, int, int]]:
+    """
+    (broker_account_id, user_id, slot) for every active account due in the
+    tick ending at `now`.
+    """
+    interval = sync_interval(now)
+    tick_at = now.replace(second=0, microsecond=0).timestamp()
+    rows = db.execute(
+        select(BrokerAccount.id, BrokerAccount.user_id).where(BrokerAccount.status == "active")
+    ).all()
+
+    due = []
+    for broker_account_id, user_id in rows:
+        slot = due_slot(broker_account_id, interval, tick_at)
+        if slot is not None:
+            due.append((broker_account_id, user_id, slot))
+    return due
@@ -0,0 +1,67 @@
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import select, func, tuple_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.models.trade import Trade
+
+# API side -> stored values (IB executions report BOT / SLD)
+SIDE_VALUES = {"BUY": ("BUY", "BOT"), "SELL": ("SELL", "SLD")}
+
+
+def trades_filter(user_id: int, broker_account_id: Optional[int] = None, symbol: Optional[str] = None,
+                  side: Optional[str] = None, start: Optional[datetime] = None,
+                  end: Optional[datetime] = None) -> list:
+    """WHERE clauses of the trades listing."""
+    filters = [Trade.user_id == user_id]
+    if broker_account_id is not None:
+        filters.append(Trade.broker_account_id == broker_account_id)
+    if symbol:
+        filters.append(Trade.symbol == symbol)
+    if side:
+        filters.append(Trade.side.in_(SIDE_VALUES[side]))
+    if start is not None:
+        filters.append(Trade.trade_time >= start)
+    if end is not None:
+        filters.append(Trade.trade_time < end)
+    return filters
+
+
+def trades_page_query(filters: list, after: Optional[Tuple[datetime, int]] = None,
+                      descending: bool = True, limit: int = 100):
+    """
+    SELECT one page of trades ordered by (trade_time, id).
+
+    Keyset pagination: `after` is the (trade_time, id) of the previous
+    page's last row and becomes a row-value comparison, so the index scan
+    starts right at the cursor and a deep page costs the same as the first.
+    """
+    query = select(Trade).where(*filters)
+    if after is not None:
+        key = tuple_(Trade.trade_time, Trade.id)
+        cursor = tuple_(*after, types=(Trade.trade_time.type, Trade.id.type))
+        query = query.where(key < cursor if descending else key > cursor)
+    if descending:
+        query = query.order_by(Trade.trade_time.desc(), Trade.id.desc())
+    else:
+        query = query.order_by(Trade.trade_time, Trade.id)
+    return query.limit(limit)
+
+
+async def estimate_count(db: AsyncSession, filters: list) -> int:
+    """
+    Approximate number of trades matching `filters`.
+
+    On Postgres this is the planner's row estimate (EXPLAIN, no scan), so
+    it stays cheap for any history size; other databases count exactly.
+    """
+    query = select(Trade.id).where(*filters)
+    dialect = db.get_bind().dialect
+    if dialect.name != "postgresql":
+        return (await db.execute(select(func.count()).select_from(query.subquery()))).scalar_one()
+
+    sql = query.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    plan = (await db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,27 @@
+"""
+One-off backfill of the daily_pnl rollup from existing trades.
+Trade ingestion keeps the rollup current afterwards; rerunning is safe
+(rows are upserted).
+
+Usage:
+    python -m backend.tasks.backfill_daily_pnl
+    python -m backend.tasks.backfill_daily_pnl --broker-account-id 42
+"""
+import argparse
+from backend.db import Session as SessionLocal
+from backend.services.daily_pnl import backfill_daily_pnl
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--broker-account-id", type=int, default=None)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        rows = backfill_daily_pnl(db, args.broker_account_id)
+        db.commit()
+    print(f"✅ daily_pnl backfilled: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Rebuild an account's open lots and matched journal entries from its full
+trade history. Needed once for accounts that had trades before lot
+matching existed, or after changing the matching method; new trades are
+matched incrementally during sync afterwards.
+
+Usage:
+    python -m backend.tasks.rebuild_journal --broker-account-id 42
+    python -m backend.tasks.rebuild_journal --broker-account-id 42 --method lifo
+    python -m backend.tasks.rebuild_journal --broker-account-id 42 --method specific --selections lots.json
+
+lots.json maps a closing exec_id to the opening exec_ids it should close first:
+    {"0000e0d5.6578f1a2.01.01": ["0000e0d5.6571aa10.01.01"]}
+"""
+import argparse
+import json
+from sqlalchemy import select
+from backend.db import Session as SessionLocal
+from backend.models.broker_account import BrokerAccount
+from backend.models.trade import Trade
+from backend.services.lot_matching import METHODS, rebuild_lots
+
+
+def load_selections(db, broker_account_id: int, path: str) -> dict:
+    """Closing exec_id -> opening trade ids, from a file keyed by exec_ids."""
+    with open(path) as f:
+        by_exec_id = json.load(f)
+    trade_ids = dict(db.execute(
+        select(Trade.exec_id, Trade.id).where(Trade.broker_account_id == broker_account_id)
+    ).all())
+    return {
+        closing: [trade_ids[e] for e in opening if e in trade_ids]
+        for closing, opening in by_exec_id.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--broker-account-id", type=int, required=True)
+    parser.add_argument("--method", choices=METHODS, default=None)
+    parser.add_argument("--selections", default=None)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        broker_account = db.get(BrokerAccount, args.broker_account_id)
+        if broker_account is None:
+            parser.error(f"broker account {args.broker_account_id} not found")
+        selections = load_selections(db, args.broker_account_id, args.selections) if args.selections else None
+        entries = rebuild_lots(db, broker_account.user_id, args.broker_account_id, args.method, selections)
+        db.commit()
+    print(f"✅ Journal rebuilt for broker account {args.broker_account_id}: {entries} round trips")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,177 @@
-from arq import create_pool
-from arq.connections import RedisSettings
+from arq import create_pool, cron
+from arq.connections import RedisSettings, ArqRedis
+from arq.worker import func
 from backend.config import settings
+from datetime import datetime, timezone
+from typing import Optional
 import asyncio
+import random
+import time
+import uuid
+
+
+# ============================================
+# Per-gateway concurrency (shared by all worker processes via Redis)
+# ============================================
+GATEWAY_SLOT_KEY = "sync:gateway:{}"
+
+
+async def acquire_gateway_slot(redis: ArqRedis, gateway: str, lease: str) -> bool:
+    """
+    Take one of SYNC_GATEWAY_MAX_CONCURRENCY slots for a gateway, or return False.
+
+    Slots are leases in a sorted set scored by their expiry, so a slot
+    leaked by a crashed worker frees itself after job_timeout even while
+    the gateway stays busy.
+    """
+    key = GATEWAY_SLOT_KEY.format(gateway)
+    now = time.time()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zadd(key, {lease: now + WorkerSettings.job_timeout})
+        pipe.zcard(key)
+        pipe.expire(key, WorkerSettings.job_timeout)
+        _, _, count, _ = await pipe.execute()
+    if count > settings.SYNC_GATEWAY_MAX_CONCURRENCY:
+        await redis.zrem(key, lease)
+        return False
+    return True
+
+
+async def release_gateway_slot(redis: ArqRedis, gateway: str, lease: str):
+    await redis.zrem(GATEWAY_SLOT_KEY.format(gateway), lease)
+
+
+def _load_gateway(broker_account_id: int) -> Optional[str]:
+    from backend.db import get_worker_sessionmaker
+    from backend.models.broker_account import BrokerAccount
+    from backend.services.sync_scheduler import gateway_key
+    with get_worker_sessionmaker()() as db:
+        account = db.get(BrokerAccount, broker_account_id)
+        return gateway_key(account.conn_host, account.conn_port) if account else None
+
+
+async def sync_broker_task(ctx, broker_account_id: int, user_id: int, deferrals: int = 0):
+    """
+    ARQ task for syncing broker data. Returns the sync result (counts and stage timings).
+    If the account's gateway already runs SYNC_GATEWAY_MAX_CONCURRENCY syncs,
+    the sync is re-enqueued on the same queue after a jittered backoff, up to
+    SYNC_GATEWAY_MAX_DEFERRALS times (a busy gateway doesn't use up the job's
+    max_tries). If a sync for the account is already running, it is flagged
+    to rerun once instead. A job that won't run clears the account's queued
+    marker so the next request schedules a fresh sync.
+    """
+    from dataclasses import asdict
+    from backend.db import get_worker_sessionmaker
+    from backend.services.ibkr_sync import sync_broker_data_coalesced
+    from backend.services.sync_coalescer import sync_coalescer
+
+    gateway = await asyncio.to_thread(_load_gateway, broker_account_id)
+    if gateway is None:
+        await sync_coalescer.cancel(broker_account_id)
+        return {"broker_account_id": broker_account_id, "status": "skipped", "error": "Broker account not found"}
+
+    redis = ctx["redis"]
+    lease = ctx.get("job_id") or uuid.uuid4().hex
+    if not await acquire_gateway_slot(redis, gateway, lease):
+        if deferrals >= settings.SYNC_GATEWAY_MAX_DEFERRALS:
+            print(f"⚠️ Gateway {gateway} busy, giving up on sync of broker account {broker_account_id} "
+                  f"after {deferrals} deferrals")
+            await sync_coalescer.cancel(broker_account_id)
+            return {"broker_account_id": broker_account_id, "status": "skipped", "error": "Gateway busy"}
+        # The worker's pool enqueues on the worker's own queue (priority lane stays priority)
+        await redis.enqueue_job(
+            "sync_broker_task", broker_account_id, user_id, deferrals=deferrals + 1,
+            _defer_by=random.uniform(1, settings.SYNC_GATEWAY_RETRY_SECONDS)
+        )
+        await sync_coalescer.refresh(broker_account_id)
+        return {"broker_account_id": broker_account_id, "status": "deferred", "deferrals": deferrals + 1}
+    try:
+        result = await sync_broker_data_coalesced(broker_account_id, user_id, session_factory=get_worker_sessionmaker())
+    finally:
+        await release_gateway_slot(redis, gateway, lease)
+    if result is None:
+        return {"broker_account_id": broker_account_id, "status": "coalesced"}
+    return asdict(result)
+
+
+# ============================================
+# Periodic scheduler (cron, every minute)
+# ============================================
+async def schedule_syncs(ctx):
+    """
+    Enqueue sync_broker_task for every active account due this tick.
+    Each account has a stable phase within the interval (see
+    sync_scheduler.due_slot) plus random jitter within the tick, so the
+    fleet is spread evenly instead of firing at once. The interval follows
+    US market hours.
+    """
+    from backend.db import get_worker_sessionmaker
+    from backend.services.sync_scheduler import due_accounts, TICK_SECONDS
+    from backend.services.sync_coalescer import sync_coalescer
+
+    def load():
+        with get_worker_sessionmaker()() as db:
+            return due_accounts(db, datetime.now(timezone.utc))
+
+    due = await asyncio.to_thread(load)
+    redis = ctx["redis"]
+    enqueued = 0
+    for broker_account_id, user_id, slot in due:
+        # Skip accounts that already have a sync queued (user-triggered or a slow earlier slot)
+        if await sync_coalescer.request(broker_account_id) == "merged":
+            continue
+        job = await redis.enqueue_job(
+            "sync_broker_task", broker_account_id, user_id,
+            _job_id=f"scheduled-sync:{broker_account_id}:{slot}",
+            _defer_by=random.uniform(0, TICK_SECONDS)
+        )
+        if job is None:
+            # This slot's job already exists (e.g. the cron tick ran twice)
+            await sync_coalescer.cancel(broker_account_id)
+            continue
+        enqueued += 1
+    return {"due": len(due), "enqueued": enqueued}
+
+
+# ============================================
+# Enqueueing from the API (user-triggered syncs)
+# ============================================
+_queue: Optional[ArqRedis] = None
+
+
+async def get_queue() -> ArqRedis:
+    """ARQ Redis pool for enqueueing from the API process (created on first use)."""
+    global _queue
+    if _queue is None:
+        _queue = await create_pool(RedisSettings.from_dsn(settings.REDIS_URL))
+    return _queue
+
+
+async def enqueue_user_sync(broker_account_id: int, user_id: int):
+    """Enqueue a user-triggered sync on the priority lane (after sync_coalescer.request())."""
+    queue = await get_queue()
+    return await queue.enqueue_job(
+        "sync_broker_task", broker_account_id, user_id,
+        _queue_name=settings.SYNC_PRIORITY_QUEUE
+    )
 
-async def sync_broker_task(ctx, broker_account_id: int, user_id: int):
-    """ARQ task for syncing broker data."""
-    from backend.services.ibkr_sync import sync_broker_data
-    await sync_broker_data(broker_account_id, user_id)
 
 class WorkerSettings:
+    """Default worker: periodic syncs and the scheduler cron."""
     redis_settings = RedisSettings.from_dsn(settings.REDIS_URL)
-    functions = [sync_broker_task]
+    functions = [func(sync_broker_task, max_tries=settings.SYNC_MAX_TRIES)]
+    cron_jobs = [cron(schedule_syncs, second=0)]
     max_jobs = 10
-    job_timeout = 300  # 5 minutes
\ No newline at end of file
+    job_timeout = 300  # 5 minutes
+
+
+class PriorityWorkerSettings(WorkerSettings):
+    """
+    Worker for user-triggered syncs, so they never wait behind the periodic
+    backlog. Run alongside the default worker:
+        arq backend.tasks.worker.PriorityWorkerSettings
+    """
+    queue_name = settings.SYNC_PRIORITY_QUEUE
+    cron_jobs = []
+    max_jobs = 5
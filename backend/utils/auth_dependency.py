@@ -5,43 +5,136 @@ Extracts and validates JWT tokens from Authorization header.
 
 Usage in routes:
     @router.get("/portfolio")
-    def get_portfolio(user: User = Depends(get_current_user)):
-        # user is authenticated
+    async def get_portfolio(user: CurrentUser = Depends(get_current_identity)):
+        # id / username / role only, served from cache without a DB query
         pass
 """
 
+import asyncio
+from dataclasses import dataclass
+from typing import Iterable, Optional
+import redis
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBearer, HTTPAuthCredentials
-from sqlalchemy.orm import Session
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 from backend.utils.jwt_handler import verify_access_token
-from backend.db import get_db
+from backend.db import get_async_db
 from backend.models.user import User
+from backend.config import settings
+from backend.utils.cache import TTLCache
 
 # HTTPBearer automatically extracts "Bearer <token>" from Authorization header
 security = HTTPBearer()
 
 
-def get_current_user(
-    credentials: HTTPAuthCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+@dataclass(frozen=True)
+class CurrentUser:
+    """Identity of the authenticated user, as cached by get_current_identity."""
+    id: int
+    username: str
+    role: str
+
+
+# token subject (username) -> CurrentUser
+_identity_cache = TTLCache(
+    maxsize=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_CACHE_TTL_SECONDS
+)
+
+# Redis pub/sub channel carrying usernames whose cached identity is stale
+INVALIDATION_CHANNEL = "auth:invalidate"
+
+_publisher: Optional[redis.Redis] = None
+
+
+def invalidate_user(username: str):
+    """Drop a user's cached identity (call when the user is changed or deleted)."""
+    _identity_cache.pop(username)
+
+
+def identity_cache_stats() -> dict:
+    """Hit/miss counters of the identity cache."""
+    return _identity_cache.stats()
+
+
+def publish_invalidations(usernames: Iterable[str]):
     """
-    Dependency that validates JWT token and returns the authenticated user.
+    Tell every API process to drop these cached identities. Without Redis
+    other processes serve them until AUTH_CACHE_TTL_SECONDS passes.
+    """
+    global _publisher
+    try:
+        if _publisher is None:
+            _publisher = redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1)
+        for username in usernames:
+            _publisher.publish(INVALIDATION_CHANNEL, username)
+    except RedisConnectionError as e:
+        print(f"⚠️ Identity invalidation not published ({e}); other processes expire it "
+              f"within {settings.AUTH_CACHE_TTL_SECONDS}s")
 
-    Args:
-        credentials: HTTP Bearer token from Authorization header
-        db: Database session
 
-    Returns:
-        User: Authenticated user object
+async def listen_for_invalidations(client: Optional[aioredis.Redis] = None):
+    """
+    Apply invalidations published by any process (runs for the API's
+    lifetime). After a lost connection the whole cache is dropped, since
+    messages may have been missed.
+    """
+    client = client or aioredis.Redis.from_url(settings.REDIS_URL)
+    while True:
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    invalidate_user(message["data"].decode())
+        except RedisConnectionError as e:
+            print(f"⚠️ Identity invalidations unavailable ({e}); cached identities expire "
+                  f"within {settings.AUTH_CACHE_TTL_SECONDS}s")
+            _identity_cache.clear()
+            await asyncio.sleep(5.0)
 
-    Raises:
-        HTTPException 401: If token is invalid or expired
-        HTTPException 404: If user not found in database
+
+@event.listens_for(User.username, "set", active_history=True)
+def _load_old_username(target: User, value, oldvalue, initiator):
+    """Load the old name on a rename of an expired row, so its cache entry is invalidated too."""
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target: User):
+    """
+    Invalidate on ORM updates/deletes, including the old name on a rename.
+    This process drops them at once; other processes are told after the
+    commit, so they can't reload the old row in between.
     """
-    token = credentials.credentials
+    usernames = {target.username, *(inspect(target).attrs.username.history.deleted or ())}
+    for username in usernames:
+        invalidate_user(username)
+    session = object_session(target)
+    if session is None:
+        publish_invalidations(usernames)
+    else:
+        session.info.setdefault("invalidated_users", set()).update(usernames)
 
-    # Verify token
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_invalidations(session: Session):
+    usernames = session.info.pop("invalidated_users", None)
+    if usernames:
+        publish_invalidations(usernames)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_invalidations(session: Session):
+    session.info.pop("invalidated_users", None)
+
+
+def _username_from_token(token: str) -> str:
+    """Verify JWT and return its subject, or raise 401."""
     payload = verify_access_token(token)
     if not payload:
         raise HTTPException(
@@ -57,13 +150,48 @@ def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token payload invalid"
         )
+    return username
 
-    # Fetch user from database
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
 
-    return user
+def _user_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="User not found"
+    )
+
+
+async def get_current_identity(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> CurrentUser:
+    """
+    Dependency for endpoints that only need the user's id / username / role.
+
+    The token is still verified on every request, but the user lookup is
+    served from a bounded TTL cache, so cache hits never touch the database
+    (the session is only connected on a miss). Entries are invalidated in
+    every API process when the User row is updated or deleted through the
+    ORM (over Redis pub/sub), and otherwise expire after
+    AUTH_CACHE_TTL_SECONDS, which bounds staleness for changes made
+    outside the ORM or while Redis is down.
+
+    Raises:
+        HTTPException 401: If token is invalid or expired
+        HTTPException 404: If user not found in database
+    """
+    username = _username_from_token(credentials.credentials)
+
+    identity = _identity_cache.get(username)
+    if identity is not None:
+        return identity
+
+    result = await db.execute(
+        select(User.id, User.username, User.role).where(User.username == username)
+    )
+    row = result.first()
+    if not row:
+        raise _user_not_found()
+
+    identity = CurrentUser(id=row.id, username=row.username, role=row.role)
+    _identity_cache.set(username, identity)
+    return identity
@@ -1,7 +1,10 @@
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
+import hashlib
 import os
 from dotenv import load_dotenv
+from backend.config import settings
+from backend.utils.cache import TTLCache
 
 load_dotenv()
 
@@ -18,10 +21,39 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# cache של טוקנים מאומתים: sha256(token) -> payload, כל רשומה פגה בדיוק ב־exp של הטוקן
+_token_cache = TTLCache(maxsize=settings.JWT_CACHE_MAX_ENTRIES)
+
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
 # אימות טוקן שמגיע מהלקוח
 def verify_access_token(token: str):
+    """
+    Verify a token and return its payload, or None if invalid/expired.
+
+    Successful decodes are cached until the token's own `exp`, so repeat
+    requests with the same token skip the signature check. Invalid tokens
+    are never cached.
+    """
+    digest = _token_digest(token)
+    payload = _token_cache.get(digest)
+    if payload is not None:
+        return dict(payload)
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload  # מחזיר את הנתונים שהיו בטוקן
     except JWTError:
         return None
+
+    # בלי exp אין מתי לפוג – לא שומרים
+    if isinstance(payload.get("exp"), (int, float)):
+        _token_cache.set(digest, payload, expires_at=payload["exp"])
+    return dict(payload)  # מחזיר את הנתונים שהיו בטוקן
+
+
+def token_cache_stats() -> dict:
+    """Hit/miss counters of the verified-token cache."""
+    return _token_cache.stats()
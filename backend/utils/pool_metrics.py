@@ -0,0 +1,82 @@
+import time
+from threading import Lock
+from typing import Dict
+from sqlalchemy import exc
+from sqlalchemy.pool import Pool
+
+
+class PoolMetrics:
+    """Checkout wait-time and timeout counters for one connection pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = Lock()
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / attempts * 1000, 3) if attempts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3)
+            }
+
+
+def timed_pool_class(base: type, metrics: PoolMetrics) -> type:
+    """
+    Subclass a SQLAlchemy pool class so every checkout records how long it
+    waited for a connection. The metrics live on the class, so they survive
+    pool.recreate() on engine.dispose().
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = base._do_get(self)
+        except exc.TimeoutError:
+            metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        metrics.record_wait(time.perf_counter() - start)
+        return conn
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get, "metrics": metrics})
+
+
+# name -> engine, for the metrics endpoint
+_engines: Dict[str, object] = {}
+
+
+def register_engine(name: str, engine):
+    _engines[name] = engine
+
+
+def pool_status() -> Dict[str, dict]:
+    """Gauges and wait counters for every registered pool."""
+    status = {}
+    for name, engine in _engines.items():
+        pool: Pool = getattr(engine, "sync_engine", engine).pool
+        info = {"pool_class": type(pool).__name__}
+        for gauge in ("size", "checkedin", "checkedout", "overflow"):
+            # QueuePool gauges are methods; other pools may lack them or use plain attributes
+            value = getattr(pool, gauge, None)
+            if callable(value):
+                info[gauge] = value()
+        metrics = getattr(pool, "metrics", None)
+        if metrics:
+            info.update(metrics.snapshot())
+        status[name] = info
+    return status
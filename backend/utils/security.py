@@ -1,12 +1,27 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
 from passlib.context import CryptContext
+from backend.config import settings
 
-# קונטקסט הצפנה עם bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# קונטקסט הצפנה עם bcrypt (העלות נקבעת ב־BCRYPT_ROUNDS)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
+# Pool קבוע ל־bcrypt: הספרייה משחררת את ה־GIL, כך שה־threads רצים במקביל
+# וה־event loop לא נחסם בזמן hash/verify
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="bcrypt"
+)
 
-from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def _truncate(plain_password: str) -> str:
+    """bcrypt uses only the first 72 bytes; trim so long passwords don't raise."""
+    encoded = plain_password.encode("utf-8")
+    if len(encoded) > 72:
+        return encoded[:72].decode("utf-8", errors="ignore")
+    return plain_password
+
 
 def hash_password(plain_password: str) -> str:
     """
@@ -16,25 +31,12 @@ def hash_password(plain_password: str) -> str:
     if not plain_password:
         raise ValueError("Password cannot be empty.")
 
-    encoded = plain_password.encode("utf-8")
-    print(f"🔍 DEBUG: Original password length (bytes): {len(encoded)}")
-
-    # אם ארוכה מדי, נחתוך
-    if len(encoded) > 72:
-        encoded = encoded[:72]
-        plain_password = encoded.decode("utf-8", errors="ignore")
-        print(f"✂️ DEBUG: Trimmed password length (bytes): {len(encoded)}")
-
     try:
-        hashed = pwd_context.hash(plain_password)
-        print(f"✅ DEBUG: Successfully hashed password of length {len(plain_password.encode('utf-8'))} bytes")
-        return hashed
+        return pwd_context.hash(_truncate(plain_password))
     except Exception as e:
-        print(f"❌ DEBUG: Hash failed with password length {len(plain_password.encode('utf-8'))}")
         raise ValueError(f"Failed to hash password: {e}")
 
 
-
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     בודקת אם סיסמה רגילה תואמת ל-hash ששמור במסד.
@@ -42,12 +44,38 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     if not plain_password or not hashed_password:
         return False
 
-    # במידה והסיסמה ארוכה מדי – נחתוך גם כאן
-    if len(plain_password.encode("utf-8")) > 72:
-        plain_password = plain_password[:72]
-
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return pwd_context.verify(_truncate(plain_password), hashed_password)
     except Exception:
         return False
 
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and, if its hash was made with an outdated cost,
+    return a fresh hash at the current BCRYPT_ROUNDS.
+
+    Returns:
+        tuple: (valid, new_hash) — new_hash is None when no rehash is needed
+    """
+    if not plain_password or not hashed_password:
+        return False, None
+
+    try:
+        return pwd_context.verify_and_update(_truncate(plain_password), hashed_password)
+    except Exception:
+        return False, None
+
+
+async def hash_password_async(plain_password: str) -> str:
+    """hash_password on the bcrypt pool, without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, hash_password, plain_password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """verify_and_update_password on the bcrypt pool, without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _hash_executor, verify_and_update_password, plain_password, hashed_password
+    )
@@ -5,7 +5,7 @@ This file is automatically loaded by pytest.
 import pytest
 import sys
 from pathlib import Path
-from unittest.mock import Mock
+from unittest.mock import Mock, AsyncMock
 
 # Add backend to Python path
 backend_path = Path(__file__).parent.parent / "backend"
@@ -146,6 +146,68 @@ def mock_ib_connection():
     return ib
 
 
+class FakeEvent:
+    """Minimal stand-in for an eventkit Event (supports += / -= / emit)."""
+
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        self.handlers.remove(handler)
+        return self
+
+    def emit(self, *args):
+        for handler in list(self.handlers):
+            handler(*args)
+
+
+class FakeTicker:
+    """Stand-in for ib_async Ticker; unset fields are NaN like the real one."""
+
+    def __init__(self, last=float("nan"), close=float("nan"), contract=None):
+        self.contract = contract
+        self.last = last
+        self.close = close
+        self.bid = float("nan")
+        self.ask = float("nan")
+        self.volume = float("nan")
+        self.high = float("nan")
+        self.low = float("nan")
+        self.open = float("nan")
+        self.updateEvent = FakeEvent()
+
+    def tick(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updateEvent.emit(self)
+
+
+@pytest.fixture
+def make_ticker():
+    """Factory for fake tickers that emit updateEvent on tick()."""
+    return FakeTicker
+
+
+@pytest.fixture
+def mock_streaming_ib():
+    """Mock IB connection whose account/position/execution events can be emitted."""
+    ib = Mock()
+    ib.positionEvent = FakeEvent()
+    ib.execDetailsEvent = FakeEvent()
+    ib.commissionReportEvent = FakeEvent()
+    ib.accountValueEvent = FakeEvent()
+    ib.updatePortfolioEvent = FakeEvent()
+    ib.pnlSingleEvent = FakeEvent()
+    ib.reqAccountUpdatesAsync = AsyncMock()
+    ib.portfolio = Mock(return_value=[])
+    ib.positions = Mock(return_value=[])
+    return ib
+
+
 # Pytest configuration
 def pytest_configure(config):
     """
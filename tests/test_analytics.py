@@ -0,0 +1,115 @@
+"""
+Unit tests for the analytics service
+Tests vectorized statistics and the per-user result cache.
+"""
+import pytest
+from datetime import date
+from unittest.mock import Mock, AsyncMock
+from sqlalchemy.dialects import postgresql
+from backend.services.analytics import compute_analytics, to_arrays, closed_trades_query, AnalyticsService
+
+
+ROWS = [
+    ("AAPL", 100.0),
+    ("MSFT", -50.0),
+    ("AAPL", -80.0),
+    ("AAPL", 200.0),
+]
+
+# (date, equity) rows of the daily_pnl rollup for ROWS
+DAILY = [
+    (date(2024, 1, 2), 50.0),
+    (date(2024, 1, 3), -30.0),
+    (date(2024, 1, 4), 170.0),
+]
+
+
+def test_summary_statistics():
+    """Test win rate, profit factor, expectancy and averages."""
+    result = compute_analytics(*to_arrays(ROWS))
+
+    assert result["total_trades"] == 4
+    assert result["win_rate"] == 0.5
+    assert result["gross_profit"] == 300.0
+    assert result["gross_loss"] == -130.0
+    assert result["profit_factor"] == pytest.approx(300 / 130)
+    assert result["expectancy"] == pytest.approx(170 / 4)
+    assert result["avg_profit"] == pytest.approx(170 / 4)
+
+
+def test_equity_curve_and_drawdown():
+    """Test the daily equity curve (from the rollup) and trade-by-trade peak-to-trough drawdown."""
+    result = compute_analytics(*to_arrays(ROWS), DAILY)
+
+    assert result["equity_curve"] == [
+        {"date": date(2024, 1, 2), "equity": 50.0},
+        {"date": date(2024, 1, 3), "equity": -30.0},
+        {"date": date(2024, 1, 4), "equity": 170.0},
+    ]
+    assert result["max_drawdown"] == 130.0  # 100 -> -30
+
+
+def test_per_symbol_breakdown():
+    """Test grouping by symbol, sorted by total PnL."""
+    per_symbol = compute_analytics(*to_arrays(ROWS))["per_symbol"]
+
+    assert [s["symbol"] for s in per_symbol] == ["AAPL", "MSFT"]
+    assert per_symbol[0]["trades"] == 3
+    assert per_symbol[0]["total_pnl"] == 220.0
+    assert per_symbol[1]["profit_factor"] == 0.0
+
+
+def test_no_trades():
+    """Test that an empty history returns zeros instead of failing."""
+    result = compute_analytics(*to_arrays([]))
+
+    assert result["total_trades"] == 0
+    assert result["profit_factor"] is None
+
+
+def test_closed_trades_query_reads_only_symbol_and_pnl():
+    """Test that the per-trade query skips trade times (the equity curve comes from the rollup)."""
+    sql = str(closed_trades_query(1).compile(dialect=postgresql.dialect()))
+
+    assert sql.startswith("SELECT trades.symbol, trades.realized_pnl \nFROM trades")
+
+
+def _db(versions, rows, daily=()):
+    db = Mock()
+    versions_result = Mock()
+    versions_result.all.return_value = versions
+    rows_result = Mock()
+    rows_result.all.return_value = rows
+    daily_result = Mock()
+    daily_result.mappings.return_value.all.return_value = [{"date": d, "equity": e} for d, e in daily]
+    db.execute = AsyncMock(side_effect=[versions_result, rows_result, daily_result])
+    return db
+
+
+@pytest.mark.asyncio
+async def test_cached_until_trades_version_changes():
+    """Test that results are reused while the accounts' trades versions are unchanged."""
+    service = AnalyticsService()
+
+    first = await service.get(_db([(1, 4)], ROWS, DAILY), user_id=1)
+    assert first["equity_curve"][-1] == {"date": date(2024, 1, 4), "equity": 170.0}
+    db = _db([(1, 4)], [])
+    second = await service.get(db, user_id=1)
+
+    assert second is first
+    assert db.execute.await_count == 1  # versions only
+
+    third = await service.get(_db([(1, 5)], ROWS[:1]), user_id=1)
+    assert third["total_trades"] == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidate_forces_recompute():
+    """Test explicit invalidation (e.g. after late PnL updates)."""
+    service = AnalyticsService()
+    await service.get(_db([(1, 4)], ROWS), user_id=1)
+
+    service.invalidate(1)
+    result = await service.get(_db([(1, 4)], ROWS[:2]), user_id=1)
+
+    assert result["total_trades"] == 2
@@ -4,10 +4,13 @@ Unit tests for authentication (JWT handler and auth dependency)
 import pytest
 from datetime import datetime, timedelta
 from backend.utils.jwt_handler import create_access_token, verify_access_token
-from backend.utils.auth_dependency import get_current_user
-from backend.models.user import User
+from backend.utils.auth_dependency import (
+    get_current_identity,
+    invalidate_user,
+    CurrentUser
+)
 from fastapi import HTTPException
-from unittest.mock import Mock
+from unittest.mock import Mock, AsyncMock
 
 
 def test_create_access_token():
@@ -61,47 +64,193 @@ def test_verify_expired_token(monkeypatch):
     assert payload is None  # Expired token returns None
 
 
-def test_get_current_user_with_valid_token(monkeypatch):
-    """Test get_current_user with valid token and existing user."""
-    # Create mock objects
+@pytest.fixture
+def clear_token_cache():
+    """Start each token-cache test from an empty cache."""
+    from backend.utils.jwt_handler import _token_cache
+    _token_cache.clear()
+    yield _token_cache
+    _token_cache.clear()
+
+
+def test_verify_token_is_cached(clear_token_cache, monkeypatch):
+    """Test that a repeat verification skips jwt.decode."""
+    from backend.utils import jwt_handler
+    token = create_access_token({"sub": "testuser", "role": "user"})
+
+    assert verify_access_token(token)["sub"] == "testuser"
+
+    decode = Mock(side_effect=AssertionError("decode should not be called"))
+    monkeypatch.setattr(jwt_handler.jwt, "decode", decode)
+    payload = verify_access_token(token)
+
+    assert payload["sub"] == "testuser"
+    assert jwt_handler.token_cache_stats()["hits"] == 1
+    assert jwt_handler.token_cache_stats()["misses"] == 1
+
+
+def test_cached_token_expires_at_exp(clear_token_cache, monkeypatch):
+    """Test that a cached token stops verifying once its exp passes."""
+    from backend.utils import jwt_handler
+    token = create_access_token({"sub": "testuser"})
+    exp = verify_access_token(token)["exp"]
+
+    monkeypatch.setattr("backend.utils.cache.time.time", lambda: exp + 1)
+    monkeypatch.setattr(jwt_handler.jwt, "decode", Mock(side_effect=jwt_handler.JWTError("expired")))
+
+    assert verify_access_token(token) is None
+
+
+def test_invalid_token_is_not_cached(clear_token_cache):
+    """Test that failed verifications are not stored."""
+    verify_access_token("invalid.token.string")
+
+    assert len(clear_token_cache) == 0
+
+
+def test_cached_payload_is_a_copy(clear_token_cache):
+    """Test that callers can't mutate the cached payload."""
+    token = create_access_token({"sub": "testuser"})
+    verify_access_token(token)["sub"] = "mallory"
+
+    assert verify_access_token(token)["sub"] == "testuser"
+
+
+@pytest.fixture
+def clear_identity_cache():
+    """Start each identity-cache test with an empty cache."""
+    from backend.utils.auth_dependency import _identity_cache
+    _identity_cache.clear()
+    yield _identity_cache
+    _identity_cache.clear()
+
+
+def _async_db_returning(row):
+    db = Mock()
+    result = Mock()
+    result.first.return_value = row
+    db.execute = AsyncMock(return_value=result)
+    return db
+
+
+@pytest.mark.asyncio
+async def test_get_current_identity_caches_user(clear_identity_cache):
+    """Test that the second request for the same user skips the database."""
     mock_credentials = Mock()
     mock_credentials.credentials = create_access_token({"sub": "testuser"})
+    mock_db = _async_db_returning(Mock(id=1, username="testuser", role="user"))
 
-    mock_db = Mock()
-    mock_user = User(id=1, username="testuser", password_hash="hashed", role="user")
-    mock_db.query.return_value.filter.return_value.first.return_value = mock_user
+    first = await get_current_identity(credentials=mock_credentials, db=mock_db)
+    second = await get_current_identity(credentials=mock_credentials, db=mock_db)
 
-    # Test
-    user = get_current_user(credentials=mock_credentials, db=mock_db)
+    assert first == second == CurrentUser(id=1, username="testuser", role="user")
+    assert mock_db.execute.await_count == 1
 
-    assert user == mock_user
-    assert user.username == "testuser"
 
-
-def test_get_current_user_with_invalid_token():
-    """Test get_current_user with invalid token raises 401."""
+@pytest.mark.asyncio
+async def test_get_current_identity_still_verifies_token(clear_identity_cache):
+    """Test that a cached user doesn't let an invalid token through."""
+    clear_identity_cache.set("testuser", CurrentUser(id=1, username="testuser", role="user"))
     mock_credentials = Mock()
     mock_credentials.credentials = "invalid.token"
 
-    mock_db = Mock()
-
     with pytest.raises(HTTPException) as exc_info:
-        get_current_user(credentials=mock_credentials, db=mock_db)
+        await get_current_identity(credentials=mock_credentials, db=Mock())
 
     assert exc_info.value.status_code == 401
-    assert "Invalid or expired token" in exc_info.value.detail
 
 
-def test_get_current_user_with_nonexistent_user():
-    """Test get_current_user when user doesn't exist in DB."""
+@pytest.mark.asyncio
+async def test_get_current_identity_user_not_found(clear_identity_cache):
+    """Test that unknown users raise 404 and are not cached."""
     mock_credentials = Mock()
-    mock_credentials.credentials = create_access_token({"sub": "nonexistent"})
-
-    mock_db = Mock()
-    mock_db.query.return_value.filter.return_value.first.return_value = None  # User not found
+    mock_credentials.credentials = create_access_token({"sub": "ghost"})
 
     with pytest.raises(HTTPException) as exc_info:
-        get_current_user(credentials=mock_credentials, db=mock_db)
+        await get_current_identity(credentials=mock_credentials, db=_async_db_returning(None))
 
     assert exc_info.value.status_code == 404
-    assert "User not found" in exc_info.value.detail
+    assert "ghost" not in clear_identity_cache
+
+
+def test_invalidate_user_drops_cached_identity(clear_identity_cache):
+    """Test explicit invalidation when a user changes."""
+    clear_identity_cache.set("testuser", CurrentUser(id=1, username="testuser", role="user"))
+
+    invalidate_user("testuser")
+
+    assert "testuser" not in clear_identity_cache
+
+
+@pytest.fixture
+def user_session():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from backend.db import Base
+    import backend.models  # noqa: F401  (register all tables)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_user_changes_are_published_after_commit(user_session, monkeypatch, clear_identity_cache):
+    """Test that other processes are told about a changed user once the change is committed, not before."""
+    from backend.models.user import User
+    from backend.utils import auth_dependency
+    published = []
+    monkeypatch.setattr(auth_dependency, "publish_invalidations", lambda names: published.append(set(names)))
+    user = User(username="alice", password_hash="x")
+    user_session.add(user)
+    user_session.commit()
+
+    user.username = "alice2"
+    user_session.flush()
+    assert published == []
+    user_session.commit()
+
+    assert published == [{"alice", "alice2"}]
+
+
+def test_rolled_back_user_changes_are_not_published(user_session, monkeypatch):
+    """Test that a rolled back change publishes nothing."""
+    from backend.models.user import User
+    from backend.utils import auth_dependency
+    published = []
+    monkeypatch.setattr(auth_dependency, "publish_invalidations", lambda names: published.append(set(names)))
+    user = User(username="bob", password_hash="x")
+    user_session.add(user)
+    user_session.commit()
+
+    user.role = "admin"
+    user_session.flush()
+    user_session.rollback()
+    user_session.commit()
+
+    assert published == []
+
+
+@pytest.mark.asyncio
+async def test_invalidations_from_other_processes_are_applied(clear_identity_cache):
+    """Test that a username published on the invalidation channel is dropped from this process's cache."""
+    import asyncio
+    from backend.utils.auth_dependency import listen_for_invalidations, INVALIDATION_CHANNEL
+    clear_identity_cache.set("testuser", CurrentUser(id=1, username="testuser", role="user"))
+
+    class FakePubSub:
+        async def subscribe(self, channel):
+            assert channel == INVALIDATION_CHANNEL
+
+        async def listen(self):
+            yield {"type": "message", "data": b"testuser"}
+            await asyncio.Event().wait()
+
+    client = Mock()
+    client.pubsub = Mock(return_value=FakePubSub())
+    listener = asyncio.create_task(listen_for_invalidations(client))
+    await asyncio.sleep(0.01)
+    listener.cancel()
+
+    assert "testuser" not in clear_identity_cache
@@ -4,10 +4,11 @@ Tests /api/broker/* routes
 """
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import Mock, AsyncMock, patch
+from unittest.mock import Mock, AsyncMock
+from backend.db import get_async_db
 from backend.main import app
-from backend.models.user import User
 from backend.models.broker_account import BrokerAccount
+from backend.utils.auth_dependency import get_current_identity, CurrentUser
 from backend.utils.jwt_handler import create_access_token
 
 
@@ -27,7 +28,27 @@ def auth_headers():
 @pytest.fixture
 def mock_user():
     """Create mock user."""
-    return User(id=1, username="testuser", password_hash="hashed", role="user")
+    return CurrentUser(id=1, username="testuser", role="user")
+
+
+@pytest.fixture
+def override_dependencies(mock_user):
+    """
+    Route the auth and DB dependencies to mocks. Patching the module
+    attributes wouldn't work: routes hold the functions in Depends(...).
+
+    Yields the mock AsyncSession; set what its queries return per test.
+    """
+    mock_db = Mock()
+    mock_db.execute = AsyncMock(return_value=Mock())
+
+    async def override_get_db():
+        yield mock_db
+
+    app.dependency_overrides[get_current_identity] = lambda: mock_user
+    app.dependency_overrides[get_async_db] = override_get_db
+    yield mock_db
+    app.dependency_overrides.clear()
 
 
 @pytest.fixture
@@ -53,28 +74,24 @@ def test_connect_broker_success(client, auth_headers, mock_user, monkeypatch):
     pass
 
 
-def test_connect_broker_already_exists(client, auth_headers, mock_user, mock_broker_account):
+def test_connect_broker_already_exists(client, auth_headers, mock_broker_account, override_dependencies):
     """Test connecting broker that already exists."""
-    with patch("backend.routers.broker.get_current_user", return_value=mock_user):
-        with patch("backend.routers.broker.get_db") as mock_get_db:
-            mock_db = Mock()
-            mock_db.query.return_value.filter_by.return_value.first.return_value = mock_broker_account
-            mock_get_db.return_value = mock_db
-
-            response = client.post(
-                "/api/broker/connect",
-                headers=auth_headers,
-                json={
-                    "broker": "ibkr",
-                    "account_code": "U1234567",
-                    "conn_host": "127.0.0.1",
-                    "conn_port": 7497,
-                    "client_id": 1
-                }
-            )
-
-            # Should return 400 if account exists
-            # Actual test requires proper dependency injection
+    override_dependencies.execute.return_value.scalars.return_value.first.return_value = mock_broker_account
+
+    response = client.post(
+        "/api/broker/connect",
+        headers=auth_headers,
+        json={
+            "broker": "ibkr",
+            "account_code": "U1234567",
+            "conn_host": "127.0.0.1",
+            "conn_port": 7497,
+            "client_id": 1
+        }
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Broker account already connected"
 
 
 def test_get_broker_accounts(client, auth_headers):
@@ -84,21 +101,55 @@ def test_get_broker_accounts(client, auth_headers):
     pass
 
 
-def test_sync_broker_account_not_found(client, auth_headers, mock_user):
+def test_sync_broker_account_not_found(client, auth_headers, override_dependencies):
     """Test syncing non-existent broker account."""
-    with patch("backend.routers.broker.get_current_user", return_value=mock_user):
-        with patch("backend.routers.broker.get_db") as mock_get_db:
-            mock_db = Mock()
-            mock_db.query.return_value.filter_by.return_value.first.return_value = None
-            mock_get_db.return_value = mock_db
+    override_dependencies.execute.return_value.scalars.return_value.first.return_value = None
+
+    response = client.post(
+        "/api/broker/sync/999",
+        headers=auth_headers
+    )
+
+    assert response.status_code == 404
+
+
+def test_sync_not_enqueued_clears_queued_marker(client, auth_headers, mock_broker_account, override_dependencies,
+                                                 monkeypatch):
+    """Test that a sync ARQ didn't enqueue (duplicate job) is not reported as started and doesn't hold the marker."""
+    from backend.routers import broker as broker_router
+    override_dependencies.execute.return_value.scalars.return_value.first.return_value = mock_broker_account
+    coalescer = Mock(request=AsyncMock(return_value="scheduled"), cancel=AsyncMock())
+    monkeypatch.setattr(broker_router, "sync_coalescer", coalescer)
+    monkeypatch.setattr(broker_router, "enqueue_user_sync", AsyncMock(return_value=None))
+    monkeypatch.setattr(broker_router.settings, "SYNC_USE_PRIORITY_QUEUE", True)
+
+    response = client.post("/api/broker/sync/1", headers=auth_headers)
+
+    assert response.json()["status"] == "sync_already_queued"
+    coalescer.cancel.assert_awaited_once_with(1)
+
+
+def test_quote_symbol_is_normalized(client, auth_headers, mock_broker_account, override_dependencies, monkeypatch):
+    """Test that /quote/aapl reads the same hub subscription as /quotes?symbols=AAPL."""
+    from contextlib import asynccontextmanager
+    from backend.routers import broker as broker_router
+    override_dependencies.execute.return_value.scalars.return_value.first.return_value = mock_broker_account
+    requested = []
+
+    @asynccontextmanager
+    async def subscribed(ib, symbols):
+        requested.extend(symbols)
+        yield symbols
+
+    hub = Mock(subscribed=subscribed, wait_for=AsyncMock(), get_quote=Mock(return_value={"symbol": "AAPL"}))
+    monkeypatch.setattr(broker_router, "market_data_hub", hub)
+    monkeypatch.setattr(broker_router.connection_manager, "get_or_create_connection", AsyncMock())
 
-            response = client.post(
-                "/api/broker/sync/999",
-                headers=auth_headers
-            )
+    response = client.get("/api/broker/quote/%20aapl", headers=auth_headers)
 
-            # Should return 404
-            # Actual test requires proper dependency injection
+    assert response.status_code == 200
+    assert requested == ["AAPL"]
+    hub.get_quote.assert_called_once_with("AAPL")
 
 
 def test_disconnect_broker(client, auth_headers):
@@ -118,5 +169,5 @@ def test_get_connection_status(client, auth_headers):
 # 2. SQLAlchemy testing fixtures
 # 3. TestClient with dependency overrides
 # Example:
-# app.dependency_overrides[get_db] = override_get_db
-# app.dependency_overrides[get_current_user] = override_get_current_user
+# app.dependency_overrides[get_async_db] = override_get_db
+# app.dependency_overrides[get_current_identity] = override_get_current_user
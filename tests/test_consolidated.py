@@ -0,0 +1,90 @@
+"""
+Unit tests for the consolidated (cross-account) portfolio view and its version-keyed cache
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from backend.db import Base
+from backend.models.broker_account import BrokerAccount
+from backend.models.portfolio import Portfolio
+from backend.models.user import User
+from backend.services.consolidated import ConsolidatedPortfolioService
+import backend.models  # noqa: F401  (register all tables)
+
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        session.add(User(id=1, username="u1", password_hash="x"))
+        session.add_all([
+            BrokerAccount(id=1, user_id=1, broker="ibkr", account_code="U1"),
+            BrokerAccount(id=2, user_id=1, broker="ibkr", account_code="U2"),
+            Portfolio(user_id=1, broker_account_id=1, symbol="AAPL", quantity=10, avg_cost=100.0,
+                      current_price=110.0, market_value=1100.0, unrealized_pnl=100.0),
+            Portfolio(user_id=1, broker_account_id=2, symbol="AAPL", quantity=30, avg_cost=120.0,
+                      current_price=110.0, market_value=3300.0, unrealized_pnl=None),
+            Portfolio(user_id=1, broker_account_id=2, symbol="MSFT", quantity=5, avg_cost=400.0),
+        ])
+        await session.commit()
+        yield session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_positions_grouped_by_symbol(db):
+    """Test summed quantity / value, quantity-weighted cost, and NULL-tolerant sums."""
+    rows = await ConsolidatedPortfolioService().get(db, user_id=1)
+
+    assert [r["symbol"] for r in rows] == ["AAPL", "MSFT"]
+    aapl = rows[0]
+    assert aapl["quantity"] == 40
+    assert aapl["avg_cost"] == pytest.approx(115.0)
+    assert aapl["market_value"] == 4400.0
+    assert aapl["unrealized_pnl"] == 100.0
+    assert aapl["accounts"] == 2
+    assert "breakdown" not in aapl
+    assert rows[1]["market_value"] is None
+
+
+@pytest.mark.asyncio
+async def test_breakdown_lists_account_rows(db):
+    """Test the per-account breakdown on request."""
+    rows = await ConsolidatedPortfolioService().get(db, user_id=1, breakdown=True)
+
+    assert [(b["broker_account_id"], b["quantity"]) for b in rows[0]["breakdown"]] == [(1, 10), (2, 30)]
+    assert [b["broker_account_id"] for b in rows[1]["breakdown"]] == [2]
+
+
+@pytest.mark.asyncio
+async def test_flat_net_position_has_no_avg_cost(db):
+    """Test that a symbol long in one account and short in another nets to flat without dividing by zero."""
+    db.add(Portfolio(user_id=1, broker_account_id=1, symbol="TSLA", quantity=5, avg_cost=200.0))
+    db.add(Portfolio(user_id=1, broker_account_id=2, symbol="TSLA", quantity=-5, avg_cost=210.0))
+    await db.commit()
+
+    rows = await ConsolidatedPortfolioService().get(db, user_id=1)
+
+    tsla = next(r for r in rows if r["symbol"] == "TSLA")
+    assert tsla["quantity"] == 0
+    assert tsla["avg_cost"] is None
+
+
+@pytest.mark.asyncio
+async def test_cached_until_an_account_syncs(db):
+    """Test that results are reused until any account's data version is bumped."""
+    service = ConsolidatedPortfolioService()
+    first = await service.get(db, user_id=1)
+
+    await db.execute(update(Portfolio).where(Portfolio.symbol == "MSFT").values(quantity=7))
+    await db.commit()
+    assert await service.get(db, user_id=1) is first  # not synced yet
+
+    await db.execute(update(BrokerAccount).where(BrokerAccount.id == 2).values(data_version=1))
+    await db.commit()
+    fresh = await service.get(db, user_id=1)
+    assert fresh is not first
+    assert fresh[1]["quantity"] == 7
@@ -0,0 +1,114 @@
+"""
+Unit tests for the qualified-contract cache
+Tests memory / Postgres / gateway tiers and priming from positions.
+"""
+import pytest
+from unittest.mock import Mock, AsyncMock
+from ib_async import Contract
+from backend.services.contract_cache import ContractCache, contract_key
+
+
+def qualified(contract, con_id=265598):
+    return Contract(
+        symbol=contract.symbol, secType=contract.secType, exchange=contract.exchange,
+        currency=contract.currency, conId=con_id, primaryExchange="NASDAQ"
+    )
+
+
+@pytest.fixture
+def mock_db():
+    db = Mock()
+    db.query.return_value.filter.return_value.all.return_value = []
+    return db
+
+
+@pytest.fixture
+def cache(mock_db):
+    return ContractCache(maxsize=100, ttl=3600, session_factory=Mock(return_value=mock_db))
+
+
+@pytest.fixture
+def mock_ib():
+    ib = Mock()
+    ib.qualifyContractsAsync = AsyncMock(side_effect=lambda *cs: [qualified(c) for c in cs])
+    return ib
+
+
+@pytest.mark.asyncio
+async def test_misses_are_qualified_in_one_batch(cache, mock_ib, mock_db):
+    """Test that all cache misses go to the gateway in a single call and are persisted."""
+    keys = [contract_key("AAPL"), contract_key("MSFT")]
+
+    result = await cache.resolve(mock_ib, keys)
+
+    mock_ib.qualifyContractsAsync.assert_awaited_once()
+    assert len(mock_ib.qualifyContractsAsync.call_args.args) == 2
+    assert result[contract_key("AAPL")].conId == 265598
+    mock_db.execute.assert_called_once()
+    mock_db.commit.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_memory_hits_skip_db_and_gateway(cache, mock_ib, mock_db):
+    """Test that a second resolve is served from the in-memory tier."""
+    await cache.resolve(mock_ib, [contract_key("AAPL")])
+    mock_db.query.reset_mock()
+
+    await cache.resolve(mock_ib, [contract_key("AAPL")])
+
+    assert mock_ib.qualifyContractsAsync.await_count == 1
+    mock_db.query.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_unknown_contracts_are_negative_cached(cache, mock_db):
+    """Test that contracts IBKR can't qualify resolve to None and aren't re-sent within the negative TTL."""
+    ib = Mock()
+    ib.qualifyContractsAsync = AsyncMock(return_value=[None])
+
+    result = await cache.resolve(ib, [contract_key("BOGUS")])
+    again = await cache.resolve(ib, [contract_key("BOGUS")])
+
+    assert result[contract_key("BOGUS")] is None
+    assert again[contract_key("BOGUS")] is None
+    assert ib.qualifyContractsAsync.await_count == 1
+    assert cache.get(contract_key("BOGUS")) is None
+    assert cache.is_unknown(contract_key("BOGUS"))
+    mock_db.execute.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_negative_entries_expire(mock_db, mock_ib):
+    """Test that an unknown contract is qualified again once the negative TTL passes."""
+    cache = ContractCache(maxsize=100, ttl=3600, negative_ttl=0, session_factory=Mock(return_value=mock_db))
+    failing = Mock()
+    failing.qualifyContractsAsync = AsyncMock(return_value=[None])
+    await cache.resolve(failing, [contract_key("NEWIPO")])
+
+    result = await cache.resolve(mock_ib, [contract_key("NEWIPO")])
+
+    assert result[contract_key("NEWIPO")].conId == 265598
+
+
+def test_prime_from_position_contracts(cache):
+    """Test that position contracts fill the cache under their SMART key."""
+    db = Mock()
+    contract = Contract(symbol="AAPL", secType="STK", exchange="NASDAQ", currency="USD", conId=265598)
+
+    cache.prime(db, [contract])
+
+    assert cache.get(contract_key("AAPL")).conId == 265598
+    db.execute.assert_called_once()
+    db.commit.assert_not_called()  # Committed with the caller's transaction
+
+
+def test_primed_position_contract_is_routable(cache):
+    """Test that a position contract without an exchange is cached with SMART routing (IB error 321 otherwise)."""
+    contract = Contract(symbol="AAPL", secType="STK", exchange="", primaryExchange="NASDAQ", currency="USD",
+                        conId=265598)
+
+    cache.prime(Mock(), [contract])
+
+    cached = cache.get(contract_key("AAPL"))
+    assert (cached.exchange, cached.primaryExchange, cached.conId) == ("SMART", "NASDAQ", 265598)
+    assert contract.exchange == ""  # the position's own contract is left alone
@@ -0,0 +1,66 @@
+"""
+Unit tests for the daily PnL rollup (touched dates, incremental refresh SQL, calendar query)
+"""
+from datetime import datetime, date, timezone
+from unittest.mock import Mock
+from sqlalchemy.dialects import postgresql
+from backend.services.daily_pnl import (
+    trading_day,
+    trade_dates,
+    refresh_daily_pnl,
+    daily_pnl_query
+)
+
+
+def compile_pg(stmt) -> str:
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_trading_day_uses_new_york_date():
+    """Test that fills after 20:00 New York time (00:00 UTC) belong to the previous day."""
+    assert trading_day(datetime(2024, 3, 14, 1, 30, tzinfo=timezone.utc)) == date(2024, 3, 13)
+    assert trading_day(datetime(2024, 3, 14, 15, 0)) == date(2024, 3, 14)  # naive = UTC
+
+
+def test_trade_dates_deduplicates():
+    """Test that a batch touches each day once."""
+    trades = [
+        {"trade_time": datetime(2024, 3, 13, 14, 0, tzinfo=timezone.utc)},
+        {"trade_time": datetime(2024, 3, 13, 19, 0, tzinfo=timezone.utc)},
+        {"trade_time": datetime(2024, 3, 15, 14, 0, tzinfo=timezone.utc)},
+    ]
+
+    assert trade_dates(trades) == {date(2024, 3, 13), date(2024, 3, 15)}
+
+
+def test_refresh_upserts_only_touched_days():
+    """Test that the refresh is one INSERT ... SELECT limited to the account's touched days."""
+    db = Mock()
+
+    refresh_daily_pnl(db, 3, 7, {date(2024, 3, 15), date(2024, 3, 13)})
+
+    db.execute.assert_called_once()
+    sql = compile_pg(db.execute.call_args.args[0])
+    assert sql.startswith("INSERT INTO daily_pnl")
+    assert "ON CONFLICT ON CONSTRAINT uq_daily_pnl_user_ba_date DO UPDATE" in sql
+    assert "trades.user_id = 3 AND trades.broker_account_id = 7" in sql
+    assert "trades.trade_time >= '2024-03-13 00:00:00-04:00'" in sql
+    assert "IN ('2024-03-13', '2024-03-15')" in sql
+    assert "GROUP BY trades.user_id, trades.broker_account_id" in sql
+
+
+def test_refresh_without_dates_is_noop():
+    """Test that a batch without new trades skips the database."""
+    db = Mock()
+
+    assert refresh_daily_pnl(db, 3, 7, set()) == 0
+    db.execute.assert_not_called()
+
+
+def test_daily_query_accumulates_before_range_filter():
+    """Test that equity is a running sum over all days and the range is applied afterwards."""
+    sql = compile_pg(daily_pnl_query(1, start=date(2024, 3, 1), end=date(2024, 3, 31)))
+
+    assert "sum(anon_2.realized_pnl) OVER (ORDER BY anon_2.date) AS equity" in sql
+    assert "anon_1.date >= '2024-03-01'" in sql
+    assert sql.rstrip().endswith("ORDER BY anon_1.date")
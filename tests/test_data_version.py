@@ -0,0 +1,95 @@
+"""
+Unit tests for data versions and conditional GET (ETag / If-None-Match) on portfolio reads
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.db import Base, get_async_db
+from backend.main import app
+from backend.models.broker_account import BrokerAccount
+from backend.models.portfolio import Portfolio
+from backend.models.user import User
+from backend.services.data_version import make_etag, etag_matches
+from backend.utils.auth_dependency import get_current_identity, CurrentUser
+import backend.models  # noqa: F401  (register all tables)
+
+
+def test_etag_depends_on_versions_and_request():
+    """Test that the tag changes with any account version and with the query."""
+    etag = make_etag("/api/portfolio/?", [(1, 3), (2, 7)])
+
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert make_etag("/api/portfolio/?", [(1, 3), (2, 8)]) != etag
+    assert make_etag("/api/portfolio/?", [(1, 3)]) != etag
+    assert make_etag("/api/portfolio/trades?limit=5", [(1, 3), (2, 7)]) != etag
+
+
+def test_if_none_match_parsing():
+    """Test list, wildcard and weak-prefixed If-None-Match values."""
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+
+@pytest.fixture
+def client():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with sessions() as db:
+            db.add(User(id=1, username="u1", password_hash="x"))
+            db.add(BrokerAccount(id=1, user_id=1, broker="ibkr", account_code="U1"))
+            db.add(Portfolio(user_id=1, broker_account_id=1, symbol="AAPL", quantity=10, avg_cost=100.0))
+            await db.commit()
+
+    async def override_db():
+        async with sessions() as db:
+            yield db
+
+    app.dependency_overrides[get_async_db] = override_db
+    app.dependency_overrides[get_current_identity] = lambda: CurrentUser(id=1, username="u1", role="user")
+    with TestClient(app) as test_client:
+        test_client.portal.call(setup)
+        test_client.bump = lambda: test_client.portal.call(bump_version, sessions)
+        yield test_client
+    app.dependency_overrides.clear()
+
+
+async def bump_version(sessions):
+    async with sessions() as db:
+        await db.execute(update(BrokerAccount).values(data_version=BrokerAccount.data_version + 1))
+        await db.commit()
+
+
+def test_unchanged_data_answers_304(client):
+    """Test that revalidating with the ETag gets an empty 304 until a sync bumps the version."""
+    first = client.get("/api/portfolio/")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.json()[0]["symbol"] == "AAPL"
+
+    cached = client.get("/api/portfolio/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    client.bump()
+    fresh = client.get("/api/portfolio/", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+
+
+def test_account_scoped_and_filtered_reads_get_their_own_tags(client):
+    """Test that per-account and filtered reads don't share a tag with the full listing."""
+    all_positions = client.get("/api/portfolio/").headers["etag"]
+    one_account = client.get("/api/portfolio/broker/1").headers["etag"]
+    trades = client.get("/api/portfolio/trades?symbol=AAPL").headers["etag"]
+
+    assert len({all_positions, one_account, trades}) == 3
+    assert client.get("/api/portfolio/broker/1", headers={"If-None-Match": one_account}).status_code == 304
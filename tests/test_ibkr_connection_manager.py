@@ -122,3 +122,47 @@ async def test_get_connection_status_exists(connection_manager, mock_broker_acco
 
         assert status["exists"] is True
         assert status["connected"] is True
+
+
+class FakeLock:
+    """redis.asyncio Lock over a shared dict (one dict = one Redis)."""
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    async def acquire(self, token=None):
+        if self.name in self.store:
+            return False
+        self.store[self.name] = token
+        return True
+
+    async def reacquire(self):
+        return True
+
+    async def release(self):
+        del self.store[self.name]
+
+
+@pytest.mark.asyncio
+async def test_stream_owned_by_one_process(mock_broker_account, mock_streaming_ib):
+    """Test that two processes asked to stream the same account start only one stream."""
+    store = {}
+    redis = Mock()
+    redis.lock = lambda name, **kwargs: FakeLock(store, name)
+    api, worker = IBKRConnectionManager(), IBKRConnectionManager()
+    for manager in (api, worker):
+        manager._redis = redis
+        manager.get_or_create_connection = AsyncMock(return_value=mock_streaming_ib)
+
+    await api.start_streaming(mock_broker_account)
+    await worker.start_streaming(mock_broker_account)
+
+    assert api.is_streaming(1) and not worker.is_streaming(1)
+    assert "stream:owner:1" in store
+
+    await api.stop_streaming(1)
+    assert store == {}
+    await worker.start_streaming(mock_broker_account)
+    assert worker.is_streaming(1)
+    await worker.stop_streaming(1)
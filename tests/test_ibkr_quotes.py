@@ -0,0 +1,60 @@
+"""
+Unit tests for IBKR quote helpers
+Tests quote conversion and event-driven waiting.
+"""
+import asyncio
+import time
+import pytest
+from backend.services.ibkr_quotes import (
+    clean_price,
+    ticker_to_quote,
+    wait_for_tickers
+)
+
+nan = float("nan")
+
+
+def test_clean_price_rejects_nan_and_non_positive():
+    """Test that IB's NaN / -1 placeholders become None."""
+    assert clean_price(nan) is None
+    assert clean_price(-1) is None
+    assert clean_price(None) is None
+    assert clean_price(10) == 10.0
+
+
+def test_ticker_to_quote_falls_back_to_close(make_ticker):
+    """Test that close is used as last price when no trades printed."""
+    quote = ticker_to_quote("AAPL", make_ticker(close=170.0))
+
+    assert quote["last"] == 170.0
+    assert quote["bid"] is None
+    assert ticker_to_quote("AAPL", make_ticker()) is None
+
+
+@pytest.mark.asyncio
+async def test_wait_for_tickers_returns_when_all_filled(make_ticker):
+    """Test that waiting ends as soon as the last ticker is filled, not at the deadline."""
+    t1, t2 = make_ticker(), make_ticker()
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.01, lambda: t1.tick(last=100.0))
+    loop.call_later(0.02, lambda: t2.tick(last=200.0))
+
+    start = time.monotonic()
+    await wait_for_tickers([t1, t2], timeout=5)
+
+    assert time.monotonic() - start < 1
+    assert t1.updateEvent.handlers == []
+    assert t2.updateEvent.handlers == []
+
+
+@pytest.mark.asyncio
+async def test_wait_for_tickers_honours_deadline(make_ticker):
+    """Test that unfilled tickers stop the wait at the batch deadline."""
+    ticker = make_ticker()
+
+    start = time.monotonic()
+    await wait_for_tickers([ticker], timeout=0.05)
+
+    assert time.monotonic() - start < 1
+    assert ticker.updateEvent.handlers == []
+
@@ -0,0 +1,231 @@
+"""
+Unit tests for streaming (event-driven) sync
+Tests event filtering, coalescing into one write per flush, and the write itself.
+"""
+import pytest
+from datetime import datetime
+from unittest.mock import Mock, patch
+from ib_async import Contract, Position, AccountValue, Fill, Execution, CommissionReport, PortfolioItem, PnLSingle
+from backend.services.ibkr_stream import AccountStream
+
+
+@pytest.fixture
+async def stream(mock_streaming_ib):
+    stream = AccountStream(mock_streaming_ib, broker_account_id=1, user_id=1, account_code="U123", flush_interval=60)
+    stream._write = Mock()
+    await stream.start()
+    yield stream
+    if stream._flush_handle:
+        stream._flush_handle.cancel()
+
+
+def position(symbol, qty, account="U123", con_id=0):
+    return Position(account=account, contract=Contract(symbol=symbol, conId=con_id), position=qty, avgCost=100.0)
+
+
+def fill(exec_id, pnl=0.0, account="U123"):
+    execution = Execution(execId=exec_id, orderId=7, acctNumber=account, side="BOT",
+                          shares=10, price=101.0, time=datetime(2024, 1, 2, 15, 30))
+    return Fill(contract=Contract(symbol="AAPL"), execution=execution,
+                commissionReport=CommissionReport(execId=exec_id, realizedPNL=pnl), time=execution.time)
+
+
+@pytest.mark.asyncio
+async def test_start_subscribes_account_updates(stream, mock_streaming_ib):
+    """Test that starting the stream requests account updates for the account."""
+    mock_streaming_ib.reqAccountUpdatesAsync.assert_awaited_once_with("U123")
+    assert len(mock_streaming_ib.positionEvent.handlers) == 1
+
+
+@pytest.mark.asyncio
+async def test_events_coalesce_into_one_write(stream, mock_streaming_ib):
+    """Test that a burst of events is written once, with the latest value per symbol."""
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 10))
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 20))
+    mock_streaming_ib.positionEvent.emit(position("MSFT", 0))
+    mock_streaming_ib.execDetailsEvent.emit(None, fill("e1"))
+    mock_streaming_ib.accountValueEvent.emit(AccountValue("U123", "NetLiquidation", "1000.5", "USD", ""))
+
+    await stream.flush()
+
+    stream._write.assert_called_once()
+    open_positions, position_rows, closed, trade_rows, late_reports, summary, mark_rows = stream._write.call_args.args
+    assert [r["quantity"] for r in position_rows] == [20.0]
+    assert closed == ["MSFT"]
+    assert [t["exec_id"] for t in trade_rows] == ["e1"]
+    assert summary == {"net_liquidation": 1000.5}
+
+
+@pytest.mark.asyncio
+async def test_other_accounts_and_currencies_ignored(stream, mock_streaming_ib):
+    """Test that events for other accounts and non-BASE cash values are dropped."""
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 10, account="U999"))
+    mock_streaming_ib.accountValueEvent.emit(AccountValue("U123", "TotalCashValue", "50", "EUR", ""))
+    mock_streaming_ib.accountValueEvent.emit(AccountValue("U123", "TotalCashValue", "500", "BASE", ""))
+
+    await stream.flush()
+
+    _, position_rows, _, _, _, summary, _ = stream._write.call_args.args
+    assert position_rows == []
+    assert summary == {"total_cash": 500.0}
+
+
+@pytest.mark.asyncio
+async def test_late_commission_updates_written_fill(stream, mock_streaming_ib):
+    """Test that a commission report after the fill was written updates realized PnL and fees."""
+    f = fill("e1")
+    mock_streaming_ib.execDetailsEvent.emit(None, f)
+    await stream.flush()
+
+    mock_streaming_ib.commissionReportEvent.emit(None, f, CommissionReport(execId="e1", commission=1.5, realizedPNL=42.0))
+    await stream.flush()
+
+    assert stream._write.call_args.args[4] == {"e1": {"realized_pnl": 42.0, "commission": 1.5}}
+
+
+@pytest.mark.asyncio
+async def test_report_for_fill_written_elsewhere_is_kept(stream, mock_streaming_ib):
+    """Test that a report for a fill this stream never wrote (full sync, other process) is still applied."""
+    mock_streaming_ib.commissionReportEvent.emit(
+        None, fill("e9"), CommissionReport(execId="e9", commission=1.0, realizedPNL=1.7976931348623157e308))
+    await stream.flush()
+
+    assert stream._write.call_args.args[4] == {"e9": {"realized_pnl": None, "commission": 1.0}}
+
+
+@pytest.mark.asyncio
+async def test_mark_only_flushes_bump_version_at_most_once_per_interval(stream, mock_streaming_ib):
+    """Test that streaming PnL marks don't bump data_version on every flush."""
+    stream.mark_version_interval = 60
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 10, con_id=265598))
+    await stream.flush()
+    assert stream._write.call_args.kwargs["bump_version"]  # position change
+
+    for value in (1900.0, 1910.0):
+        mock_streaming_ib.pnlSingleEvent.emit(PnLSingle(
+            account="U123", conId=265598, unrealizedPnL=0.0, position=10, value=value))
+        await stream.flush()
+        assert not stream._write.call_args.kwargs["bump_version"]
+
+    # Once the interval is up, a flush bumps it even without new marks
+    stream._marks_versioned_at -= 60
+    await stream.flush()
+    assert stream._write.call_args.kwargs["bump_version"]
+    assert stream._write.call_args.args[6] == []
+
+
+@pytest.mark.asyncio
+async def test_position_rows_carry_portfolio_marks(stream, mock_streaming_ib):
+    """Test that account-update valuations are merged into position rows instead of placeholders."""
+    mock_streaming_ib.updatePortfolioEvent.emit(PortfolioItem(
+        contract=Contract(symbol="AAPL"), position=10, marketPrice=190.0, marketValue=1900.0,
+        averageCost=100.0, unrealizedPNL=900.0, realizedPNL=0.0, account="U123"))
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 10))
+
+    await stream.flush()
+
+    _, position_rows, _, _, _, _, mark_rows = stream._write.call_args.args
+    assert position_rows[0]["current_price"] == 190.0
+    assert position_rows[0]["unrealized_pnl"] == 900.0
+    assert mark_rows == []  # already carried by the position row
+
+
+@pytest.mark.asyncio
+async def test_pnl_single_updates_are_coalesced_marks(stream, mock_streaming_ib):
+    """Test that per-position PnL ticks become one valuation-only row per symbol per flush."""
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 10, con_id=265598))
+    await stream.flush()
+    mock_streaming_ib.reqPnLSingle.assert_called_once_with("U123", "", 265598)
+
+    for value in (1900.0, 1910.0, 1920.0):
+        mock_streaming_ib.pnlSingleEvent.emit(PnLSingle(
+            account="U123", conId=265598, unrealizedPnL=value - 1000.0, position=10, value=value))
+    mock_streaming_ib.pnlSingleEvent.emit(PnLSingle(account="U999", conId=1, value=5.0, position=1))
+    await stream.flush()
+
+    _, position_rows, _, _, _, _, mark_rows = stream._write.call_args.args
+    assert position_rows == []
+    assert len(mark_rows) == 1
+    assert mark_rows[0]["market_value"] == 1920.0
+    assert mark_rows[0]["current_price"] == 192.0
+    assert mark_rows[0]["unrealized_pnl"] == 920.0
+
+
+@pytest.mark.asyncio
+async def test_pnl_single_price_accounts_for_multiplier(stream, mock_streaming_ib):
+    """Test that an option's PnL value is divided by its contract multiplier to get the price."""
+    option = Contract(symbol="AAPL", conId=555, secType="OPT", multiplier="100")
+    mock_streaming_ib.positionEvent.emit(Position(account="U123", contract=option, position=2, avgCost=350.0))
+    await stream.flush()
+
+    mock_streaming_ib.pnlSingleEvent.emit(PnLSingle(
+        account="U123", conId=555, unrealizedPnL=100.0, position=2, value=800.0))
+    await stream.flush()
+
+    _, _, _, _, _, _, mark_rows = stream._write.call_args.args
+    assert mark_rows[0]["current_price"] == 4.0
+
+
+@pytest.mark.asyncio
+async def test_closed_position_cancels_pnl_stream(stream, mock_streaming_ib):
+    """Test that closing a position drops its marks and its reqPnLSingle subscription."""
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 10, con_id=265598))
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 0, con_id=265598))
+
+    mock_streaming_ib.cancelPnLSingle.assert_called_once_with("U123", "", 265598)
+    assert "AAPL" not in stream._marks
+
+
+@pytest.mark.asyncio
+async def test_idle_flush_writes_nothing(stream):
+    """Test that a flush with nothing buffered skips the database."""
+    await stream.flush()
+
+    stream._write.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_stop_detaches_and_flushes(stream, mock_streaming_ib):
+    """Test that stopping unsubscribes handlers and writes buffered changes."""
+    mock_streaming_ib.positionEvent.emit(position("AAPL", 10))
+
+    await stream.stop()
+
+    assert mock_streaming_ib.positionEvent.handlers == []
+    stream._write.assert_called_once()
+
+
+def test_write_is_one_transaction(mock_streaming_ib):
+    """Test that a batch is written and committed once."""
+    db = Mock()
+    stream = AccountStream(mock_streaming_ib, 1, 1, "U123", session_factory=Mock(return_value=db))
+    db.__enter__ = Mock(return_value=db)
+    db.__exit__ = Mock(return_value=False)
+    db.query.return_value.filter.return_value.all.return_value = []
+
+    with patch("backend.services.ibkr_stream.contract_cache"):
+        stream._write([], [{"symbol": "AAPL", "quantity": 1.0}], ["MSFT"], [], {}, {"total_cash": 1.0})
+
+    db.commit.assert_called_once()
+
+
+@pytest.mark.parametrize("inserted, late_updated, bumped", [(0, 0, False), (1, 0, True), (0, 1, True)])
+def test_write_bumps_trades_version_only_on_trade_changes(mock_streaming_ib, inserted, late_updated, bumped):
+    """Test that trades_version (analytics cache key) moves only when trades or their reports change."""
+    db = Mock()
+    stream = AccountStream(mock_streaming_ib, 1, 1, "U123", session_factory=Mock(return_value=db))
+    db.__enter__ = Mock(return_value=db)
+    db.__exit__ = Mock(return_value=False)
+    counts = {"inserted": inserted, "skipped": 1 - inserted, "journaled": 0, "reported": 0}
+
+    with patch("backend.services.ibkr_stream.contract_cache"), \
+            patch("backend.services.ibkr_stream.apply_position_changes"), \
+            patch("backend.services.ibkr_stream.refresh_daily_pnl"), \
+            patch("backend.services.ibkr_stream.upsert_trades", return_value=counts), \
+            patch("backend.services.ibkr_stream.update_trade_commission_reports", return_value=late_updated), \
+            patch("backend.services.ibkr_stream.analytics_service") as analytics:
+        stream._write([], [], [], [{"exec_id": "e1", "trade_time": datetime(2024, 1, 2)}], {"e0": {"commission": 1.0}}, {})
+
+    values = db.query.return_value.filter_by.return_value.update.call_args.args[0]
+    assert ("trades_version" in values) == bumped
+    assert analytics.invalidate.called == bumped
@@ -2,14 +2,23 @@
 Unit tests for IBKR sync functions
 Tests data synchronization from IBKR to database.
 """
+import asyncio
 import pytest
 from unittest.mock import Mock, AsyncMock, patch
 from datetime import datetime
+from sqlalchemy.dialects import postgresql
+from ib_async import Contract, Position, PortfolioItem, Fill, Execution, CommissionReport
 from backend.services.ibkr_sync import (
     upsert_portfolio,
     upsert_account_summary,
     upsert_trades,
-    sync_broker_data
+    executions_to_rows,
+    summary_to_dict,
+    sync_broker_data,
+    positions_to_rows,
+    portfolio_marks,
+    ensure_account_updates,
+    update_position_marks
 )
 from backend.models.portfolio import Portfolio
 from backend.models.trade import Trade
@@ -28,25 +37,62 @@ def mock_db():
     return db
 
 
-def test_upsert_portfolio_deletes_old_and_inserts_new(mock_db):
-    """Test that upsert_portfolio deletes existing and inserts new positions."""
+def _stored_position(symbol, quantity, avg_cost, **fields):
+    row = Mock()
+    row.symbol = symbol
+    row.quantity = quantity
+    row.avg_cost = avg_cost
+    for column in ("current_price", "market_value", "unrealized_pnl", "realized_pnl"):
+        setattr(row, column, fields.get(column))
+    return row
+
+
+def test_upsert_portfolio_writes_only_changes(mock_db):
+    """Test that upsert_portfolio upserts new/changed symbols and deletes removed ones."""
+    mock_db.query.return_value.filter_by.return_value.all.return_value = [
+        _stored_position("AAPL", 100, 150.0),   # unchanged
+        _stored_position("MSFT", 10, 300.0),    # quantity changes
+        _stored_position("TSLA", 5, 200.0),     # disappears
+    ]
     positions = [
         {"symbol": "AAPL", "quantity": 100, "avg_cost": 150.0},
+        {"symbol": "MSFT", "quantity": 20, "avg_cost": 300.0},
         {"symbol": "GOOGL", "quantity": 50, "avg_cost": 2800.0}
     ]
 
-    mock_db.query.return_value.filter_by.return_value.delete.return_value = 2
+    counts = upsert_portfolio(mock_db, user_id=1, broker_account_id=1, positions=positions)
 
-    upsert_portfolio(mock_db, user_id=1, broker_account_id=1, positions=positions)
+    assert counts == {"added": 1, "changed": 1, "removed": 1, "unchanged": 1}
 
-    # Should delete old positions
-    mock_db.query.assert_called_with(Portfolio)
-    mock_db.query.return_value.filter_by.assert_called_with(user_id=1, broker_account_id=1)
-    mock_db.query.return_value.filter_by.return_value.delete.assert_called_once()
+    # One bulk upsert for MSFT + GOOGL, nothing row-by-row
+    upsert_call, history_call = mock_db.execute.call_args_list
+    params = upsert_call.args[0].compile().params
+    assert {v for k, v in params.items() if k.startswith("symbol")} == {"GOOGL", "MSFT"}
+    mock_db.add.assert_not_called()
 
-    # Should add new positions
-    assert mock_db.add.call_count == 2
-    mock_db.commit.assert_called_once()
+    # One bulk history insert: MSFT, GOOGL and a closing row for TSLA
+    history = {row["symbol"]: row["quantity"] for row in history_call.args[1]}
+    assert history == {"MSFT": 20, "GOOGL": 50, "TSLA": 0.0}
+
+    # One bulk delete for TSLA
+    mock_db.query.return_value.filter.return_value.delete.assert_called_once()
+    mock_db.commit.assert_not_called()  # sync_broker_data commits once for all stages
+
+
+def test_upsert_portfolio_skips_unchanged(mock_db):
+    """Test that an identical sync issues no writes."""
+    mock_db.query.return_value.filter_by.return_value.all.return_value = [
+        _stored_position("AAPL", 100, 150.0)
+    ]
+
+    counts = upsert_portfolio(
+        mock_db, user_id=1, broker_account_id=1,
+        positions=[{"symbol": "AAPL", "quantity": 100, "avg_cost": 150.0}]
+    )
+
+    assert counts == {"added": 0, "changed": 0, "removed": 0, "unchanged": 1}
+    mock_db.execute.assert_not_called()
+    mock_db.query.return_value.filter.return_value.delete.assert_not_called()
 
 
 def test_upsert_account_summary(mock_db):
@@ -66,26 +112,109 @@ def test_upsert_account_summary(mock_db):
 
     # Should add new summary
     mock_db.add.assert_called_once()
-    mock_db.commit.assert_called_once()
+    mock_db.commit.assert_not_called()  # sync_broker_data commits once for all stages
 
 
 def test_upsert_trades_skips_duplicates(mock_db):
-    """Test that upsert_trades doesn't insert duplicate exec_ids."""
-    # Mock existing trades
-    existing_trade = Mock()
-    existing_trade.exec_id = "00001234.123456.01"
-    mock_db.query.return_value.filter_by.return_value = [existing_trade]
+    """Test that upsert_trades inserts with ON CONFLICT DO NOTHING and counts skips."""
+    # Only the second exec_id is new, so Postgres returns one row
+    mock_db.execute.return_value.all.return_value = [(2, "00001235.123456.01")]
 
     trades = [
         {"exec_id": "00001234.123456.01", "symbol": "AAPL", "side": "BUY", "qty": 100, "price": 150.0},
         {"exec_id": "00001235.123456.01", "symbol": "GOOGL", "side": "BUY", "qty": 50, "price": 2800.0}
     ]
 
-    upsert_trades(mock_db, user_id=1, broker_account_id=1, trades=trades)
+    with patch("backend.services.ibkr_sync.match_trades", return_value=0) as mock_match:
+        counts = upsert_trades(mock_db, user_id=1, broker_account_id=1, trades=trades)
 
-    # Should only add the new trade (not the duplicate)
-    assert mock_db.add.call_count == 1
-    mock_db.commit.assert_called_once()
+    assert counts == {"inserted": 1, "skipped": 1, "journaled": 0, "reported": 0}
+    # Only the inserted row is lot-matched, with its new id
+    assert mock_match.call_args.args[3] == [{**trades[1], "id": 2}]
+    sql = str(mock_db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT ON CONSTRAINT uq_trade_ba_execid DO NOTHING" in sql
+
+    # Never loads the account's existing exec_ids
+    mock_db.query.assert_not_called()
+    mock_db.add.assert_not_called()
+    mock_db.commit.assert_not_called()  # sync_broker_data commits once for all stages
+
+
+def test_upsert_trades_chunks_large_batches(mock_db):
+    """Test that large batches are split into several INSERT statements."""
+    mock_db.execute.return_value.all.return_value = []
+    trades = [
+        {"exec_id": f"exec.{i}", "symbol": "AAPL", "side": "BUY", "qty": 1, "price": 150.0}
+        for i in range(5)
+    ]
+
+    counts = upsert_trades(mock_db, user_id=1, broker_account_id=1, trades=trades, chunk_size=2)
+
+    assert mock_db.execute.call_count == 3
+    assert counts == {"inserted": 0, "skipped": 5, "journaled": 0, "reported": 0}
+
+
+def _fill(exec_id, report):
+    execution = Execution(execId=exec_id, orderId=1, side="BOT", shares=10, price=100.0,
+                          time=datetime(2024, 3, 13, 14, 30))
+    return Fill(contract=Contract(symbol="AAPL"), execution=execution, commissionReport=report, time=execution.time)
+
+
+def test_executions_without_report_store_null():
+    """Test that a fill's default empty CommissionReport is stored as NULL, not as zero PnL / commission."""
+    rows = executions_to_rows([
+        _fill("e1", CommissionReport()),
+        _fill("e2", CommissionReport(execId="e2", commission=1.0, realizedPNL=1.7976931348623157e308)),
+        _fill("e3", CommissionReport(execId="e3", commission=1.2, realizedPNL=-35.5)),
+    ])
+
+    assert [(r["realized_pnl"], r["commission"]) for r in rows] == [(None, None), (None, 1.0), (-35.5, 1.2)]
+
+
+def test_executions_carry_contract_identity():
+    """Test that fills keep their conId and multiplier, so lots of options and stock on one symbol stay apart."""
+    execution = Execution(execId="e1", orderId=1, side="SLD", shares=1, price=5.0, time=datetime(2024, 3, 13, 14, 30))
+    option = Contract(symbol="AAPL", secType="OPT", conId=700001, multiplier="100")
+
+    rows = executions_to_rows([Fill(contract=option, execution=execution, commissionReport=CommissionReport(),
+                                    time=execution.time), _fill("e2", CommissionReport())])
+
+    assert [(r["con_id"], r["multiplier"]) for r in rows] == [(700001, 100.0), (None, None)]
+
+
+def test_upsert_trades_counts_batch_duplicates_once(mock_db):
+    """Test that an exec_id listed twice in one batch is inserted and counted once."""
+    mock_db.execute.return_value.all.return_value = [(1, "e1")]
+    trade = {"exec_id": "e1", "symbol": "AAPL", "side": "BUY", "qty": 1, "price": 150.0}
+
+    with patch("backend.services.ibkr_sync.match_trades", return_value=0) as mock_match:
+        counts = upsert_trades(mock_db, user_id=1, broker_account_id=1, trades=[trade, dict(trade)])
+
+    assert counts["inserted"] == 1 and counts["skipped"] == 0
+    assert len(mock_match.call_args.args[3]) == 1
+    sql = mock_db.execute.call_args.args[0].compile(dialect=postgresql.dialect())
+    assert len([k for k in sql.params if k.startswith("exec_id")]) == 1
+
+
+def test_upsert_trades_completes_late_commission_reports(mock_db):
+    """Test that stored trades still waiting for a report get it from a later sync."""
+    insert_result, lookup_result = Mock(), Mock()
+    insert_result.all.return_value = []  # already stored
+    lookup_result.scalars.return_value.all.return_value = ["e1"]  # e1 still has commission NULL
+    mock_db.execute.side_effect = [insert_result, lookup_result, Mock()]
+    trades = [
+        {"exec_id": "e1", "symbol": "AAPL", "side": "SELL", "qty": 1, "price": 150.0, "realized_pnl": 12.0, "commission": 1.0},
+        {"exec_id": "e2", "symbol": "AAPL", "side": "BUY", "qty": 1, "price": 150.0, "realized_pnl": None, "commission": None},
+    ]
+
+    counts = upsert_trades(mock_db, user_id=1, broker_account_id=1, trades=trades)
+
+    assert counts["reported"] == 1
+    lookup_sql = str(mock_db.execute.call_args_list[1].args[0].compile(dialect=postgresql.dialect()))
+    assert "trades.commission IS NULL" in lookup_sql
+    update_stmt, params = mock_db.execute.call_args_list[2].args
+    assert str(update_stmt).startswith("UPDATE trades")
+    assert params == [{"b_exec_id": "e1", "b_realized_pnl": 12.0, "b_commission": 1.0}]
 
 
 @pytest.mark.asyncio
@@ -117,12 +246,15 @@ async def test_sync_broker_data_success():
     mock_execution.execution.shares = 100
     mock_execution.execution.price = 150.0
     mock_execution.execution.time = "20250101  09:30:00"
-    mock_execution.contract.symbol = "AAPL"
+    mock_execution.contract = Contract(symbol="AAPL", conId=265598)
     mock_execution.commissionReport = None
 
     mock_ib.reqPositionsAsync = AsyncMock(return_value=[mock_position])
     mock_ib.reqAccountSummaryAsync = AsyncMock(return_value=[mock_summary_item])
     mock_ib.reqExecutionsAsync = AsyncMock(return_value=[mock_execution])
+    mock_ib.portfolio = Mock(return_value=[])
+    mock_ib.accountValues = Mock(return_value=[])
+    mock_ib.reqAccountUpdatesAsync = AsyncMock()
 
     with patch("backend.services.ibkr_sync.SessionLocal", return_value=mock_db):
         with patch("backend.services.ibkr_sync.connection_manager.get_or_create_connection", return_value=mock_ib):
@@ -135,6 +267,7 @@ async def test_sync_broker_data_success():
                         mock_upsert_portfolio.assert_called_once()
                         mock_upsert_summary.assert_called_once()
                         mock_upsert_trades.assert_called_once()
+                        mock_ib.reqAccountUpdatesAsync.assert_awaited_once()
                         mock_db.commit.assert_called()
                         mock_db.close.assert_called_once()
 
@@ -168,3 +301,92 @@ async def test_sync_broker_data_handles_exceptions():
             # Should rollback on error
             mock_db.rollback.assert_called_once()
             mock_db.close.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_sync_broker_data_fetches_concurrently():
+    """Test that the three gateway requests overlap and one commit covers all stages."""
+    mock_db = Mock()
+    mock_broker_account = Mock()
+    mock_broker_account.id = 1
+    mock_db.query.return_value.filter_by.return_value.first.return_value = mock_broker_account
+
+    async def slow(result):
+        await asyncio.sleep(0.1)
+        return result
+
+    mock_ib = Mock()
+    mock_ib.reqPositionsAsync = Mock(side_effect=lambda: slow([]))
+    mock_ib.reqAccountSummaryAsync = Mock(side_effect=lambda: slow([]))
+    mock_ib.reqExecutionsAsync = Mock(side_effect=lambda: slow([]))
+    mock_ib.portfolio = Mock(return_value=[])
+
+    with patch("backend.services.ibkr_sync.SessionLocal", return_value=mock_db):
+        with patch("backend.services.ibkr_sync.connection_manager.get_or_create_connection", return_value=mock_ib):
+            with patch("backend.services.ibkr_sync.upsert_portfolio",
+                       return_value={"added": 0, "changed": 0, "removed": 0, "unchanged": 0}):
+                with patch("backend.services.ibkr_sync.upsert_trades", return_value={"inserted": 0, "skipped": 0, "reported": 0}):
+                    result = await sync_broker_data(broker_account_id=1, user_id=1)
+
+    assert result.status == "ok"
+    # Sum of the three stages would be ~0.3s; concurrent fetch is ~0.1s
+    assert result.timings["fetch"] < 0.25
+    assert {"fetch_positions", "fetch_account_summary", "fetch_executions", "persist", "total"} <= set(result.timings)
+    mock_db.commit.assert_called_once()
+
+
+def test_summary_to_dict_maps_known_tags():
+    """Test that only AccountSummary tags are picked from account values."""
+    items = [Mock(tag="NetLiquidation", value="1000.5"), Mock(tag="Leverage-S", value="1.2")]
+
+    assert summary_to_dict(items) == {"net_liquidation": 1000.5}
+
+
+def test_positions_valued_from_account_updates():
+    """Test that positions take price / value / PnL from IB's portfolio items, and None without one."""
+    ib = Mock()
+    ib.portfolio = Mock(return_value=[
+        PortfolioItem(contract=Contract(symbol="AAPL"), position=10, marketPrice=190.0, marketValue=1900.0,
+                      averageCost=150.0, unrealizedPNL=400.0, realizedPNL=1.7976931348623157e308, account="U1")
+    ])
+    positions = [
+        Position(account="U1", contract=Contract(symbol="AAPL"), position=10, avgCost=150.0),
+        Position(account="U1", contract=Contract(symbol="MSFT"), position=5, avgCost=300.0),
+    ]
+
+    aapl, msft = positions_to_rows(positions, portfolio_marks(ib, "U1"))
+
+    ib.portfolio.assert_called_once_with("U1")
+    assert aapl == {"symbol": "AAPL", "quantity": 10.0, "avg_cost": 150.0, "current_price": 190.0,
+                    "market_value": 1900.0, "unrealized_pnl": 400.0, "realized_pnl": None}
+    assert msft["market_value"] is None and msft["unrealized_pnl"] is None
+
+
+@pytest.mark.asyncio
+async def test_account_updates_requested_once_per_connection():
+    """Test that a sync subscribes to account updates (the source of marks) only when the connection has none."""
+    ib = Mock()
+    ib.accountValues = Mock(return_value=[])
+    ib.reqAccountUpdatesAsync = AsyncMock()
+
+    await ensure_account_updates(ib, "U1")
+    ib.reqAccountUpdatesAsync.assert_awaited_once_with("U1")
+
+    ib.accountValues.return_value = [Mock(tag="NetLiquidation")]
+    await ensure_account_updates(ib, "U1")
+    assert ib.reqAccountUpdatesAsync.await_count == 1
+
+
+def test_update_position_marks_is_one_update(mock_db):
+    """Test that mark updates are one executemany UPDATE of the valuation columns only."""
+    rows = [{"symbol": "AAPL", "current_price": 190.0, "market_value": 1900.0,
+             "unrealized_pnl": 400.0, "realized_pnl": 0.0}]
+
+    update_position_marks(mock_db, 1, 2, rows)
+
+    stmt, params = mock_db.execute.call_args.args
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("UPDATE portfolios SET current_price=")
+    assert "quantity" not in sql
+    assert params == [{"b_symbol": "AAPL", "b_current_price": 190.0, "b_market_value": 1900.0,
+                       "b_unrealized_pnl": 400.0, "b_realized_pnl": 0.0}]
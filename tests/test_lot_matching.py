@@ -0,0 +1,123 @@
+"""
+Unit tests for lot matching (FIFO / LIFO / specific-ID round trips and incremental open-lot state)
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from backend.db import Base
+from backend.models.journal import Journal
+from backend.models.open_lot import OpenLot
+from backend.models.trade import Trade
+from backend.services.lot_matching import match_fills, match_trades, rebuild_lots
+import backend.models  # noqa: F401  (register all tables)
+
+T0 = datetime(2024, 3, 13, 14, 30)
+
+
+def fill(trade_id, side, qty, price, minutes=0, symbol="AAPL", con_id=None, multiplier=None):
+    return {"id": trade_id, "exec_id": f"e{trade_id}", "symbol": symbol, "con_id": con_id, "multiplier": multiplier,
+            "side": side, "qty": qty, "price": price, "trade_time": T0 + timedelta(minutes=minutes)}
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_fifo_closes_oldest_lot_first():
+    """Test that a sell is matched against the oldest buys, split across lots."""
+    lots = []
+    entries = match_fills(lots, [fill(1, "BOT", 10, 100.0), fill(2, "BOT", 10, 110.0, 1), fill(3, "SLD", 15, 120.0, 2)])
+
+    assert [(e["entry_trade_id"], e["qty"], e["profit"]) for e in entries] == [(1, 10, 200.0), (2, 5, 50.0)]
+    assert [(lot.trade_id, lot.qty) for lot in lots] == [(2, 5.0)]
+
+
+def test_lifo_closes_newest_lot_first():
+    """Test that LIFO matches the most recent buy."""
+    lots = []
+    entries = match_fills(lots, [fill(1, "BUY", 10, 100.0), fill(2, "BUY", 10, 110.0, 1), fill(3, "SELL", 10, 120.0, 2)],
+                          method="lifo")
+
+    assert [(e["entry_trade_id"], e["profit"]) for e in entries] == [(2, 100.0)]
+    assert [lot.trade_id for lot in lots] == [1]
+
+
+def test_specific_id_then_fifo():
+    """Test that selected lots are closed first and the remainder falls back to FIFO."""
+    lots = []
+    fills = [fill(1, "BUY", 5, 100.0), fill(2, "BUY", 5, 110.0, 1), fill(3, "BUY", 5, 90.0, 2),
+             fill(4, "SELL", 8, 120.0, 3)]
+    entries = match_fills(lots, fills, method="specific", selections={"e4": [3]})
+
+    assert [(e["entry_trade_id"], e["qty"]) for e in entries] == [(3, 5), (1, 3)]
+
+
+def test_reversal_opens_short_lot():
+    """Test that selling more than the long position opens a short lot, closed later with short PnL."""
+    lots = []
+    entries = match_fills(lots, [fill(1, "BUY", 10, 100.0), fill(2, "SELL", 15, 105.0, 1), fill(3, "BUY", 5, 95.0, 2)])
+
+    assert [(e["side"], e["qty"], e["profit"]) for e in entries] == [("BUY", 10, 50.0), ("SELL", 5, 50.0)]
+    assert lots == []
+
+
+def test_batches_match_incrementally_from_stored_lots(db):
+    """Test that a later batch closes lots persisted by an earlier one, loading only its symbols."""
+    assert match_trades(db, 1, 1, [fill(1, "BUY", 10, 100.0), fill(2, "BUY", 5, 50.0, symbol="MSFT")]) == 0
+    db.commit()
+    assert db.query(OpenLot).count() == 2
+
+    assert match_trades(db, 1, 1, [fill(3, "SELL", 4, 110.0, 5)]) == 1
+    db.commit()
+
+    lots = {lot.symbol: lot.qty for lot in db.scalars(select(OpenLot))}
+    assert lots == {"AAPL": 6.0, "MSFT": 5.0}
+    entry = db.scalars(select(Journal)).one()
+    assert (entry.entry_trade_id, entry.exit_trade_id, entry.qty, entry.profit) == (1, 3, 4.0, 40.0)
+
+    assert match_trades(db, 1, 1, [fill(4, "SELL", 6, 90.0, 10)]) == 1
+    db.commit()
+    assert db.query(OpenLot).filter_by(symbol="AAPL").count() == 0
+
+
+def test_option_and_stock_on_one_symbol_are_separate_lots(db):
+    """Test that lots are per contract and option profit is scaled by the multiplier."""
+    stock, call = 265598, 700001
+    match_trades(db, 1, 1, [fill(1, "BUY", 100, 150.0, con_id=stock),
+                            fill(2, "SELL", 1, 5.0, 1, con_id=call, multiplier=100.0)])
+    db.commit()
+
+    assert match_trades(db, 1, 1, [fill(3, "BUY", 1, 3.0, 2, con_id=call, multiplier=100.0)]) == 1
+    db.commit()
+
+    entry = db.scalars(select(Journal)).one()
+    assert (entry.entry_trade_id, entry.profit) == (2, 200.0)  # short call closed 2.00 lower, x100
+    assert [(lot.con_id, lot.qty) for lot in db.scalars(select(OpenLot))] == [(stock, 100.0)]
+
+
+def test_rebuild_replays_the_given_users_history(db):
+    """Test that a rebuild matches the account's stored trades under the user passed in."""
+    for row in (fill(1, "BUY", 10, 100.0), fill(2, "SELL", 10, 105.0, 1)):
+        db.add(Trade(user_id=7, broker_account_id=1, **{k: v for k, v in row.items() if k != "exec_id"},
+                     exec_id=row["exec_id"]))
+    db.commit()
+
+    assert rebuild_lots(db, 7, 1) == 1
+    db.commit()
+
+    entry = db.scalars(select(Journal)).one()
+    assert (entry.user_id, entry.profit) == (7, 50.0)
+    assert rebuild_lots(db, 8, 1) == 0  # another user's id matches none of the trades
+
+
+def test_unknown_method_rejected():
+    """Test that an unsupported matching method fails loudly."""
+    with pytest.raises(ValueError):
+        match_fills([], [fill(1, "BUY", 1, 1.0)], method="average")
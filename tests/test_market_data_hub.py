@@ -0,0 +1,177 @@
+"""
+Unit tests for the shared market data hub
+Tests reference counting, fan-out from the quote cache and idle expiry.
+"""
+import asyncio
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from backend.services.market_data_hub import MarketDataHub, MarketDataCapacityError
+from tests.conftest import FakeEvent
+
+
+@pytest.fixture(autouse=True)
+def mock_contract_cache():
+    """Resolve every symbol to a contract without touching the DB or gateway."""
+    cache = Mock()
+    cache.resolve = AsyncMock(side_effect=lambda ib, keys: {key: Mock() for key in keys})
+    with patch("backend.services.market_data_hub.contract_cache", cache):
+        yield cache
+
+
+@pytest.fixture
+def mock_ib(make_ticker):
+    """Connected IB mock that hands out fake tickers."""
+    ib = Mock()
+    ib.isConnected = Mock(return_value=True)
+    ib.reqMktData = Mock(side_effect=lambda contract, *args: make_ticker())
+    ib.cancelMktData = Mock()
+    ib.disconnectedEvent = FakeEvent()
+    return ib
+
+
+@pytest.mark.asyncio
+async def test_acquire_subscribes_once_per_symbol(mock_ib, mock_contract_cache):
+    """Test that many readers of the same symbol share one subscription."""
+    hub = MarketDataHub(grace_period=60)
+
+    await hub.acquire(mock_ib, ["AAPL"])
+    await hub.acquire(mock_ib, ["AAPL"])
+
+    assert mock_ib.reqMktData.call_count == 1
+    assert mock_contract_cache.resolve.await_count == 1
+    assert hub.stats()["lines"] == 1
+    hub.close()
+
+
+@pytest.mark.asyncio
+async def test_quotes_are_served_from_tick_cache(mock_ib):
+    """Test that ticks update the cache and reads are plain lookups."""
+    hub = MarketDataHub(grace_period=60)
+    await hub.acquire(mock_ib, ["AAPL"])
+    ticker = hub._subscriptions["AAPL"].ticker
+
+    assert hub.get_quote("AAPL") is None
+    ticker.tick(last=190.0, bid=189.9, ask=190.1)
+
+    assert hub.get_quote("AAPL")["last"] == 190.0
+    assert hub.get_quote("AAPL")["bid"] == 189.9
+    hub.close()
+
+
+@pytest.mark.asyncio
+async def test_release_unsubscribes_after_grace_period(mock_ib):
+    """Test that idle symbols are cancelled only after the grace period."""
+    hub = MarketDataHub(grace_period=0.01)
+    await hub.acquire(mock_ib, ["AAPL"])
+
+    hub.release(["AAPL"])
+    assert hub.is_subscribed("AAPL")
+
+    await asyncio.sleep(0.05)
+    assert not hub.is_subscribed("AAPL")
+    mock_ib.cancelMktData.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_reacquire_within_grace_period_keeps_subscription(mock_ib):
+    """Test that a new reader cancels the pending unsubscribe."""
+    hub = MarketDataHub(grace_period=0.01)
+    await hub.acquire(mock_ib, ["AAPL"])
+    hub.release(["AAPL"])
+    await hub.acquire(mock_ib, ["AAPL"])
+
+    await asyncio.sleep(0.05)
+
+    assert hub.is_subscribed("AAPL")
+    assert mock_ib.reqMktData.call_count == 1
+    hub.close()
+
+
+@pytest.mark.asyncio
+async def test_capacity_evicts_idle_then_raises(mock_ib):
+    """Test that idle lines are recycled and active ones are never evicted."""
+    hub = MarketDataHub(grace_period=60, max_lines=1)
+    await hub.acquire(mock_ib, ["AAPL"])
+    hub.release(["AAPL"])
+
+    await hub.acquire(mock_ib, ["MSFT"])
+    assert not hub.is_subscribed("AAPL")
+
+    with pytest.raises(MarketDataCapacityError):
+        await hub.acquire(mock_ib, ["NVDA"])
+    hub.close()
+
+
+@pytest.mark.asyncio
+async def test_dead_connection_is_resubscribed(mock_ib):
+    """Test that a subscription on a dropped connection is re-opened."""
+    hub = MarketDataHub(grace_period=60)
+    await hub.acquire(mock_ib, ["AAPL"])
+    mock_ib.isConnected.return_value = False
+
+    other_ib = Mock()
+    other_ib.isConnected = Mock(return_value=True)
+    other_ib.reqMktData = mock_ib.reqMktData
+    other_ib.disconnectedEvent = FakeEvent()
+
+    await hub.acquire(other_ib, ["AAPL"])
+
+    assert hub._subscriptions["AAPL"].ib is other_ib
+    hub.close()
+
+
+@pytest.mark.asyncio
+async def test_reconnect_of_same_connection_resubscribes(mock_ib):
+    """Test that a disconnect drops subscriptions and quotes even if the IB object is reconnected before the next read."""
+    hub = MarketDataHub(grace_period=60)
+    await hub.acquire(mock_ib, ["AAPL"])
+    hub._subscriptions["AAPL"].ticker.tick(last=190.0)
+
+    mock_ib.disconnectedEvent.emit()  # ib_async resets its tickers here; the manager then reconnects
+
+    assert not hub.is_subscribed("AAPL")
+    assert hub.get_quote("AAPL") is None
+
+    await hub.acquire(mock_ib, ["AAPL"])
+    assert mock_ib.reqMktData.call_count == 2
+    assert hub.is_subscribed("AAPL")
+    hub.close()
+    assert mock_ib.disconnectedEvent.handlers == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_acquire_subscribes_once(mock_ib, mock_contract_cache):
+    """Test that readers arriving while a symbol is being qualified wait for it instead of subscribing again."""
+    gate = asyncio.Event()
+
+    async def slow_resolve(ib, keys):
+        await gate.wait()
+        return {key: Mock() for key in keys}
+
+    mock_contract_cache.resolve.side_effect = slow_resolve
+    hub = MarketDataHub(grace_period=60)
+
+    first = asyncio.create_task(hub.acquire(mock_ib, ["AAPL"]))
+    second = asyncio.create_task(hub.acquire(mock_ib, ["AAPL"]))
+    await asyncio.sleep(0)
+    assert hub.get_quotes(["MSFT"]) == {"MSFT": None}  # the hub stays readable meanwhile
+    gate.set()
+
+    assert await first == ["AAPL"] and await second == ["AAPL"]
+    assert mock_ib.reqMktData.call_count == 1
+    assert hub._subscriptions["AAPL"].refcount == 2
+    hub.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_leaves_no_orphan_lines(mock_ib, make_ticker):
+    """Test that lines opened before a failure in the same batch are cancelled."""
+    mock_ib.reqMktData.side_effect = [make_ticker(), RuntimeError("gateway error")]
+    hub = MarketDataHub(grace_period=60)
+
+    with pytest.raises(RuntimeError):
+        await hub.acquire(mock_ib, ["AAPL", "MSFT"])
+
+    assert hub.stats()["lines"] == 0
+    mock_ib.cancelMktData.assert_called_once()
+    assert hub._pending == {}
@@ -0,0 +1,83 @@
+"""
+Unit tests for connection pool metrics
+Tests checkout wait timing, timeouts and the status report.
+"""
+import sqlite3
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool, SingletonThreadPool
+from backend.utils.pool_metrics import PoolMetrics, timed_pool_class, register_engine, pool_status
+
+
+@pytest.fixture
+def engine():
+    metrics = PoolMetrics("test")
+    engine = create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(":memory:", check_same_thread=False),
+        poolclass=timed_pool_class(QueuePool, metrics),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_checkouts_are_counted(engine):
+    """Test that each checkout is recorded with its wait time."""
+    with engine.connect():
+        pass
+    with engine.connect():
+        pass
+
+    snapshot = engine.pool.metrics.snapshot()
+    assert snapshot["checkouts"] == 2
+    assert snapshot["timeouts"] == 0
+
+
+def test_exhausted_pool_records_timeout(engine):
+    """Test that a checkout that times out is counted and its wait recorded."""
+    with engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    snapshot = engine.pool.metrics.snapshot()
+    assert snapshot["timeouts"] == 1
+    assert snapshot["wait_max_ms"] >= 50
+
+
+def test_metrics_survive_dispose(engine):
+    """Test that the recreated pool keeps reporting into the same metrics."""
+    metrics = engine.pool.metrics
+    engine.dispose()
+
+    with engine.connect():
+        pass
+
+    assert engine.pool.metrics is metrics
+    assert metrics.checkouts == 1
+
+
+def test_pool_status_reports_gauges(engine):
+    """Test that the status report includes pool gauges and wait counters."""
+    register_engine("test", engine)
+
+    with engine.connect():
+        status = pool_status()["test"]
+
+    assert status["size"] == 1
+    assert status["checkedout"] == 1
+    assert "wait_avg_ms" in status
+
+
+def test_pool_status_skips_non_queue_gauges():
+    """Test that pools without QueuePool's gauge methods (in-memory SQLite) are still reported."""
+    engine = create_engine("sqlite://", poolclass=SingletonThreadPool)
+    register_engine("singleton", engine)
+
+    status = pool_status()["singleton"]
+
+    assert status["pool_class"] == "SingletonThreadPool"
+    assert "size" not in status
+    engine.dispose()
@@ -0,0 +1,245 @@
+"""
+Unit tests for the live portfolio stream
+Tests diffing, coalescing, slow-consumer handling and cross-process fan-out over Redis pub/sub.
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock
+from redis.exceptions import ConnectionError as RedisConnectionError
+from backend.services.portfolio_stream import PortfolioStream, position_row
+
+
+class FakePubSub:
+    """Just enough of redis.asyncio.client.PubSub for PortfolioStream."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.channels = set()
+        self.inbox = asyncio.Queue()
+
+    @property
+    def subscribed(self):
+        return bool(self.channels)
+
+    async def subscribe(self, *channels):
+        for channel in channels:
+            self.channels.add(channel)
+            self.broker.channels.setdefault(channel, set()).add(self)
+
+    async def unsubscribe(self, *channels):
+        for channel in channels:
+            self.channels.discard(channel)
+            self.broker.channels.get(channel, set()).discard(self)
+        self.inbox.put_nowait(None)  # wake the listener
+
+    async def listen(self):
+        while self.subscribed:
+            message = await self.inbox.get()
+            if message is not None:
+                yield message
+
+
+class FakeRedis:
+    """In-memory pub/sub broker shared by several PortfolioStreams (one per "process")."""
+
+    def __init__(self):
+        self.channels = {}
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    async def publish(self, channel, data):
+        receivers = self.channels.get(channel, set())
+        for pubsub in receivers:
+            pubsub.inbox.put_nowait({"type": "message", "channel": channel.encode(), "data": data})
+        return len(receivers)
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+@pytest.fixture
+def stream(redis):
+    return PortfolioStream(flush_interval=0.01, queue_size=2, redis=redis)
+
+
+@pytest.fixture
+def baseline(sample_portfolio_data):
+    return [position_row({**p, "broker_account_id": 1}) for p in sample_portfolio_data]
+
+
+async def watch(stream, user_id, positions, summaries):
+    queue = await stream.subscribe(user_id)
+    stream.set_snapshot(user_id, positions, summaries)
+    return queue
+
+
+@pytest.mark.asyncio
+async def test_unchanged_positions_send_nothing(stream, baseline, sample_portfolio_data):
+    """Test that republishing identical rows produces no frame."""
+    queue = await watch(stream, 1, baseline, [])
+
+    await stream.publish_positions(1, 1, sample_portfolio_data)
+    await asyncio.sleep(0.03)
+
+    assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_only_changed_and_removed_rows_are_sent(stream, baseline, sample_portfolio_data):
+    """Test that a diff frame carries just the changed row and the removed symbol."""
+    queue = await watch(stream, 1, baseline, [])
+    aapl = {**sample_portfolio_data[0], "current_price": 170.0}
+
+    await stream.publish_positions(1, 1, [aapl])
+    frame = await asyncio.wait_for(queue.get(), 1)
+
+    assert frame["type"] == "diff"
+    assert [p["symbol"] for p in frame["positions"]] == ["AAPL"]
+    assert frame["positions"][0]["current_price"] == 170.0
+    assert frame["removed_positions"] == [{"broker_account_id": 1, "symbol": "GOOGL"}]
+
+
+@pytest.mark.asyncio
+async def test_bursts_are_coalesced_into_one_frame(stream, baseline, sample_portfolio_data):
+    """Test that several updates within the flush interval become one frame."""
+    queue = await watch(stream, 1, baseline, [])
+
+    for price in (161.0, 162.0, 163.0):
+        await stream.publish_positions(1, 1, [{**sample_portfolio_data[0], "current_price": price}], complete=False)
+    frame = await asyncio.wait_for(queue.get(), 1)
+
+    assert len(frame["positions"]) == 1
+    assert frame["positions"][0]["current_price"] == 163.0
+    assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_summary_changes_are_streamed(stream, sample_account_summary_data):
+    """Test that account summary changes are sent to subscribers."""
+    queue = await watch(stream, 1, [], [])
+
+    await stream.publish_summary(1, 1, sample_account_summary_data)
+    frame = await asyncio.wait_for(queue.get(), 1)
+
+    assert frame["summaries"][0]["net_liquidation"] == 211000.0
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_gets_resync(stream, baseline, sample_portfolio_data):
+    """Test that a full queue is replaced by a resync request."""
+    queue = await watch(stream, 1, baseline, [])
+
+    for price in (161.0, 162.0, 163.0):
+        await stream.publish_positions(1, 1, [{**sample_portfolio_data[0], "current_price": price}], complete=False)
+        await asyncio.sleep(0.03)
+
+    assert queue.qsize() == 1
+    assert queue.get_nowait() == {"type": "resync"}
+
+
+@pytest.mark.asyncio
+async def test_publish_without_subscribers_is_noop(stream, sample_portfolio_data):
+    """Test that users with no open dashboards cost nothing."""
+    await stream.publish_positions(1, 1, sample_portfolio_data)
+
+    assert not stream.has_subscribers(1)
+    assert stream._pending == {}
+
+
+@pytest.mark.asyncio
+async def test_publishes_from_another_process_reach_dashboards(redis, baseline, sample_portfolio_data):
+    """Test that a sync run by a worker process is streamed by the API process."""
+    api = PortfolioStream(flush_interval=0.01, redis=redis)
+    worker = PortfolioStream(flush_interval=0.01, redis=redis)
+    queue = await watch(api, 1, baseline, [])
+
+    await worker.publish_positions(1, 1, [{**sample_portfolio_data[0], "current_price": 175.0}], complete=False)
+    frame = await asyncio.wait_for(queue.get(), 1)
+
+    assert frame["positions"][0]["current_price"] == 175.0
+    assert not worker.has_subscribers(1)
+
+
+@pytest.mark.asyncio
+async def test_changes_during_snapshot_load_are_kept(stream, baseline, sample_portfolio_data):
+    """Test that rows published between subscribing and the snapshot are applied on top of it."""
+    queue = await stream.subscribe(1)
+    await stream.publish_positions(1, 1, [{**sample_portfolio_data[0], "current_price": 171.0}], complete=False)
+    await asyncio.sleep(0.01)
+
+    stream.set_snapshot(1, baseline, [])  # loaded before the change committed
+    frame = await asyncio.wait_for(queue.get(), 1)
+
+    assert frame["positions"][0]["current_price"] == 171.0
+
+
+@pytest.mark.asyncio
+async def test_last_unsubscribe_leaves_the_channel(stream, redis, baseline):
+    """Test that a user with no dashboards left is unsubscribed and the listener stops."""
+    queue = await watch(stream, 1, baseline, [])
+    assert redis.channels["portfolio:1"]
+
+    await stream.unsubscribe(1, queue)
+    await asyncio.wait_for(stream._listener, 1)
+
+    assert not redis.channels["portfolio:1"]
+    assert not stream.has_subscribers(1)
+
+
+@pytest.mark.asyncio
+async def test_without_redis_changes_stay_local(baseline, sample_portfolio_data):
+    """Test the no-Redis fallback: this process's dashboards still get its own changes."""
+    redis = Mock()
+    redis.publish = AsyncMock(side_effect=RedisConnectionError("down"))
+    pubsub = Mock()
+    pubsub.subscribe = AsyncMock(side_effect=RedisConnectionError("down"))
+    redis.pubsub = Mock(return_value=pubsub)
+    stream = PortfolioStream(flush_interval=0.01, redis=redis)
+    queue = await watch(stream, 1, baseline, [])
+
+    await stream.publish_positions(1, 1, [{**sample_portfolio_data[0], "current_price": 172.0}], complete=False)
+    frame = await asyncio.wait_for(queue.get(), 1)
+
+    assert frame["positions"][0]["current_price"] == 172.0
+
+
+@pytest.mark.asyncio
+async def test_resync_snapshot_replaces_the_baseline(stream, baseline, sample_portfolio_data):
+    """Test that a snapshot reloaded on resync becomes the diff baseline (the old one may have missed messages)."""
+    queue = await watch(stream, 1, baseline, [])
+    reloaded = [position_row({**sample_portfolio_data[0], "broker_account_id": 1, "current_price": 180.0})]
+
+    stream.set_snapshot(1, reloaded, [], replace=True)
+    await stream.publish_positions(1, 1, [{**sample_portfolio_data[0], "current_price": 180.0},
+                                          sample_portfolio_data[1]])
+    frame = await asyncio.wait_for(queue.get(), 1)
+
+    assert [p["symbol"] for p in frame["positions"]] == ["GOOGL"]  # AAPL at 180 is what the client has
+
+
+def test_client_leaving_a_quiet_stream_is_unsubscribed(monkeypatch):
+    """Test that a dashboard closing while nothing is published is unsubscribed at once."""
+    from fastapi.testclient import TestClient
+    from backend.main import app
+    from backend.routers import portfolio as portfolio_router
+    from backend.utils.jwt_handler import create_access_token
+    stream = PortfolioStream(flush_interval=0.01, redis=FakeRedis())
+    monkeypatch.setattr(portfolio_router, "portfolio_stream", stream)
+    monkeypatch.setattr(portfolio_router, "_resolve_stream_user", AsyncMock(return_value=1))
+    monkeypatch.setattr(portfolio_router, "_load_stream_snapshot",
+                        AsyncMock(return_value={"positions": [], "summaries": []}))
+    token = create_access_token({"sub": "testuser", "role": "user"})
+
+    with TestClient(app).websocket_connect(f"/api/portfolio/stream?token={token}") as websocket:
+        assert websocket.receive_json()["type"] == "snapshot"
+        assert stream.has_subscribers(1)
+
+        websocket.close()  # the app keeps running; only reading the socket notices
+        deadline = time.monotonic() + 1
+        while stream.has_subscribers(1) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not stream.has_subscribers(1)
@@ -0,0 +1,120 @@
+"""
+Unit tests for position history (change-only snapshots and point-in-time rebuild)
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.db import Base
+from backend.models.positions_history import PositionHistory
+from sqlalchemy.dialects import postgresql
+from backend.services.position_history import record_position_changes, positions_at_query, history_buckets_query
+from backend.utils.cursor import encode_cursor, decode_cursor
+import backend.models  # noqa: F401  (register all tables)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def position(quantity, price=100.0, upnl=0.0):
+    return {"quantity": quantity, "current_price": price, "unrealized_pnl": upnl, "realized_pnl": 0.0}
+
+
+def test_first_full_sync_writes_baseline(db):
+    """Test that an account without history gets every position as a baseline."""
+    before = {"AAPL": position(10)}
+    written = record_position_changes(db, 1, 1, before, {"AAPL": position(10)}, complete=True)
+
+    assert written == 1
+
+
+def test_only_changes_are_recorded(db):
+    """Test that unchanged positions write nothing and closed ones write a zero row."""
+    record_position_changes(db, 1, 1, {}, {"AAPL": position(10), "MSFT": position(5)}, complete=True)
+
+    before = {"AAPL": position(10), "MSFT": position(5)}
+    written = record_position_changes(
+        db, 1, 1, before, {"AAPL": position(10), "NVDA": position(3)}, removed=["MSFT"], complete=True
+    )
+
+    rows = db.query(PositionHistory).order_by(PositionHistory.id).all()
+    assert written == 2
+    assert [(r.symbol, r.quantity) for r in rows[2:]] == [("NVDA", 3), ("MSFT", 0)]
+
+
+def test_avg_cost_only_change_is_not_recorded(db):
+    """Test that fields outside quantity/price/PnL don't create history."""
+    record_position_changes(db, 1, 1, {}, {"AAPL": position(10)}, complete=True)
+
+    written = record_position_changes(
+        db, 1, 1, {"AAPL": {**position(10), "avg_cost": 1.0}}, {"AAPL": {**position(10), "avg_cost": 2.0}}
+    )
+
+    assert written == 0
+
+
+def test_positions_at_rebuilds_point_in_time(db):
+    """Test that the latest delta per symbol at or before a time is returned, minus closed ones."""
+    t0 = datetime(2024, 3, 13, 14, 0)
+    db.add_all([
+        PositionHistory(user_id=1, broker_account_id=1, symbol="AAPL", quantity=10, ts=t0),
+        PositionHistory(user_id=1, broker_account_id=1, symbol="MSFT", quantity=5, ts=t0),
+        PositionHistory(user_id=1, broker_account_id=1, symbol="AAPL", quantity=20, ts=t0 + timedelta(hours=1)),
+        PositionHistory(user_id=1, broker_account_id=1, symbol="MSFT", quantity=0, ts=t0 + timedelta(hours=2)),
+        PositionHistory(user_id=2, broker_account_id=2, symbol="TSLA", quantity=1, ts=t0),
+    ])
+    db.commit()
+
+    def at(hours):
+        return [(r.symbol, r.quantity) for r in db.execute(positions_at_query(1, t0 + timedelta(hours=hours)))]
+
+    assert at(-1) == []
+    assert at(0) == [("AAPL", 10), ("MSFT", 5)]
+    assert at(1.5) == [("AAPL", 20), ("MSFT", 5)]
+    assert at(3) == [("AAPL", 20)]
+
+
+def _sql(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_history_buckets_aggregate_in_sql():
+    """Test that bucketing uses date_trunc + DISTINCT ON and returns plain columns."""
+    sql = _sql(history_buckets_query(1, "1h", symbol="AAPL", limit=500))
+
+    assert "DISTINCT ON (date_trunc('hour', positions_history.ts)" in sql
+    assert "positions_history.ts DESC" in sql
+    assert "LIMIT 500" in sql
+
+
+def test_history_buckets_cursor_is_keyset():
+    """Test that the cursor narrows the scan and compares the full sort key."""
+    after = (datetime(2024, 3, 13, 14, 0), 1, "AAPL")
+    sql = _sql(history_buckets_query(1, "1d", after=after))
+
+    assert "positions_history.ts >= '2024-03-13 14:00:00'" in sql
+    assert "(anon_1.bucket, anon_1.broker_account_id, anon_1.symbol) >" in sql
+
+
+def test_cursor_round_trip():
+    """Test that a cursor decodes to the values it was made from."""
+    cursor = encode_cursor(datetime(2024, 3, 13, 14, 0), 1, "AAPL")
+
+    ts, ba_id, symbol = decode_cursor(cursor, 3)
+
+    assert datetime.fromisoformat(ts) == datetime(2024, 3, 13, 14, 0)
+    assert (ba_id, symbol) == (1, "AAPL")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(1, 2)])
+def test_invalid_cursor_rejected(cursor):
+    """Test that malformed or mismatched cursors raise ValueError."""
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 3)
@@ -0,0 +1,133 @@
+"""
+Unit tests for the market scanner
+Tests vectorized rule evaluation and snapshot refresh from the market data hub.
+"""
+import pytest
+from unittest.mock import Mock, AsyncMock
+from backend.services.contract_cache import contract_key
+from backend.services.market_data_hub import MarketDataCapacityError, MarketDataHub, _Subscription
+from backend.services.scanner import SnapshotTable, scan, MarketScanner
+from tests.conftest import FakeEvent
+
+
+def quote(symbol, last, close=None, open_=None, volume=None):
+    return {"symbol": symbol, "last": last, "close": close, "open": open_, "volume": volume}
+
+
+QUOTES = {
+    "AAPL": quote("AAPL", 110.0, close=100.0, open_=102.0, volume=5_000_000),
+    "MSFT": quote("MSFT", 95.0, close=100.0, open_=99.0, volume=2_000_000),
+    "PENNY": quote("PENNY", 2.0, close=1.0, open_=1.5, volume=100),
+    "NEW": quote("NEW", 50.0),  # no previous close or volume
+    "NOQUOTE": None,
+}
+
+
+def test_snapshot_derives_change_and_gap():
+    """Test that % change and gap are computed once per snapshot."""
+    table = SnapshotTable.from_quotes(QUOTES)
+    row = scan(table, {}, limit=10)[1]
+
+    assert len(table) == 4
+    assert row == {"symbol": "AAPL", "price": 110.0, "change_pct": pytest.approx(10.0),
+                   "volume": 5_000_000.0, "gap_pct": pytest.approx(2.0)}
+
+
+def test_rules_combine_and_missing_values_never_match():
+    """Test that all bounds must hold and NaN fields fail their filters."""
+    table = SnapshotTable.from_quotes(QUOTES)
+
+    assert [r["symbol"] for r in scan(table, {"price": (5.0, None)})] == ["AAPL", "MSFT", "NEW"]
+    assert [r["symbol"] for r in scan(table, {"price": (5.0, None), "change_pct": (0.0, None)})] == ["AAPL"]
+    assert [r["symbol"] for r in scan(table, {"gap_pct": (None, 0.0)})] == ["MSFT"]
+
+
+def test_sort_and_limit():
+    """Test ranking by a column, with rows lacking a value last."""
+    table = SnapshotTable.from_quotes(QUOTES)
+
+    assert [r["symbol"] for r in scan(table, {}, sort_by="volume")] == ["AAPL", "MSFT", "PENNY", "NEW"]
+    assert [r["symbol"] for r in scan(table, {}, sort_by="price", descending=False, limit=2)] == ["PENNY", "NEW"]
+    assert scan(table, {}, sort_by="change_pct")[-1]["change_pct"] is None
+
+
+def test_snapshot_reused_within_refresh_interval():
+    """Test that repeated scans read one snapshot instead of the hub each time."""
+    hub = Mock(max_lines=100)
+    hub.all_quotes = Mock(return_value=QUOTES)
+    scanner = MarketScanner(universe=[], refresh_interval=60, hub=hub)
+
+    scanner.scan({})
+    scanner.scan({"price": (100.0, None)})
+
+    hub.all_quotes.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_universe_subscribes_only_missing_symbols():
+    """Test that the universe is subscribed through the hub once, not per scan."""
+    hub = Mock(max_lines=100)
+    hub.is_subscribed = Mock(side_effect=lambda s: s == "AAPL")
+    hub.acquire = AsyncMock()
+    hub.get_quotes = Mock(return_value={"AAPL": QUOTES["AAPL"], "MSFT": None})
+    scanner = MarketScanner(universe=["AAPL", "MSFT"], hub=hub)
+
+    await scanner.ensure_subscribed(Mock())
+
+    hub.acquire.assert_awaited_once()
+    assert hub.acquire.call_args.args[1] == ["MSFT"]
+    assert [r["symbol"] for r in scanner.scan({})] == ["AAPL"]
+
+
+@pytest.mark.asyncio
+async def test_universe_larger_than_line_allowance_is_rejected():
+    """Test that a universe that would hold more lines than IBKR allows is refused when subscribed, not at import."""
+    scanner = MarketScanner(universe=["AAPL", "MSFT", "NVDA"], hub=MarketDataHub(max_lines=2))
+
+    assert "MARKET_DATA_MAX_LINES" in scanner.universe_error()
+    with pytest.raises(MarketDataCapacityError, match="MARKET_DATA_MAX_LINES"):
+        await scanner.ensure_subscribed(Mock())
+
+
+def test_oversized_universe_answers_503(monkeypatch):
+    """Test that a misconfigured universe disables the scanner endpoint instead of the whole API."""
+    from fastapi.testclient import TestClient
+    from backend.db import get_async_db
+    from backend.main import app
+    from backend.routers import scanner as scanner_router
+    from backend.utils.auth_dependency import get_current_identity, CurrentUser
+    scanner = MarketScanner(universe=["AAPL", "MSFT", "NVDA"], hub=MarketDataHub(max_lines=2))
+    monkeypatch.setattr(scanner_router, "market_scanner", scanner)
+    app.dependency_overrides[get_async_db] = lambda: Mock()
+    app.dependency_overrides[get_current_identity] = lambda: CurrentUser(id=1, username="u1", role="user")
+    try:
+        response = TestClient(app).get("/api/scanner/")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 503
+    assert "MARKET_DATA_MAX_LINES" in response.json()["detail"]
+def test_symbols_on_a_dead_connection_are_missing():
+    """Test that subscriptions of a disconnected gateway count as missing, so they are re-subscribed."""
+    hub = MarketDataHub()
+    ib = Mock()
+    ib.isConnected = Mock(return_value=False)
+    sub = _Subscription("AAPL", ib, Mock(), Mock(updateEvent=FakeEvent()))
+    sub.handler = Mock()
+    sub.ticker.updateEvent += sub.handler
+    hub._subscriptions["AAPL"] = sub
+    scanner = MarketScanner(universe=["AAPL"], hub=hub)
+
+    assert scanner.missing() == ["AAPL"]
+
+
+def test_unqualifiable_symbols_are_not_retried_per_scan(monkeypatch):
+    """Test that symbols IBKR recently failed to qualify don't trigger a subscribe attempt."""
+    from backend.services import scanner as scanner_module
+    cache = Mock()
+    cache.is_unknown = Mock(side_effect=lambda key: key == contract_key("TYPO"))
+    monkeypatch.setattr(scanner_module, "contract_cache", cache)
+    hub = Mock(max_lines=100)
+    hub.is_subscribed = Mock(return_value=False)
+
+    assert MarketScanner(universe=["AAPL", "TYPO"], hub=hub).missing() == ["AAPL"]
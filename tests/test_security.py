@@ -0,0 +1,100 @@
+"""
+Unit tests for password hashing (bcrypt pool, cost setting, rehash-on-login)
+"""
+import asyncio
+import threading
+import pytest
+from passlib.context import CryptContext
+from backend.utils import security
+from backend.utils.security import (
+    hash_password,
+    verify_password,
+    verify_and_update_password,
+    hash_password_async,
+    verify_and_update_password_async
+)
+
+
+@pytest.fixture(autouse=True)
+def fast_rounds(monkeypatch):
+    """Use the minimum bcrypt cost so the tests stay fast."""
+    monkeypatch.setattr(
+        security,
+        "pwd_context",
+        CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5)
+    )
+
+
+def test_hash_and_verify():
+    """Test that a hashed password verifies and a wrong one doesn't."""
+    hashed = hash_password("secret123")
+
+    assert verify_password("secret123", hashed)
+    assert not verify_password("wrong", hashed)
+
+
+def test_long_password_is_truncated_consistently():
+    """Test that passwords over 72 bytes hash and verify on the same prefix."""
+    password = "ש" * 50  # 100 bytes in UTF-8
+    hashed = hash_password(password)
+
+    assert verify_password(password, hashed)
+
+
+def test_empty_password_rejected():
+    """Test that hashing an empty password raises."""
+    with pytest.raises(ValueError):
+        hash_password("")
+
+
+def test_no_rehash_at_current_cost():
+    """Test that a hash made at the configured cost is not replaced."""
+    hashed = hash_password("secret123")
+
+    valid, new_hash = verify_and_update_password("secret123", hashed)
+
+    assert valid
+    assert new_hash is None
+
+
+def test_rehash_when_cost_changes():
+    """Test that a hash made at an older cost is replaced on verification."""
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret123")
+
+    valid, new_hash = verify_and_update_password("secret123", old_hash)
+
+    assert valid
+    assert new_hash is not None
+    assert "$05$" in new_hash
+    assert verify_password("secret123", new_hash)
+
+
+def test_no_rehash_on_wrong_password():
+    """Test that a failed verification never produces a new hash."""
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret123")
+
+    assert verify_and_update_password("wrong", old_hash) == (False, None)
+
+
+def test_async_variants_run_on_pool():
+    """Test that the async helpers run bcrypt on the dedicated thread pool."""
+    threads = []
+    original = security.hash_password
+
+    def recording_hash(password):
+        threads.append(threading.current_thread().name)
+        return original(password)
+
+    async def run():
+        security.hash_password = recording_hash
+        try:
+            hashed = await hash_password_async("secret123")
+        finally:
+            security.hash_password = original
+        return hashed, await verify_and_update_password_async("secret123", hashed)
+
+    hashed, (valid, new_hash) = asyncio.run(run())
+
+    assert threads and threads[0].startswith("bcrypt")
+    assert valid
+    assert new_hash is None
@@ -0,0 +1,138 @@
+"""
+Unit tests for per-account sync coalescing (single-flight)
+Tests queued-request merging, rerun-once while running, and the no-Redis fallback.
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from redis.exceptions import ConnectionError as RedisConnectionError
+from backend.services.sync_coalescer import SyncCoalescer
+
+
+class FakeLock:
+    def __init__(self, redis, name):
+        self.redis = redis
+        self.name = name
+
+    async def acquire(self, token=None):
+        if self.name in self.redis.values:
+            return False
+        self.redis.values[self.name] = token
+        return True
+
+    async def release(self):
+        del self.redis.values[self.name]
+
+    async def reacquire(self):
+        return True
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio.Redis for SyncCoalescer."""
+
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def getdel(self, key):
+        return self.values.pop(key, None)
+
+    def lock(self, name, timeout=None, blocking=True):
+        return FakeLock(self, name)
+
+
+@pytest.fixture
+def coalescer():
+    return SyncCoalescer(ttl=60, redis=FakeRedis())
+
+
+@pytest.mark.asyncio
+async def test_requests_merge_while_queued(coalescer):
+    """Test that only the first of several requests schedules a run."""
+    outcomes = [await coalescer.request(1) for _ in range(5)]
+
+    assert outcomes == ["scheduled"] + ["merged"] * 4
+    assert await coalescer.request(2) == "scheduled"
+
+
+@pytest.mark.asyncio
+async def test_request_after_run_starts_schedules_again(coalescer):
+    """Test that a run clears the queued marker so later requests aren't lost."""
+    await coalescer.request(1)
+    await coalescer.run(1, AsyncMock(return_value="ok"))
+
+    assert await coalescer.request(1) == "scheduled"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_request_schedules_again(coalescer):
+    """Test that withdrawing a request that won't run clears the queued marker."""
+    await coalescer.request(1)
+    await coalescer.cancel(1)
+
+    assert await coalescer.request(1) == "scheduled"
+
+
+@pytest.mark.asyncio
+async def test_refreshed_request_stays_queued(coalescer):
+    """Test that refreshing a deferred request keeps new requests merging into it."""
+    await coalescer.request(1)
+    await coalescer.cancel(1)
+    await coalescer.refresh(1)
+
+    assert await coalescer.request(1) == "merged"
+
+
+@pytest.mark.asyncio
+async def test_overlapping_runs_rerun_once(coalescer):
+    """Test that runs started during a sync make it run exactly once more."""
+    started = asyncio.Event()
+    release = asyncio.Event()
+    calls = 0
+
+    async def sync():
+        nonlocal calls
+        calls += 1
+        started.set()
+        await release.wait()
+        return calls
+
+    first = asyncio.create_task(coalescer.run(1, sync))
+    await started.wait()
+
+    # Three more requests arrive mid-sync
+    overlapping = [await coalescer.run(1, sync) for _ in range(3)]
+    release.set()
+
+    assert overlapping == [None, None, None]
+    assert await first == 2
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_run_releases_lock_on_error(coalescer):
+    """Test that a failing sync doesn't leave the account locked."""
+    with pytest.raises(RuntimeError):
+        await coalescer.run(1, AsyncMock(side_effect=RuntimeError("gateway down")))
+
+    assert await coalescer.run(1, AsyncMock(return_value="ok")) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_falls_back_without_redis():
+    """Test that syncs still run when Redis is unreachable."""
+    redis = Mock()
+    redis.set = AsyncMock(side_effect=RedisConnectionError("refused"))
+    redis.lock.return_value.acquire = AsyncMock(side_effect=RedisConnectionError("refused"))
+    coalescer = SyncCoalescer(redis=redis)
+
+    assert await coalescer.request(1) == "scheduled"
+    assert await coalescer.run(1, AsyncMock(return_value="ok")) == "ok"
@@ -0,0 +1,223 @@
+"""
+Unit tests for the periodic sync scheduler
+Tests market-hours intervals, fleet spreading and per-gateway concurrency.
+"""
+import pytest
+from collections import Counter
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+from backend.services.sync_scheduler import (
+    market_session,
+    sync_interval,
+    due_slot,
+    due_accounts,
+    gateway_key,
+    TICK_SECONDS
+)
+from backend.tasks import worker
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("now,session", [
+    (utc(2024, 3, 13, 15, 0), "open"),       # Wed 11:00 New York
+    (utc(2024, 3, 13, 12, 0), "extended"),   # Wed 08:00 pre-market
+    (utc(2024, 3, 13, 21, 30), "extended"),  # Wed 17:30 after-hours
+    (utc(2024, 3, 14, 3, 0), "closed"),      # Wed 23:00 overnight
+    (utc(2024, 3, 16, 15, 0), "closed"),     # Saturday
+])
+def test_market_session(now, session):
+    """Test session detection in New York time (DST-aware)."""
+    assert market_session(now) == session
+
+
+def test_interval_follows_market_hours():
+    """Test that syncs are frequent while open and rare overnight."""
+    assert sync_interval(utc(2024, 3, 13, 15, 0)) < sync_interval(utc(2024, 3, 14, 3, 0))
+
+
+def test_each_account_due_once_per_interval():
+    """Test that walking the ticks of one interval schedules every account exactly once."""
+    interval = 300
+    start = 1_700_000_100
+    counts = Counter()
+    for tick_at in range(start, start + interval, TICK_SECONDS):
+        for account_id in range(1, 501):
+            if due_slot(account_id, interval, tick_at) is not None:
+                counts[account_id] += 1
+
+    assert len(counts) == 500
+    assert set(counts.values()) == {1}
+
+
+def test_fleet_is_spread_across_ticks():
+    """Test that 500 accounts don't all land on the same tick."""
+    interval = 300
+    start = 1_700_000_100
+    per_tick = [
+        sum(due_slot(a, interval, t) is not None for a in range(1, 501))
+        for t in range(start, start + interval, TICK_SECONDS)
+    ]
+
+    assert max(per_tick) < 150  # ~100 per tick when evenly spread
+
+
+def test_due_accounts_only_active():
+    """Test that due_accounts returns (id, user_id, slot) for due accounts from the query."""
+    db = Mock()
+    db.execute.return_value.all.return_value = [(a, 7) for a in range(1, 101)]
+
+    due = due_accounts(db, utc(2024, 3, 13, 15, 0, 30))
+
+    assert 0 < len(due) < 100
+    assert all(user_id == 7 for _, user_id, _ in due)
+    assert "status" in str(db.execute.call_args.args[0])
+
+
+def test_gateway_key_defaults():
+    """Test that accounts without host/port share the default gateway."""
+    assert gateway_key(None, None) == gateway_key("127.0.0.1", 7497)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakeRedis:
+    """Just enough of ArqRedis for the gateway leases and re-enqueueing."""
+
+    def __init__(self):
+        self.zsets = {}
+        self.enqueued = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def zremrangebyscore(self, key, low, high):
+        zset = self.zsets.setdefault(key, {})
+        for member in [m for m, score in zset.items() if score <= high]:
+            del zset[member]
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    async def zrem(self, key, member):
+        self.zsets.get(key, {}).pop(member, None)
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def enqueue_job(self, function, *args, **kwargs):
+        self.enqueued.append((function, args, kwargs))
+
+
+@pytest.fixture
+def coalescer(monkeypatch):
+    """Stand-in for the Redis-backed sync_coalescer singleton."""
+    fake = Mock(request=AsyncMock(return_value="scheduled"), cancel=AsyncMock(), refresh=AsyncMock())
+    monkeypatch.setattr("backend.services.sync_coalescer.sync_coalescer", fake)
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_gateway_slots_are_capped(monkeypatch):
+    """Test that a gateway admits at most SYNC_GATEWAY_MAX_CONCURRENCY syncs."""
+    monkeypatch.setattr(worker.settings, "SYNC_GATEWAY_MAX_CONCURRENCY", 2)
+    redis = FakeRedis()
+
+    results = [await worker.acquire_gateway_slot(redis, "gw:1", f"job{i}") for i in range(3)]
+    assert results == [True, True, False]
+
+    await worker.release_gateway_slot(redis, "gw:1", "job0")
+    assert await worker.acquire_gateway_slot(redis, "gw:1", "job3")
+    assert await worker.acquire_gateway_slot(redis, "gw:2", "job4")
+
+
+@pytest.mark.asyncio
+async def test_leaked_slot_expires_while_gateway_busy(monkeypatch):
+    """Test that a crashed worker's slot frees itself even if other syncs keep the gateway busy."""
+    monkeypatch.setattr(worker.settings, "SYNC_GATEWAY_MAX_CONCURRENCY", 1)
+    redis = FakeRedis()
+    assert await worker.acquire_gateway_slot(redis, "gw:1", "crashed")
+
+    now = worker.time.time()
+    monkeypatch.setattr(worker.time, "time", lambda: now + worker.WorkerSettings.job_timeout + 1)
+
+    assert await worker.acquire_gateway_slot(redis, "gw:1", "next")
+
+
+@pytest.mark.asyncio
+async def test_sync_task_deferred_when_gateway_busy(monkeypatch, coalescer):
+    """Test that a job on a saturated gateway is re-enqueued, not run and not retried."""
+    monkeypatch.setattr(worker.settings, "SYNC_GATEWAY_MAX_CONCURRENCY", 0)
+    monkeypatch.setattr(worker, "_load_gateway", lambda _id: "gw:1")
+    redis = FakeRedis()
+
+    with patch("backend.services.ibkr_sync.sync_broker_data_coalesced") as sync:
+        result = await worker.sync_broker_task({"redis": redis, "job_id": "j1"}, 1, 1, deferrals=3)
+
+    sync.assert_not_called()
+    assert result["status"] == "deferred"
+    function, args, kwargs = redis.enqueued[0]
+    assert (function, args, kwargs["deferrals"]) == ("sync_broker_task", (1, 1), 4)
+    assert redis.zsets["sync:gateway:gw:1"] == {}
+    coalescer.refresh.assert_awaited_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_sync_task_gives_up_after_max_deferrals(monkeypatch, coalescer):
+    """Test that the deferral budget is bounded."""
+    monkeypatch.setattr(worker.settings, "SYNC_GATEWAY_MAX_CONCURRENCY", 0)
+    monkeypatch.setattr(worker.settings, "SYNC_GATEWAY_MAX_DEFERRALS", 2)
+    monkeypatch.setattr(worker, "_load_gateway", lambda _id: "gw:1")
+    redis = FakeRedis()
+
+    result = await worker.sync_broker_task({"redis": redis, "job_id": "j1"}, 1, 1, deferrals=2)
+
+    assert result["status"] == "skipped"
+    assert redis.enqueued == []
+    coalescer.cancel.assert_awaited_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_sync_task_for_missing_account_clears_queued_marker(monkeypatch, coalescer):
+    """Test that a skipped sync doesn't keep later requests merging into it."""
+    monkeypatch.setattr(worker, "_load_gateway", lambda _id: None)
+
+    result = await worker.sync_broker_task({"redis": FakeRedis(), "job_id": "j1"}, 1, 1)
+
+    assert result["status"] == "skipped"
+    coalescer.cancel.assert_awaited_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_schedule_syncs_clears_marker_of_deduplicated_job(monkeypatch, coalescer):
+    """Test that a slot ARQ already has (enqueue_job returns None) isn't counted or left marked queued."""
+    monkeypatch.setattr("backend.db.get_worker_sessionmaker", lambda: MagicMock())
+    monkeypatch.setattr("backend.services.sync_scheduler.due_accounts", lambda db, now: [(1, 1, 7)])
+    redis = FakeRedis()
+
+    result = await worker.schedule_syncs({"redis": redis})
+
+    assert result == {"due": 1, "enqueued": 0}
+    assert redis.enqueued[0][2]["_job_id"] == "scheduled-sync:1:7"
+    coalescer.cancel.assert_awaited_once_with(1)
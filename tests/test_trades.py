@@ -0,0 +1,94 @@
+"""
+Unit tests for the trades listing (keyset pagination, filters, count estimate)
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from backend.db import Base
+from backend.models.trade import Trade
+from backend.services.trades import trades_filter, trades_page_query, estimate_count
+from backend.utils.cursor import encode_cursor, decode_cursor
+import backend.models  # noqa: F401  (register all tables)
+
+T0 = datetime(2024, 3, 13, 14, 30)
+
+
+def make_trades():
+    # Pairs of fills share a timestamp, so the id tie-breaker matters
+    return [
+        Trade(id=i + 1, user_id=1, broker_account_id=1 + i % 2, exec_id=f"e{i}", symbol="AAPL" if i % 3 else "MSFT",
+              side="BOT" if i % 2 else "SLD", qty=1.0, price=100.0, trade_time=T0 + timedelta(minutes=i // 2))
+        for i in range(25)
+    ]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all(make_trades())
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def walk(db, filters, descending=True, limit=4):
+    """Follow cursors through every page, the way a client would."""
+    seen, after = [], None
+    while True:
+        page = db.scalars(trades_page_query(filters, after, descending, limit)).all()
+        seen += [t.id for t in page]
+        if len(page) < limit:
+            return seen
+        trade_time, trade_id = decode_cursor(encode_cursor(page[-1].trade_time, page[-1].id), 2)
+        after = (datetime.fromisoformat(trade_time), trade_id)
+
+
+def test_pages_cover_every_trade_once_newest_first(db):
+    """Test that walking the cursor returns each trade once, in (trade_time, id) order."""
+    assert walk(db, trades_filter(1)) == list(range(25, 0, -1))
+
+
+def test_ascending_pages(db):
+    """Test paging from the oldest trade."""
+    assert walk(db, trades_filter(1), descending=False) == list(range(1, 26))
+
+
+def test_filters_combine(db):
+    """Test account, symbol, side and time-range filters (BUY matches IB's BOT)."""
+    filters = trades_filter(1, broker_account_id=2, symbol="AAPL", side="BUY",
+                            start=T0 + timedelta(minutes=2), end=T0 + timedelta(minutes=10))
+
+    trades = db.scalars(trades_page_query(filters, limit=100)).all()
+
+    assert [t.id for t in trades] == [20, 18, 14, 12, 8, 6]
+    assert all(t.side == "BOT" and t.broker_account_id == 2 for t in trades)
+
+
+def test_cursor_is_a_row_value_comparison():
+    """Test that a deep page is a range condition on the index key, not an OFFSET."""
+    query = trades_page_query(trades_filter(1), after=(T0, 42), limit=50)
+    sql = str(query.compile(dialect=postgresql.dialect()))
+
+    assert "(trades.trade_time, trades.id) < (" in sql
+    assert "TIMESTAMP WITH TIME ZONE" in sql
+    assert "OFFSET" not in sql
+    assert sql.strip().endswith("LIMIT %(param_3)s::INTEGER")
+
+
+@pytest.mark.asyncio
+async def test_count_outside_postgres_is_exact():
+    """Test the count fallback used when there is no planner estimate."""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as db:
+        db.add_all(make_trades())
+        await db.commit()
+        assert await estimate_count(db, trades_filter(1, symbol="MSFT")) == 9
+    await engine.dispose()